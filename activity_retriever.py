@@ -7,7 +7,7 @@ from datetime import datetime, timedelta
 import sqlite3
 import re
 from collections import defaultdict
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable
 
 import chromadb
 from chromadb.utils import embedding_functions
@@ -19,7 +19,7 @@ LOAD_EMBEDDINGS = os.getenv('LOAD_EMBEDDINGS', 'true').lower() == 'true'
 if LOAD_EMBEDDINGS:
     try:
         # 优先使用自定义嵌入模块（更稳定）
-        from custom_embeddings import init_embeddings, search_similar, add_documents, clear_collection, get_collection_count, get_all_documents
+        from custom_embeddings import init_embeddings, search_similar, add_documents, clear_collection, get_collection_count, get_document_ids
         USE_LANGCHAIN = False
         logging.info("使用自定义嵌入模块")
     except ImportError:
@@ -51,6 +51,7 @@ except ImportError:
 
 DATABASE_FILE = os.path.join(SCREENSHOT_DIR, "activity_log.db")
 COLLECTION_NAME = "screen_activity"
+EMBEDDING_MODEL_NAME = "Alibaba-NLP/gte-multilingual-base"
 
 # --- Global Variables (used for initialization) ---
 embeddings = None
@@ -63,7 +64,7 @@ if LOAD_EMBEDDINGS:
         if USE_LANGCHAIN:
             # 使用标准LangChain（Python 3.12+）
             embeddings = HuggingFaceEmbeddings(
-                model_name="Alibaba-NLP/gte-multilingual-base",
+                model_name=EMBEDDING_MODEL_NAME,
                 model_kwargs={'device': 'cpu', 'trust_remote_code': True},
                 encode_kwargs={'normalize_embeddings': True}
             )
@@ -96,6 +97,21 @@ if LOAD_EMBEDDINGS:
 else:
     logging.info("跳过嵌入模型加载（LOAD_EMBEDDINGS=false）")
 
+# 截图可能以 PNG / WebP / JPEG 保存（见 capture.storage_format）
+SCREENSHOT_EXTENSIONS = ('.png', '.webp', '.jpg', '.jpeg')
+
+def existing_screenshots(paths) -> List[str]:
+    """过滤出仍存在于磁盘上的截图路径（去重并保持顺序，任意存储格式均可）"""
+    result = []
+    for path in dict.fromkeys(p for p in paths if p):
+        if path.lower().endswith(SCREENSHOT_EXTENSIONS) and os.path.exists(path):
+            result.append(path)
+    return result
+
+def to_epoch_millis(dt: datetime) -> int:
+    """本地时间 datetime -> activity_log.ts 使用的毫秒时间戳"""
+    return int(dt.timestamp() * 1000)
+
 def create_db_connection():
     """Creates a connection to the SQLite database."""
     conn = None
@@ -107,14 +123,214 @@ def create_db_connection():
         logging.error(f"连接SQLite数据库失败 ({DATABASE_FILE}): {e}")
     return conn
 
-def load_and_index_activity_data() -> int:
-    """Loads and indexes data from SQLite to ChromaDB on startup."""
+# --- 增量索引 ---
+# 游标保存在 activity_log.db 的 index_state 表中（见 screen_capture 的迁移 v7），每次只读取游标之后的记录
+INDEX_PAGE_SIZE = 200        # 每页从SQLite读取并写入ChromaDB的记录数
+INDEX_FORMAT_VERSION = 2     # 文档文本/元数据格式版本，变化后需要重建索引
+OCR_JOB_MAX_ATTEMPTS = 3     # 与 screen_capture.MAX_OCR_ATTEMPTS 一致
+INDEX_MAX_ATTEMPTS = 5       # 单条记录编码/写入失败的最多重试次数（每轮索引重试一次），超过后留在 index_pending 中不再重试
+INDEX_RECORD_COLUMNS = "a.id, a.timestamp, a.ts, a.ocr_text, a.click_text, a.app_name, a.window_title, a.screenshot_path"
+# OCR尚未完成（异步识别中，或在 ocr_jobs 中等待补做）的记录暂不索引，完成后再补
+INDEX_PENDING_SQL = (
+    "((a.record_type = 'screen_content' AND a.ocr_text IS NULL) OR EXISTS "
+    f"(SELECT 1 FROM ocr_jobs j WHERE j.record_id = a.id AND j.attempts < {OCR_JOB_MAX_ATTEMPTS}))"
+)
+FORCE_REINDEX_DONE = False
+
+def index_version() -> str:
+    """索引版本：格式版本 + 嵌入模型，二者任一变化时已有向量不再可用"""
+    return f"{INDEX_FORMAT_VERSION}:{EMBEDDING_MODEL_NAME}"
+
+def build_index_document(record: dict) -> tuple:
+    """activity_log 记录 -> (文档文本, 元数据, 文档ID)"""
+    doc_text = f"应用: {record.get('app_name')} | 窗口: {record.get('window_title')} | 内容: {record.get('ocr_text')}"
+    click_text = record.pop('click_text', None)
+    if click_text:
+        doc_text += f" | 点击处: {click_text}"
+
+    ts = record.pop('ts', None)
+    metadata = {k: str(v) for k, v in record.items() if v is not None}
+    if ts is not None:
+        metadata['timestamp'] = ts / 1000.0
+    else:
+        logging.warning(f"Could not parse timestamp for record {record.get('id')}.")
+        metadata.pop('timestamp', None)
+    return doc_text, metadata, f"activity_{record['id']}"
+
+def add_index_documents(documents: list, metadatas: list, ids: list) -> List[str]:
+    """写入ChromaDB（ID已存在时覆盖），返回未能写入的文档ID（编码或写入失败的单个文档会被跳过）"""
+    if USE_LANGCHAIN:
+        collection.upsert(documents=documents, metadatas=metadatas, ids=ids)
+        return []
+    if add_documents(documents=documents, metadatas=metadatas, ids=ids) == len(documents):
+        return []
+    written = set(collection.get(ids=ids, include=[])['ids'])
+    return [doc_id for doc_id in ids if doc_id not in written]
+
+def get_index_ids() -> List[str]:
+    if USE_LANGCHAIN:
+        return collection.get(include=[])['ids']
+    return get_document_ids()
+
+def clear_index_collection():
+    if USE_LANGCHAIN:
+        existing_ids = collection.get(include=[])['ids']
+        if existing_ids:
+            collection.delete(ids=existing_ids)
+    else:
+        clear_collection()
+
+def reset_index_cursor(conn, last_id: int = 0):
+    """把游标重置到 last_id 并清空待补索引的记录"""
+    with conn:
+        conn.execute("DELETE FROM index_pending")
+        conn.execute(
+            "INSERT OR REPLACE INTO index_state (name, last_id, version, updated_ts) VALUES (?, ?, ?, ?)",
+            (COLLECTION_NAME, last_id, index_version(), to_epoch_millis(datetime.now())),
+        )
+
+def bootstrap_index_cursor(conn):
+    """
+    首次使用游标：集合中已有旧版本全量扫描写入的文档时，把游标设为其中最大的记录ID，
+    游标之前尚未索引的记录放入 index_pending 补做，避免重新计算全部历史数据的向量。
+    """
+    existing_ids = set(get_index_ids())
+    last_id = max((int(doc_id.rsplit('_', 1)[1]) for doc_id in existing_ids
+                   if doc_id.rsplit('_', 1)[-1].isdigit()), default=0)
+    reset_index_cursor(conn, last_id)
+    if not last_id:
+        return
+    rows = conn.execute(
+        f"SELECT a.id FROM activity_log a WHERE a.id <= ? AND ((a.ocr_text IS NOT NULL AND a.ocr_text != '') OR {INDEX_PENDING_SQL})",
+        (last_id,),
+    ).fetchall()
+    missing = [(row[0],) for row in rows if f"activity_{row[0]}" not in existing_ids]
+    with conn:
+        conn.executemany("INSERT OR IGNORE INTO index_pending (record_id) VALUES (?)", missing)
+    logging.info(f"索引游标已初始化到记录 {last_id}，{len(missing)} 条较早的记录待补索引")
+
+def read_index_cursor(conn) -> int:
+    """读取游标；不存在或索引版本已变化时先初始化/重建，返回已索引到的最大记录ID"""
+    row = conn.execute("SELECT last_id, version FROM index_state WHERE name = ?", (COLLECTION_NAME,)).fetchone()
+    if row is None:
+        bootstrap_index_cursor(conn)
+    elif row['version'] != index_version():
+        logging.info(f"索引版本已变化（{row['version']} -> {index_version()}），正在重建向量索引...")
+        clear_index_collection()
+        reset_index_cursor(conn)
+    else:
+        return row['last_id']
+    return conn.execute("SELECT last_id FROM index_state WHERE name = ?", (COLLECTION_NAME,)).fetchone()[0]
+
+def index_records(rows) -> tuple:
+    """把一页记录写入ChromaDB；返回 (已索引数, 仍在OCR的记录ID列表, 写入失败的记录ID列表)"""
+    documents, metadatas, ids, pending = [], [], [], []
+    for row in rows:
+        record = dict(row)
+        if record.pop('pending'):
+            pending.append(record['id'])
+            continue
+        if not record.get('ocr_text'):
+            continue
+        doc_text, metadata, doc_id = build_index_document(record)
+        documents.append(doc_text)
+        metadatas.append(metadata)
+        ids.append(doc_id)
+    failed = [int(doc_id.rsplit('_', 1)[1]) for doc_id in add_index_documents(documents, metadatas, ids)] if documents else []
+    return len(documents) - len(failed), pending, failed
+
+def record_index_failures(conn, failed: List[int], error: str = "编码或写入向量索引失败"):
+    """把写入失败的记录登记到 index_pending（重试次数+1），游标照常推进，由 index_pending_records 重试"""
+    if not failed:
+        return
+    with conn:
+        conn.executemany(
+            "INSERT INTO index_pending (record_id, attempts, last_error) VALUES (?, 1, ?) "
+            "ON CONFLICT(record_id) DO UPDATE SET attempts = attempts + 1, last_error = excluded.last_error",
+            [(record_id, error) for record_id in failed],
+        )
+    logging.warning(f"{len(failed)} 条记录写入向量索引失败，已登记重试（最多 {INDEX_MAX_ATTEMPTS} 次）: {failed[:10]}")
+
+def index_pending_records(conn) -> int:
+    """补索引：游标之前OCR尚未完成的记录，完成后写入ChromaDB并移出 index_pending"""
+    with conn:
+        conn.execute("DELETE FROM index_pending WHERE record_id NOT IN (SELECT id FROM activity_log)")
+    rows = conn.execute(
+        f"SELECT {INDEX_RECORD_COLUMNS}, {INDEX_PENDING_SQL} AS pending FROM index_pending p "
+        "JOIN activity_log a ON a.id = p.record_id WHERE p.attempts < ? ORDER BY a.id",
+        (INDEX_MAX_ATTEMPTS,),
+    ).fetchall()
+    ready = [row for row in rows if not row['pending']]
+    if not ready:
+        return 0
+    count, _, failed = index_records(ready)
+    failed_set = set(failed)
+    with conn:
+        conn.executemany("DELETE FROM index_pending WHERE record_id = ?",
+                         [(row['id'],) for row in ready if row['id'] not in failed_set])
+    record_index_failures(conn, failed)
+    return count
+
+def index_new_records(conn, last_id: int, progress: Optional[Callable[[int, int], None]] = None) -> int:
+    """按页读取游标之后的记录；每页写入ChromaDB成功后，在同一事务中推进游标并登记仍在OCR的记录。
+    progress(已处理记录数, 本轮待处理记录数) 在每页完成后调用"""
+    total = 0
+    done = 0
+    backlog = conn.execute("SELECT COUNT(*) FROM activity_log WHERE id > ?", (last_id,)).fetchone()[0]
+    if progress and backlog:
+        progress(0, backlog)
+    while True:
+        rows = conn.execute(
+            f"SELECT {INDEX_RECORD_COLUMNS}, {INDEX_PENDING_SQL} AS pending FROM activity_log a "
+            "WHERE a.id > ? ORDER BY a.id LIMIT ?",
+            (last_id, INDEX_PAGE_SIZE),
+        ).fetchall()
+        if not rows:
+            return total
+        count, pending, failed = index_records(rows)
+        last_id = rows[-1]['id']
+        # 写入失败的记录登记重试后游标照常推进，避免一条始终失败的记录让索引永远停在这一页
+        record_index_failures(conn, failed)
+        with conn:
+            conn.executemany("INSERT OR IGNORE INTO index_pending (record_id) VALUES (?)", [(i,) for i in pending])
+            conn.execute(
+                "UPDATE index_state SET last_id = ?, updated_ts = ? WHERE name = ?",
+                (last_id, to_epoch_millis(datetime.now()), COLLECTION_NAME),
+            )
+        total += count
+        done += len(rows)
+        if progress:
+            progress(done, max(backlog, done))
+        if len(rows) < INDEX_PAGE_SIZE:
+            return total
+
+def load_and_index_activity_data(progress: Optional[Callable[[int, int], None]] = None) -> int:
+    """增量索引：只把游标之后的新记录（以及此前OCR未完成、现已完成的记录）写入ChromaDB，返回新索引的记录数。
+    耗时较长（需要计算向量），GUI中应在后台线程调用；progress 见 index_new_records()"""
+    global FORCE_REINDEX_DONE
     # 检查是否跳过数据索引（用于快速启动）
     SKIP_INDEXING = os.getenv('SKIP_INDEXING', 'false').lower() == 'true'
     if SKIP_INDEXING:
         logging.info("⏩ 跳过数据索引（SKIP_INDEXING=true），使用现有数据")
         return 0
-    
+
+    # 顺带把新记录写入短关键词索引，检索时不必再临时补做
+    conn = create_db_connection()
+    if conn:
+        try:
+            if _has_short_term_index(conn.cursor()):
+                sync_short_term_index(conn)
+        except sqlite3.Error as e:
+            logging.warning(f"更新短关键词索引失败: {e}")
+        finally:
+            conn.close()
+
+    # 强制重新索引的情况（只在本进程第一次调用时执行）
+    FORCE_REINDEX = os.getenv('FORCE_REINDEX', 'false').lower() == 'true'
+    if FORCE_REINDEX and not FORCE_REINDEX_DONE:
+        FORCE_REINDEX_DONE = True
+        return rebuild_activity_index(progress)
+
     if not LOAD_EMBEDDINGS or collection is None or embeddings is None:
         logging.error("ChromaDB collection or embeddings not initialized. Cannot index data.")
         return 0
@@ -125,77 +341,35 @@ def load_and_index_activity_data() -> int:
 
     new_records_count = 0
     try:
-        # 检查现有数据
-        if USE_LANGCHAIN:
-            existing_count = len(collection.get(include=[])['ids'])
-            existing_ids_set = set(collection.get(include=[])['ids'])
-        else:
-            existing_count = get_collection_count()
-            existing_data = get_all_documents()
-            existing_ids_set = set(doc.get('id', '') for doc in existing_data) if existing_data else set()
-        
-        # 强制重新索引的情况
-        FORCE_REINDEX = os.getenv('FORCE_REINDEX', 'false').lower() == 'true'
-        if FORCE_REINDEX:
-            logging.info("🔄 强制重新索引所有数据...")
-            
-            if USE_LANGCHAIN:
-                existing_ids = collection.get(include=[])['ids']
-                if existing_ids:
-                    collection.delete(ids=existing_ids)
-            else:
-                clear_collection()
-            existing_ids_set = set()
-
-        # 从SQLite加载所有记录
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, timestamp, ocr_text, app_name, window_title, screenshot_path FROM activity_log WHERE ocr_text IS NOT NULL AND ocr_text != ''")
-        records = cursor.fetchall()
-
-        if not records:
-            return 0
+        last_id = read_index_cursor(conn)
+        new_records_count = index_pending_records(conn)
+        new_records_count += index_new_records(conn, last_id, progress)
+    except Exception as e:
+        logging.error(f"Error during data indexing: {e}", exc_info=True)
+    finally:
+        conn.close()
 
-        # 找出新记录
-        new_documents = []
-        new_metadatas = []
-        new_ids = []
-        
-        for row in records:
-            record = dict(row)
-            record_id = f"activity_{record['id']}"
-            
-            # 只处理新记录
-            if record_id not in existing_ids_set:
-                doc_text = f"应用: {record.get('app_name')} | 窗口: {record.get('window_title')} | 内容: {record.get('ocr_text')}"
-                new_documents.append(doc_text)
-
-                metadata = {k: str(v) for k, v in record.items() if v is not None}
-                try:
-                    if 'timestamp' in metadata:
-                        metadata['timestamp'] = datetime.fromisoformat(record['timestamp']).timestamp()
-                except (TypeError, ValueError):
-                    logging.warning(f"Could not parse timestamp for record {record.get('id')}.")
-                    if 'timestamp' in metadata:
-                        del metadata['timestamp']
-                
-                new_metadatas.append(metadata)
-                new_ids.append(record_id)
+    return new_records_count
 
-        # 只有新记录时才添加到ChromaDB
-        if new_documents:
-            if USE_LANGCHAIN:
-                collection.add(documents=new_documents, metadatas=new_metadatas, ids=new_ids)
-            else:
-                add_documents(documents=new_documents, metadatas=new_metadatas, ids=new_ids)
-            new_records_count = len(new_documents)
+def rebuild_activity_index(progress: Optional[Callable[[int, int], None]] = None) -> int:
+    """显式全量重建：清空向量集合、把游标重置到开头，再重新索引全部记录"""
+    if not LOAD_EMBEDDINGS or collection is None or embeddings is None:
+        logging.error("ChromaDB collection or embeddings not initialized. Cannot index data.")
+        return 0
 
+    conn = create_db_connection()
+    if not conn:
+        return 0
+    try:
+        logging.info("🔄 强制重新索引所有数据...")
+        clear_index_collection()
+        reset_index_cursor(conn)
     except Exception as e:
-        logging.error(f"Error during data indexing: {e}", exc_info=True)
+        logging.error(f"重建向量索引失败: {e}", exc_info=True)
+        return 0
     finally:
-        if conn:
-            conn.close()
-    
-    return new_records_count
+        conn.close()
+    return load_and_index_activity_data(progress)
 
 def parse_time_range_from_query(query_text: str) -> tuple[datetime, datetime]:
     """Parses a time range from the user's query."""
@@ -258,6 +432,9 @@ def parse_time_range_from_query(query_text: str) -> tuple[datetime, datetime]:
     return start_time, end_time
 
 # --- Main Class for Activity Retrieval ---
+# 询问访问过哪些网站的问题，直接查询 urls/domains 表补充到上下文中
+SITE_QUERY_PATTERN = re.compile(r'网站|网页|网址|域名|链接|浏览|URL|website|site', re.IGNORECASE)
+
 class ActivityRetriever:
     def __init__(self, llm_service: LLMService):
         self.llm_service = llm_service
@@ -317,7 +494,7 @@ class ActivityRetriever:
         if not docs:
             return f"在时间范围 {start_time_dt.strftime('%Y-%m-%d %H:%M')} 到 {end_time_dt.strftime('%Y-%m-%d %H:%M')} 内没有找到相关的活动记录。", []
 
-        screenshots = [doc.metadata.get('screenshot_path') for doc in docs if doc.metadata.get('screenshot_path')]
+        screenshots = existing_screenshots(doc.metadata.get('screenshot_path') for doc in docs)
         
         context_parts = []
         for doc in docs:
@@ -332,6 +509,16 @@ class ActivityRetriever:
 
         context = "\n\n".join(context_parts)
 
+        if SITE_QUERY_PATTERN.search(user_query):
+            sites = (await get_visited_sites_summary(start_time_dt, end_time_dt)).get("sites") or []
+            if sites:
+                site_lines = [
+                    f"- {site['domain']}: {site['visits']} 次记录 "
+                    f"({site['first_seen'].strftime('%m-%d %H:%M')} ~ {site['last_seen'].strftime('%m-%d %H:%M')})"
+                    for site in sites
+                ]
+                context = "### 访问过的网站（按域名统计）\n" + "\n".join(site_lines) + "\n\n" + context
+
         if not context.strip():
             return f"在时间范围 {start_time_dt.strftime('%Y-%m-%d %H:%M')} 到 {end_time_dt.strftime('%Y-%m-%d %H:%M')} 内找到了活动，但没有识别出的文本内容。", screenshots
 
@@ -399,42 +586,254 @@ class ActivityRetriever:
         return "\n".join(summary_parts)
 
 # --- Standalone Functions for API Endpoints ---
+def resolve_referenced_ocr_text(cursor, records: list) -> None:
+    """为"画面未变化"心跳记录补全其指向的原始记录的OCR文本（原地修改）"""
+    ref_ids = {r['ref_id'] for r in records if r.get('ref_id') and not r.get('ocr_text')}
+    if not ref_ids:
+        return
+    placeholders = ', '.join('?' * len(ref_ids))
+    cursor.execute(f"SELECT id, ocr_text FROM activity_log WHERE id IN ({placeholders})", list(ref_ids))
+    texts = {row['id']: row['ocr_text'] for row in cursor.fetchall()}
+    for record in records:
+        if record.get('ref_id') in texts and not record.get('ocr_text'):
+            record['ocr_text'] = texts[record['ref_id']] or ''
+
 def get_all_activity_records(limit: int = 50) -> list:
     """Retrieves all activity records from the SQLite database."""
     conn = create_db_connection()
     if not conn: return []
     try:
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM activity_log ORDER BY timestamp DESC LIMIT ?", (limit,))
-        return [dict(row) for row in cursor.fetchall()]
+        cursor.execute("SELECT * FROM activity_log ORDER BY ts DESC LIMIT ?", (limit,))
+        records = [dict(row) for row in cursor.fetchall()]
+        resolve_referenced_ocr_text(cursor, records)
+        return records
     finally:
         if conn: conn.close()
 
+# 关键词高亮标记（用于 snippet）
+HIGHLIGHT_MARKERS = ('【', '】')
+
+def _fts_uses_trigram(cursor) -> bool:
+    cursor.execute("SELECT sql FROM sqlite_master WHERE name = 'activity_fts'")
+    row = cursor.fetchone()
+    return bool(row and 'trigram' in (row[0] or '').lower())
+
+def _like_snippet(text: str, terms: List[str], width: int = 40) -> str:
+    """为LIKE检索结果生成带高亮的片段"""
+    lowered = text.lower()
+    position = min((lowered.find(t.lower()) for t in terms if t.lower() in lowered), default=0)
+    start = max(0, position - width)
+    fragment = text[start:position + width * 2]
+    for term in terms:
+        fragment = re.sub(re.escape(term), lambda m: f"{HIGHLIGHT_MARKERS[0]}{m.group(0)}{HIGHLIGHT_MARKERS[1]}", fragment, flags=re.IGNORECASE)
+    return ('…' if start > 0 else '') + fragment + ('…' if position + width * 2 < len(text) else '')
+
+# --- 短关键词索引 ---
+# trigram 只能匹配3个字符及以上的子串；1~2个字的关键词（多数中文词）由 activity_short_fts 检索（见 screen_capture 的迁移 v8）
+CJK_CHARS = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'  # 假名、汉字、韩文
+CJK_RUN_PATTERN = re.compile(f'[{CJK_CHARS}]+')
+SHORT_QUERY_TOKEN_PATTERN = re.compile(f'[{CJK_CHARS}]{{1,2}}|[^\\s{CJK_CHARS}]+')
+SHORT_INDEX_BATCH = 500           # 每个事务展开并写入的记录数
+SHORT_INDEX_SEARCH_SYNC = 2000    # 检索前最多补做的记录数；升级后的历史数据由后台索引线程补齐，不阻塞检索
+KEYWORD_LIKE_FALLBACK_DAYS = 30   # 没有可用索引只能 LIKE 扫描时，未指定时间范围则只搜索最近这些天
+
+def expand_short_terms(text: str) -> str:
+    """把中日韩文字串展开为按位置交替的 单字、相邻二字词（"数据库" -> "数 数据 据 据库 库"），其它文字由 unicode61 按词切分。
+    单字紧跟在前后文字之后，所以 "A股" 这类中英混合的短词也能用短语 "A 股" 匹配"""
+    def expand(match):
+        run = match.group(0)
+        tokens = []
+        for i, char in enumerate(run):
+            tokens.append(char)
+            if i + 1 < len(run):
+                tokens.append(run[i:i + 2])
+        return f" {' '.join(tokens)} "
+    return CJK_RUN_PATTERN.sub(expand, text)
+
+def short_term_query(term: str) -> Optional[str]:
+    """短关键词的FTS5查询：中日韩文字按单字/二字词匹配，其它文字按词前缀匹配；无法构成查询时返回None"""
+    tokens = SHORT_QUERY_TOKEN_PATTERN.findall(term)
+    if not tokens:
+        return None
+    phrase = '"' + ' '.join(tokens).replace('"', '""') + '"'
+    return phrase if CJK_RUN_PATTERN.fullmatch(tokens[-1]) else phrase + '*'
+
+def _has_short_term_index(cursor) -> bool:
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'activity_short_fts'")
+    return cursor.fetchone() is not None
+
+def sync_short_term_index(conn, max_records: Optional[int] = None) -> int:
+    """把 activity_short_pending 中登记的新增/修改/删除记录展开后写入 activity_short_fts，返回处理的记录数
+    （max_records 为None时处理全部）。读取记录和删除登记在同一个写事务中，避免期间回填的OCR文本被漏掉"""
+    total = 0
+    while max_records is None or total < max_records:
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            ids = [row[0] for row in conn.execute(
+                "SELECT id FROM activity_short_pending ORDER BY id LIMIT ?", (SHORT_INDEX_BATCH,))]
+            if not ids:
+                conn.rollback()
+                break
+            placeholders = ','.join('?' * len(ids))
+            rows = conn.execute(
+                f"SELECT id, window_title, ocr_text FROM activity_log WHERE id IN ({placeholders})", ids
+            ).fetchall()
+            conn.execute(f"DELETE FROM activity_short_fts WHERE rowid IN ({placeholders})", ids)
+            conn.executemany(
+                "INSERT INTO activity_short_fts(rowid, terms) VALUES (?, ?)",
+                [(row[0], expand_short_terms(f"{row[1] or ''}\n{row[2] or ''}")) for row in rows if row[1] or row[2]]
+            )
+            conn.execute(f"DELETE FROM activity_short_pending WHERE id IN ({placeholders})", ids)
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        total += len(ids)
+    if total:
+        logging.info(f"短关键词索引已更新 {total} 条记录")
+    return total
+
+def search_activity_keyword(keyword: str, start_time_dt: Optional[datetime] = None,
+                            end_time_dt: Optional[datetime] = None, limit: int = 50) -> list:
+    """关键词全文检索OCR文本和窗口标题（SQLite FTS5，不加载嵌入模型）。
+    多个空格分隔的关键词需同时出现；结果按时间倒序，每条记录附带高亮片段 'snippet'。
+    3个字符及以上的关键词按子串匹配（trigram）；更短的中日韩关键词按单字/二字词、其它短关键词按词前缀匹配（activity_short_fts）。"""
+    terms = [t for t in keyword.split() if t]
+    if not terms:
+        return []
+    conn = create_db_connection()
+    if not conn: return []
+    start_ms = to_epoch_millis(start_time_dt) if start_time_dt else 0
+    end_ms = to_epoch_millis(end_time_dt) if end_time_dt else 2 ** 62
+    try:
+        cursor = conn.cursor()
+        trigram = _fts_uses_trigram(cursor)
+        fts_terms = [t for t in terms if trigram and len(t) >= 3]
+        short_terms = [t for t in terms if not (trigram and len(t) >= 3)]
+        fts_match = ' '.join('"' + t.replace('"', '""') + '"' for t in fts_terms)
+        if not short_terms:
+            cursor.execute(
+                f"""SELECT a.*, snippet(activity_fts, -1, ?, ?, '…', 32) AS snippet
+                    FROM activity_fts JOIN activity_log a ON a.id = activity_fts.rowid
+                    WHERE activity_fts MATCH ? AND a.ts BETWEEN ? AND ?
+                    ORDER BY a.ts DESC LIMIT ?""",
+                (*HIGHLIGHT_MARKERS, fts_match, start_ms, end_ms, limit)
+            )
+            return [dict(row) for row in cursor.fetchall()]
+
+        conditions, params = [], []
+        if fts_terms:
+            conditions.append("a.id IN (SELECT rowid FROM activity_fts WHERE activity_fts MATCH ?)")
+            params.append(fts_match)
+        like_terms = short_terms
+        if _has_short_term_index(cursor):
+            if sync_short_term_index(conn, SHORT_INDEX_SEARCH_SYNC) >= SHORT_INDEX_SEARCH_SYNC:
+                logging.info("短关键词索引仍在后台补建，较早的记录可能暂时检索不到")
+            # 未启用 trigram 时，长关键词在短关键词索引缩小的范围内用 LIKE 过滤
+            queries = {t: short_term_query(t) for t in short_terms if len(t) < 3}
+            like_terms = [t for t in short_terms if queries.get(t) is None]
+            if len(like_terms) < len(short_terms):
+                conditions.append("a.id IN (SELECT rowid FROM activity_short_fts WHERE activity_short_fts MATCH ?)")
+                params.append(' AND '.join(q for q in queries.values() if q is not None))
+        if not conditions and not start_time_dt:
+            # 没有任何索引可用时 LIKE 需要扫描全表，限制在最近一段时间内
+            start_ms = to_epoch_millis(datetime.now() - timedelta(days=KEYWORD_LIKE_FALLBACK_DAYS))
+        for term in like_terms:
+            pattern = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            conditions.append("(a.ocr_text LIKE ? ESCAPE '\\' OR a.window_title LIKE ? ESCAPE '\\')")
+            params.extend([pattern, pattern])
+        cursor.execute(
+            f"SELECT a.* FROM activity_log a WHERE a.ts BETWEEN ? AND ? AND {' AND '.join(conditions)} "
+            f"ORDER BY a.ts DESC LIMIT ?",
+            (start_ms, end_ms, *params, limit)
+        )
+        records = [dict(row) for row in cursor.fetchall()]
+        for record in records:
+            fields = [record.get('ocr_text') or '', record.get('window_title') or '']
+            text = next((f for f in fields if any(t.lower() in f.lower() for t in terms)), fields[0])
+            record['snippet'] = _like_snippet(text, terms)
+        return records
+    except sqlite3.Error as e:
+        logging.error(f"关键词检索失败: {e}")
+        return []
+    finally:
+        conn.close()
+
 async def get_application_usage_summary(start_time_dt: datetime, end_time_dt: datetime) -> dict:
-    """Calculates application usage summary within a given time range."""
+    """Calculates application usage summary within a given time range.
+
+    优先使用 window_change 事件流（前台窗口切换，精确到秒；to_app 为空表示空闲）；
+    该时间段内没有窗口切换事件的旧数据，退回到按截图记录的间隔估算。
+    """
     conn = create_db_connection()
     if not conn: return {"error": "Database connection failed."}
 
     summary = defaultdict(timedelta)
     try:
         cursor = conn.cursor()
+        start_ms = to_epoch_millis(start_time_dt)
+        end_ms = min(to_epoch_millis(end_time_dt), to_epoch_millis(datetime.now()))
+        # 时间段开始前最后一次切换决定了开始时的前台应用
+        cursor.execute(
+            "SELECT ts, to_app FROM activity_log WHERE record_type = 'window_change' AND ts < ? ORDER BY ts DESC LIMIT 1",
+            (start_ms,)
+        )
+        previous = cursor.fetchone()
         cursor.execute(
-            "SELECT timestamp, app_name FROM activity_log WHERE timestamp BETWEEN ? AND ? AND app_name IS NOT NULL ORDER BY timestamp ASC",
-            (start_time_dt.isoformat(), end_time_dt.isoformat())
+            "SELECT ts, to_app FROM activity_log WHERE record_type = 'window_change' AND ts BETWEEN ? AND ? ORDER BY ts ASC",
+            (start_ms, end_ms)
         )
-        events = [dict(row) for row in cursor.fetchall()]
+        events = [tuple(row) for row in cursor.fetchall()]
+        if previous is not None:
+            events.insert(0, (start_ms, previous[1]))
+
+        if not events:
+            cursor.execute(
+                "SELECT ts, app_name FROM activity_log WHERE ts BETWEEN ? AND ? AND app_name IS NOT NULL ORDER BY ts ASC",
+                (start_ms, end_ms)
+            )
+            events = [tuple(row) for row in cursor.fetchall()]
 
         if not events: return {"usage": {}}
 
-        for i, event in enumerate(events):
-            start = datetime.fromisoformat(event['timestamp'])
-            end = datetime.fromisoformat(events[i+1]['timestamp']) if i + 1 < len(events) else end_time_dt
-            duration = end - start
-            if duration.total_seconds() > 0:
-                summary[event['app_name']] += duration
+        for i, (ts, app_name) in enumerate(events):
+            end = events[i + 1][0] if i + 1 < len(events) else end_ms
+            if app_name and end > ts:
+                summary[app_name] += timedelta(milliseconds=end - ts)
         
         return {"usage": dict(summary)}
     except Exception as e:
         return {"error": str(e)}
     finally:
-        if conn: conn.close()
\ No newline at end of file
+        if conn: conn.close()
+
+async def get_visited_sites_summary(start_time_dt: datetime, end_time_dt: datetime, limit: int = 20) -> dict:
+    """按域名统计时间范围内访问过的网站（查询 urls/domains 索引表，不经过向量检索）"""
+    conn = create_db_connection()
+    if not conn: return {"error": "Database connection failed."}
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            """SELECT d.domain, COUNT(DISTINCT u.record_id) AS visits, MIN(u.ts) AS first_ts, MAX(u.ts) AS last_ts
+               FROM urls u JOIN domains d ON d.id = u.domain_id
+               WHERE u.ts BETWEEN ? AND ?
+               GROUP BY u.domain_id ORDER BY visits DESC, last_ts DESC LIMIT ?""",
+            (to_epoch_millis(start_time_dt), to_epoch_millis(end_time_dt), limit)
+        )
+        sites = [
+            {
+                "domain": row["domain"],
+                "visits": row["visits"],
+                "first_seen": datetime.fromtimestamp(row["first_ts"] / 1000),
+                "last_seen": datetime.fromtimestamp(row["last_ts"] / 1000),
+            }
+            for row in cursor.fetchall()
+        ]
+        return {"sites": sites}
+    except Exception as e:
+        return {"error": str(e)}
+    finally:
+        if conn: conn.close()
+
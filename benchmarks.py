@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能基准测试脚本
+对录制好的帧序列（目录中按文件名排序的截图）运行捕获/OCR流程并输出耗时对比
+
+用法:
+    python benchmarks.py record --out frames_dir --count 20 --interval 2
+    python benchmarks.py tile-ocr --frames frames_dir
+    python benchmarks.py db-writer --count 5000 --threads 2
+    python benchmarks.py pipeline --source frames_dir --rate 0 --ocr-workers 2
+    python benchmarks.py ocr-lang --frames labeled_frames_dir
+    python benchmarks.py embed --count 500 [--db screen_recordings/activity_log.db]
+"""
+
+import argparse
+import difflib
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import List
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp')
+
+def list_frames(directory: str, limit: int = 0) -> List[str]:
+    """按文件名顺序列出目录中的帧图像"""
+    frames = sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    return frames[:limit] if limit else frames
+
+def text_similarity(a: str, b: str) -> float:
+    """两段OCR文本的相似度 (0~1)"""
+    return difflib.SequenceMatcher(None, a, b, autojunk=False).ratio()
+
+def print_row(name: str, total: float, count: int):
+    print(f"{name:<24} 总耗时 {total:8.2f}s   平均 {total / max(count, 1) * 1000:8.1f}ms/帧")
+
+def bench_record(args):
+    """录制一段帧序列供其它基准测试使用，同时写入 manifest.jsonl 记录每帧的窗口元数据（供回放使用）"""
+    import mss
+    from screen_capture import get_active_window_info, get_browser_url, platform_provider
+    os.makedirs(args.out, exist_ok=True)
+    with mss.mss() as sct, open(os.path.join(args.out, "manifest.jsonl"), "w", encoding="utf-8") as manifest:
+        for i in range(args.count):
+            name = f"frame_{i:05d}.png"
+            window_title, pid, process_name, app_name = get_active_window_info()
+            entry = {
+                "frame": name,
+                "window_title": window_title,
+                "app_name": app_name,
+                "process_name": process_name,
+                "pid": pid,
+                "url": get_browser_url(app_name, window_title),
+                "window_rect": platform_provider.get_foreground_window_rect(),
+            }
+            sct.shot(output=os.path.join(args.out, name), mon=-1)
+            manifest.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            print(f"已保存 {name}")
+            time.sleep(args.interval)
+
+def bench_tile_ocr(args):
+    """整帧OCR 与 分块增量OCR 的耗时和文本一致性对比"""
+    from PIL import Image
+    from screen_capture import TileOCRCache, extract_text_with_tesseract
+
+    frames = list_frames(args.frames, args.limit)
+    if not frames:
+        print(f"目录中没有帧图像: {args.frames}")
+        return 1
+    images = []
+    for path in frames:
+        image = Image.open(path)
+        image.load()
+        images.append(image.convert('RGB'))
+    print(f"共 {len(images)} 帧，分辨率 {images[0].size[0]}x{images[0].size[1]}，分块 {args.tile_size}px")
+
+    full_texts, full_total = [], 0.0
+    for image in images:
+        start = time.perf_counter()
+        full_texts.append(extract_text_with_tesseract(image))
+        full_total += time.perf_counter() - start
+
+    cache = TileOCRCache(tile_size=args.tile_size)
+    tile_texts, tile_total = [], 0.0
+    for image in images:
+        start = time.perf_counter()
+        tile_texts.append(cache.extract_text(image))
+        tile_total += time.perf_counter() - start
+
+    print_row("整帧OCR", full_total, len(images))
+    print_row("分块增量OCR", tile_total, len(images))
+    print(f"加速比: {full_total / max(tile_total, 1e-9):.1f}x")
+    similarity = sum(text_similarity(a, b) for a, b in zip(full_texts, tile_texts)) / len(images)
+    print(f"与整帧OCR文本的平均相似度: {similarity:.3f}")
+    return 0
+
+def sample_record(i: int) -> dict:
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "record_type": "screen_content",
+        "triggered_by": "timer",
+        "window_title": f"benchmark window {i % 50}",
+        "app_name": "Benchmark",
+        "pid": 1234,
+        "process_name": "benchmark.exe",
+        "screenshot_path": f"screen_recordings/screenshot_{i:08d}.png",
+        "ocr_text": "lorem ipsum dolor sit amet " * 40,
+        "url": "",
+    }
+
+def run_producers(threads: int, count: int, insert):
+    """用多个线程并发写入 count 条记录，返回耗时"""
+    per_thread = count // threads
+    def produce(offset):
+        for i in range(per_thread):
+            insert(sample_record(offset + i))
+    workers = [threading.Thread(target=produce, args=(t * per_thread,)) for t in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start, per_thread * threads
+
+def bench_db_writer(args):
+    """逐条连接提交 与 批量写入线程 的插入吞吐对比"""
+    from screen_capture import DatabaseWriter, init_db
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_db = os.path.join(tmp, "legacy.db")
+        init_db(legacy_db)
+        lock = threading.Lock()
+
+        def legacy_insert(record):
+            # 旧实现：每条记录新建连接、执行INSERT并提交
+            with lock:
+                conn = sqlite3.connect(legacy_db)
+                columns = ', '.join(record.keys())
+                placeholders = ', '.join('?' * len(record))
+                conn.execute(f"INSERT INTO activity_log ({columns}) VALUES ({placeholders})", list(record.values()))
+                conn.commit()
+                conn.close()
+
+        legacy_time, legacy_count = run_producers(args.threads, args.count, legacy_insert)
+
+        writer_db = os.path.join(tmp, "writer.db")
+        init_db(writer_db)
+        writer = DatabaseWriter(writer_db, batch_size=args.batch_size, flush_interval=args.flush_interval)
+        writer.start()
+        start = time.perf_counter()
+        _, writer_count = run_producers(args.threads, args.count, writer.insert)
+        writer.flush()
+        writer_time = time.perf_counter() - start
+        writer.stop()
+
+        conn = sqlite3.connect(writer_db)
+        stored = conn.execute("SELECT COUNT(*) FROM activity_log").fetchone()[0]
+        conn.close()
+
+    print(f"{args.threads} 个写入线程，共 {legacy_count} 条记录")
+    print(f"{'逐条连接提交':<24} {legacy_count / legacy_time:10.0f} 条/秒")
+    print(f"{'批量写入线程':<24} {writer_count / writer_time:10.0f} 条/秒  (已落库 {stored} 条)")
+    print(f"加速比: {legacy_time / max(writer_time, 1e-9):.1f}x")
+    return 0
+
+def bench_pipeline(args):
+    """通过回放数据运行完整的 采集→OCR→入库 流程（不需要显示器），测量吞吐"""
+    import screen_capture as sc
+
+    provider = sc.ReplayPlatformProvider(args.source, rate=args.rate)
+    sc.set_platform_provider(provider)
+    if sc.gui_config is not None:
+        # 只修改内存中的配置，不写回 gui_settings.json
+        sc.gui_config.set('capture.ocr_workers', args.ocr_workers)
+        sc.gui_config.set('capture.save_screenshots', args.save_screenshots)
+        # 关闭负载限流并实时OCR：否则繁忙或低核数的机器上帧会被延后，不计入耗时，吞吐被高估
+        sc.gui_config.set('capture.enable_load_throttle', False)
+        sc.gui_config.set('capture.ocr_timing', 'realtime')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, "replay.db")
+        sc.DATABASE_FILE = db_file
+        sc.SCREENSHOT_DIR = tmp
+        sc.init_db(db_file)
+
+        frames = changed = 0
+        start = time.perf_counter()
+        while (not args.limit or frames < args.limit) and provider.advance():
+            if sc.record_screen_activity(triggered_by="replay"):
+                changed += 1
+            frames += 1
+        capture_time = time.perf_counter() - start
+        conn = sqlite3.connect(db_file)
+        pipeline = sc.ocr_pipeline
+        drained = True
+        if pipeline is not None:
+            # 等延后登记到 ocr_jobs 的帧也补做完成后才停止计时
+            deadline = time.monotonic() + args.drain_timeout
+            while True:
+                sc.get_db_writer().flush()
+                waiting = conn.execute("SELECT COUNT(*) FROM ocr_jobs WHERE attempts < ?",
+                                       (sc.MAX_OCR_ATTEMPTS,)).fetchone()[0]
+                if not waiting and not pipeline.pending_count():
+                    break
+                if time.monotonic() > deadline:
+                    drained = False
+                    break
+                time.sleep(0.1)
+        sc.shutdown_ocr_pipeline(wait=True)
+        sc.shutdown_db_writer()
+        total_time = time.perf_counter() - start
+
+        # ocr_jobs 使用 AUTOINCREMENT，sqlite_sequence 中的序号即本次登记过的延后任务总数
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'ocr_jobs'").fetchone()
+        deferred = row[0] if row else 0
+        stored, unchanged, pending = conn.execute(
+            "SELECT COUNT(*), SUM(record_type = 'screen_unchanged'), "
+            "SUM(record_type = 'screen_content' AND ocr_text IS NULL) FROM activity_log"
+        ).fetchone()
+        conn.close()
+
+    print(f"回放 {frames} 帧（有新内容 {changed} 帧），OCR进程数 {args.ocr_workers}")
+    print(f"{'采集线程':<24} 总耗时 {capture_time:8.2f}s   {frames / max(capture_time, 1e-9):8.1f} 帧/秒")
+    print(f"{'含OCR回填':<24} 总耗时 {total_time:8.2f}s   {frames / max(total_time, 1e-9):8.1f} 帧/秒")
+    print(f"已落库 {stored} 条，其中未变化心跳 {unchanged or 0} 条，未完成OCR {pending or 0} 条")
+    print(f"延后OCR {deferred} 帧（已计入含OCR回填耗时）")
+    if not drained:
+        print(f"⚠️ {args.drain_timeout}s 内延后OCR任务未全部完成，含OCR回填耗时偏低")
+    return 0
+
+def load_label(entry: dict):
+    """帧的标注文本：清单中的 text 字段，或与帧同名的 .txt 文件；没有标注时返回None"""
+    if entry.get("text") is not None:
+        return entry["text"]
+    label_path = os.path.splitext(entry["frame"])[0] + ".txt"
+    if os.path.exists(label_path):
+        with open(label_path, "r", encoding="utf-8") as f:
+            return f.read()
+    return None
+
+def bench_ocr_lang(args):
+    """固定中英双语模型 与 按窗口自动选择语言模型 的耗时和准确率对比"""
+    from collections import Counter
+    from PIL import Image
+    from screen_capture import (DEFAULT_OCR_LANG, OCRLanguageSelector, ReplayPlatformProvider,
+                                extract_text_with_tesseract)
+
+    entries = ReplayPlatformProvider._load_entries(args.frames)
+    if args.limit:
+        entries = entries[:args.limit]
+    if not entries:
+        print(f"没有帧图像: {args.frames}")
+        return 1
+    selector = OCRLanguageSelector(reprobe_frames=args.reprobe)
+    langs = Counter()
+    baseline_total = selected_total = 0.0
+    baseline_scores, selected_scores, agreement = [], [], []
+    for entry in entries:
+        with Image.open(entry["frame"]) as image:
+            image = image.convert('RGB')
+        window_key = (entry.get("app_name", "Replay"), entry.get("window_title", ""))
+
+        start = time.perf_counter()
+        baseline_text = extract_text_with_tesseract(image, DEFAULT_OCR_LANG)
+        baseline_total += time.perf_counter() - start
+
+        lang = selector.choose(window_key)
+        start = time.perf_counter()
+        selected_text = extract_text_with_tesseract(image, lang)
+        selected_total += time.perf_counter() - start
+        selector.observe(window_key, lang, selected_text)
+        langs[lang] += 1
+
+        label = load_label(entry)
+        if label is not None:
+            baseline_scores.append(text_similarity(baseline_text, " ".join(label.split())))
+            selected_scores.append(text_similarity(selected_text, " ".join(label.split())))
+        agreement.append(text_similarity(baseline_text, selected_text))
+
+    count = len(entries)
+    print(f"共 {count} 帧，语言模型使用次数: " + ", ".join(f"{lang} {n}" for lang, n in langs.most_common()))
+    print_row(f"固定 {DEFAULT_OCR_LANG}", baseline_total, count)
+    print_row("按窗口选择语言", selected_total, count)
+    saved = baseline_total - selected_total
+    print(f"节省耗时: {saved:.2f}s ({saved / max(baseline_total, 1e-9) * 100:.1f}%)")
+    if baseline_scores:
+        baseline_accuracy = sum(baseline_scores) / len(baseline_scores)
+        selected_accuracy = sum(selected_scores) / len(selected_scores)
+        print(f"与标注文本的平均相似度（{len(baseline_scores)} 帧有标注）: "
+              f"固定 {baseline_accuracy:.3f}，自动选择 {selected_accuracy:.3f}，差异 {selected_accuracy - baseline_accuracy:+.3f}")
+    print(f"两种方式输出文本的平均相似度: {sum(agreement) / count:.3f}")
+    return 0
+
+def embedding_corpus(db_file: str, count: int) -> List[str]:
+    """嵌入测试用的文档：优先取数据库中最近的OCR文本，否则生成长度不一的中英文混合文本"""
+    if db_file and os.path.exists(db_file):
+        conn = sqlite3.connect(db_file)
+        rows = conn.execute(
+            "SELECT app_name, window_title, ocr_text FROM activity_log "
+            "WHERE ocr_text IS NOT NULL AND ocr_text != '' ORDER BY id DESC LIMIT ?", (count,)
+        ).fetchall()
+        conn.close()
+        if rows:
+            return [f"应用: {app} | 窗口: {title} | 内容: {text}" for app, title, text in rows]
+    import random
+    rng = random.Random(0)
+    words = ["error", "build", "commit", "会议", "文档", "设置", "timeout", "数据库", "请求", "report"]
+    return [" ".join(rng.choice(words) for _ in range(rng.choice((8, 30, 120, 400))))
+            for _ in range(count)]
+
+def legacy_add_documents(collection, encode_text, documents, metadatas, ids):
+    """旧实现：每批10个文档，逐个编码后写入，每批之后暂停0.1秒"""
+    for i in range(0, len(documents), 10):
+        batch_embeddings = [encode_text(doc) for doc in documents[i:i + 10]]
+        collection.add(documents=documents[i:i + 10], metadatas=metadatas[i:i + 10],
+                       ids=ids[i:i + 10], embeddings=batch_embeddings)
+        time.sleep(0.1)
+
+def bench_embed(args):
+    """向量入库吞吐（CPU）：逐个编码 vs 按长度排序的批量编码 + 大块写入"""
+    import chromadb
+    from sentence_transformers import SentenceTransformer
+    import custom_embeddings as ce
+    from gui_config import gui_config
+
+    documents = embedding_corpus(args.db, args.count)
+    metadatas = [{"index": i} for i in range(len(documents))]
+    ids = [f"bench_{i}" for i in range(len(documents))]
+    print(f"加载模型 {args.model}（CPU）...")
+    ce.embeddings_model = SentenceTransformer(args.model, device='cpu', trust_remote_code=True)
+    ce.chroma_client = chromadb.EphemeralClient()
+    gui_config.set('data.embedding_batch_size', args.batch_size)
+    gui_config.set('data.embedding_token_budget', args.token_budget)
+    gui_config.set('data.embedding_cache_size', 0)
+
+    legacy = ce.chroma_client.create_collection("bench_legacy")
+    start = time.perf_counter()
+    legacy_add_documents(legacy, ce.encode_text, documents, metadatas, ids)
+    legacy_time = time.perf_counter() - start
+
+    ce.collection = ce.chroma_client.create_collection("bench_batched")
+    start = time.perf_counter()
+    written = ce.add_documents(documents, metadatas, ids)
+    batched_time = time.perf_counter() - start
+
+    # 带向量缓存：第一次写入时只有重复出现的文本命中，第二次写入相同文档时全部命中
+    gui_config.set('data.embedding_cache_size', max(args.count, 1))
+    with tempfile.TemporaryDirectory() as tmp:
+        ce.MODEL_NAME = args.model
+        ce.embedding_cache = ce.EmbeddingCache(os.path.join(tmp, "embedding_cache.db"), args.model, max(args.count, 1))
+        cached_times = []
+        for run in ("cold", "warm"):
+            ce.collection = ce.chroma_client.create_collection(f"bench_cache_{run}")
+            start = time.perf_counter()
+            ce.add_documents(documents, metadatas, ids)
+            cached_times.append(time.perf_counter() - start)
+        cache_stats = ce.embedding_cache.stats()
+        ce.embedding_cache.close()
+        ce.embedding_cache = None
+
+    lengths = ce.count_tokens(documents)
+    print(f"共 {len(documents)} 个文档，平均 {sum(lengths) / len(lengths):.0f} tokens，"
+          f"批大小 {args.batch_size}，token预算 {args.token_budget}")
+    print(f"{'逐个编码':<24} {len(documents) / legacy_time:10.1f} 文档/秒  ({legacy_time:.1f}s)")
+    print(f"{'批量编码':<24} {written / batched_time:10.1f} 文档/秒  ({batched_time:.1f}s，写入 {written} 个)")
+    print(f"{'批量编码+缓存（首次）':<24} {len(documents) / cached_times[0]:10.1f} 文档/秒  ({cached_times[0]:.1f}s)")
+    print(f"{'批量编码+缓存（重复）':<24} {len(documents) / cached_times[1]:10.1f} 文档/秒  ({cached_times[1]:.1f}s)")
+    print(f"加速比（批量编码）: {legacy_time / max(batched_time, 1e-9):.1f}x")
+    print(f"向量缓存: {cache_stats['entries']} 条，两次写入的总命中率 {cache_stats['hit_rate']:.1%}"
+          f"（首次写入中重复文本 {len(documents) - cache_stats['entries']} 个）")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="AI桌面活动助手 性能基准测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record = subparsers.add_parser("record", help="录制帧序列")
+    record.add_argument("--out", required=True, help="输出目录")
+    record.add_argument("--count", type=int, default=20, help="帧数")
+    record.add_argument("--interval", type=float, default=2.0, help="帧间隔（秒）")
+    record.set_defaults(func=bench_record)
+
+    tile_ocr = subparsers.add_parser("tile-ocr", help="整帧OCR vs 分块增量OCR")
+    tile_ocr.add_argument("--frames", required=True, help="帧序列目录")
+    tile_ocr.add_argument("--limit", type=int, default=0, help="最多使用多少帧（0表示全部）")
+    tile_ocr.add_argument("--tile-size", type=int, default=256, help="分块边长（像素）")
+    tile_ocr.set_defaults(func=bench_tile_ocr)
+
+    db_writer = subparsers.add_parser("db-writer", help="SQLite插入吞吐：逐条提交 vs 批量写入线程")
+    db_writer.add_argument("--count", type=int, default=5000, help="插入记录数")
+    db_writer.add_argument("--threads", type=int, default=2, help="并发写入线程数")
+    db_writer.add_argument("--batch-size", type=int, default=50, help="每批提交的最大条数")
+    db_writer.add_argument("--flush-interval", type=float, default=1.0, help="批次最长等待时间（秒）")
+    db_writer.set_defaults(func=bench_db_writer)
+
+    pipeline = subparsers.add_parser("pipeline", help="回放帧序列运行完整采集流程，测量吞吐")
+    pipeline.add_argument("--source", required=True, help="帧序列目录或清单文件（manifest.jsonl）")
+    pipeline.add_argument("--rate", type=float, default=0.0, help="每秒回放帧数（0表示不限速）")
+    pipeline.add_argument("--limit", type=int, default=0, help="最多回放多少帧（0表示全部）")
+    pipeline.add_argument("--ocr-workers", type=int, default=2, help="OCR进程数（0表示在采集线程中同步OCR）")
+    pipeline.add_argument("--save-screenshots", action="store_true", help="同时按存储设置保存截图")
+    pipeline.add_argument("--drain-timeout", type=float, default=600, help="等待延后OCR任务补做完成的最长秒数")
+    pipeline.set_defaults(func=bench_pipeline)
+
+    ocr_lang = subparsers.add_parser("ocr-lang", help="固定中英双语 vs 按窗口自动选择OCR语言模型")
+    ocr_lang.add_argument("--frames", required=True, help="帧序列目录或清单文件；标注文本放在清单的 text 字段或同名 .txt 文件中")
+    ocr_lang.add_argument("--limit", type=int, default=0, help="最多使用多少帧（0表示全部）")
+    ocr_lang.add_argument("--reprobe", type=int, default=10, help="单语言识别多少帧后重新探测")
+    ocr_lang.set_defaults(func=bench_ocr_lang)
+
+    embed = subparsers.add_parser("embed", help="向量入库吞吐：逐个编码 vs 批量编码 vs 带向量缓存")
+    embed.add_argument("--count", type=int, default=500, help="文档数")
+    embed.add_argument("--db", default="", help="从该 activity_log.db 取最近的OCR文本（默认生成测试文本）")
+    embed.add_argument("--model", default="Alibaba-NLP/gte-multilingual-base", help="嵌入模型")
+    embed.add_argument("--batch-size", type=int, default=32, help="每批最多文档数")
+    embed.add_argument("--token-budget", type=int, default=16384, help="每批 最长token数×文档数 上限")
+    embed.set_defaults(func=bench_embed)
+
+    args = parser.parse_args()
+    return args.func(args) or 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,6 +7,7 @@
 import os
 import shutil
 import logging
+import sqlite3
 
 # 设置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -15,8 +16,10 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 try:
     from gui_config import gui_config
     chroma_path = gui_config.get('paths.database_directory', 'chroma_db_activity')
+    activity_db_path = os.path.join(gui_config.get('paths.screenshot_directory', 'screen_recordings'), "activity_log.db")
 except ImportError:
     chroma_path = "chroma_db_activity"
+    activity_db_path = os.path.join("screen_recordings", "activity_log.db")
 
 def clear_chromadb():
     """清空ChromaDB数据"""
@@ -38,6 +41,23 @@ def clear_chromadb():
         logging.error(f"❌ 清理ChromaDB失败: {e}")
         return False
 
+def clear_index_cursor():
+    """清空增量索引游标，下次启动时从头重新索引全部记录"""
+    if not os.path.exists(activity_db_path):
+        return
+    try:
+        conn = sqlite3.connect(activity_db_path)
+        try:
+            with conn:
+                conn.execute("DELETE FROM index_state")
+                conn.execute("DELETE FROM index_pending")
+        finally:
+            conn.close()
+        logging.info("✅ 索引游标已重置")
+    except sqlite3.Error as e:
+        # 旧版本数据库中还没有游标表
+        logging.info(f"📁 未找到索引游标，无需重置: {e}")
+
 def main():
     """主函数"""
     print("=== AI桌面助手数据清理工具 ===")
@@ -51,6 +71,8 @@ def main():
     
     # 执行清理
     success = clear_chromadb()
+    if success:
+        clear_index_cursor()
     
     if success:
         print("🎉 数据清理完成！现在可以重新启动应用程序")
@@ -5,44 +5,71 @@
 直接使用SentenceTransformer和ChromaDB
 """
 
+import hashlib
 import logging
 import os
-from typing import List, Dict, Any
+import socket
+import sqlite3
+import threading
+from typing import List, Dict, Any, Optional
 import numpy as np
 import time
 
+MODEL_NAME = 'Alibaba-NLP/gte-multilingual-base'
+
 # 全局变量
 embeddings_model = None
 chroma_client = None
 collection = None
+embedding_cache = None
+
+def get_chroma_db_path() -> str:
+    # 从配置文件读取数据库路径
+    try:
+        from gui_config import gui_config
+        return gui_config.get('paths.database_directory', 'chroma_db_activity')
+    except ImportError:
+        return "chroma_db_activity"
+
+def load_model():
+    """在本进程中加载SentenceTransformer模型（共享嵌入服务也通过它加载）"""
+    from sentence_transformers import SentenceTransformer
+    logging.info("正在加载阿里巴巴嵌入模型...")
+    model = SentenceTransformer(
+        MODEL_NAME,
+        trust_remote_code=True
+    )
+    logging.info("✅ 嵌入模型加载成功")
+    return model
+
+_model_lock = threading.Lock()
+
+def ensure_local_model():
+    """返回本进程内的模型，尚未加载时加载（共享嵌入服务不可用时的回退）"""
+    global embeddings_model
+    with _model_lock:
+        if embeddings_model is None:
+            embeddings_model = load_model()
+    return embeddings_model
 
 def init_embeddings():
     """初始化嵌入模型和ChromaDB"""
     global embeddings_model, chroma_client, collection
-    
+
     try:
-        # 1. 初始化SentenceTransformer
-        from sentence_transformers import SentenceTransformer
-        logging.info("正在加载阿里巴巴嵌入模型...")
-        embeddings_model = SentenceTransformer(
-            'Alibaba-NLP/gte-multilingual-base', 
-            trust_remote_code=True
-        )
-        logging.info("✅ 嵌入模型加载成功")
-        
+        # 1. 共享嵌入服务可用时本进程不加载模型，否则初始化SentenceTransformer
+        client = get_embedding_client()
+        if client is not None and client.ping():
+            logging.info(f"✅ 使用共享嵌入服务 {client.address[0]}:{client.address[1]}，本进程不加载模型")
+        else:
+            ensure_local_model()
+
         # 2. 初始化ChromaDB
         import chromadb
         from chromadb.config import Settings
         
         # 使用持久化存储
-        # 从配置文件读取数据库路径
-        try:
-            from gui_config import gui_config
-            CHROMA_DB_PATH = gui_config.get('paths.database_directory', 'chroma_db_activity')
-        except ImportError:
-            CHROMA_DB_PATH = "chroma_db_activity"
-
-        chroma_client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
+        chroma_client = chromadb.PersistentClient(path=get_chroma_db_path())
         
         # 创建或获取集合
         collection = chroma_client.get_or_create_collection(
@@ -60,102 +87,368 @@ def init_embeddings():
         collection = None
         return False
 
+# --- 共享嵌入服务客户端 ---
+EMBED_SERVER_ADDRESS = "127.0.0.1:8765"  # 共享嵌入服务地址（data.embedding_server，空字符串表示不使用；环境变量 EMBEDDING_SERVER 优先）
+EMBED_SERVER_CONNECT_TIMEOUT = 0.5       # 连接超时（秒），服务未启动时本机连接会立即被拒绝
+EMBED_SERVER_TIMEOUT = 300               # 单个请求的超时（秒），大批量文档在CPU上编码可能较慢
+EMBED_SERVER_RETRY_INTERVAL = 30         # 连接失败后多久再尝试连接服务（秒），期间直接在本进程中编码
+
+embedding_client = None
+
+class EmbeddingClient:
+    """共享嵌入服务（embedding_server.py）的客户端：每个线程一条长连接，连接失败时标记服务暂不可用"""
+
+    def __init__(self, address: tuple):
+        self.address = address
+        self.info = {}
+        self._local = threading.local()
+        self._unavailable_until = 0.0
+
+    def _close(self):
+        sock = getattr(self._local, 'sock', None)
+        self._local.sock = None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def available(self) -> bool:
+        return time.monotonic() >= self._unavailable_until
+
+    def request(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """发送一条请求；服务不可用时抛出 ConnectionError，服务端处理失败时抛出 RuntimeError"""
+        from embedding_server import recv_message, send_message
+        if not self.available():
+            raise ConnectionError("共享嵌入服务暂不可用")
+        # 复用的长连接可能已被服务端关闭（例如服务重启），此时换一条新连接重试一次
+        for attempt in range(2):
+            reused = getattr(self._local, 'sock', None) is not None
+            try:
+                if not reused:
+                    sock = socket.create_connection(self.address, timeout=EMBED_SERVER_CONNECT_TIMEOUT)
+                    sock.settimeout(EMBED_SERVER_TIMEOUT)
+                    self._local.sock = sock
+                send_message(self._local.sock, payload)
+                response = recv_message(self._local.sock)
+                if response is None:
+                    raise ConnectionError("连接已被服务端关闭")
+                break
+            except (OSError, ValueError) as e:
+                self._close()
+                if reused and attempt == 0:
+                    continue
+                self._unavailable_until = time.monotonic() + EMBED_SERVER_RETRY_INTERVAL
+                raise ConnectionError(f"无法连接共享嵌入服务 {self.address[0]}:{self.address[1]}: {e}") from e
+        if 'error' in response:
+            raise RuntimeError(f"共享嵌入服务处理失败: {response['error']}")
+        return response
+
+    def ping(self) -> bool:
+        """检查服务是否可用且加载的是同一个模型"""
+        try:
+            info = self.request({"op": "ping"})
+        except (ConnectionError, RuntimeError) as e:
+            logging.debug(f"共享嵌入服务不可用: {e}")
+            return False
+        if info.get('model') != MODEL_NAME:
+            logging.warning(f"共享嵌入服务加载的模型 {info.get('model')} 与 {MODEL_NAME} 不一致，不使用该服务")
+            self._unavailable_until = float('inf')
+            return False
+        self.info = info
+        return True
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        from embedding_server import decode_vectors
+        return decode_vectors(self.request({"op": "encode", "texts": list(texts)})['vectors'])
+
+def get_embedding_server_address() -> Optional[tuple]:
+    address = os.getenv('EMBEDDING_SERVER')
+    if address is None:
+        try:
+            from gui_config import gui_config
+            address = gui_config.get('data.embedding_server', EMBED_SERVER_ADDRESS)
+        except ImportError:
+            address = EMBED_SERVER_ADDRESS
+    address = (address or '').strip()
+    if not address:
+        return None
+    host, _, port = address.rpartition(':')
+    try:
+        return (host or '127.0.0.1', int(port))
+    except ValueError:
+        logging.warning(f"共享嵌入服务地址格式错误（应为 主机:端口）: {address}")
+        return None
+
+def get_embedding_client() -> Optional[EmbeddingClient]:
+    """按配置创建共享嵌入服务客户端；未配置地址时返回None"""
+    global embedding_client
+    if embedding_client is None:
+        address = get_embedding_server_address()
+        if address is None:
+            return None
+        embedding_client = EmbeddingClient(address)
+    return embedding_client
+
 def encode_text(text: str) -> List[float]:
     """编码单个文本"""
-    if embeddings_model is None:
-        raise RuntimeError("嵌入模型未初始化")
-    
-    embedding = embeddings_model.encode(text, normalize_embeddings=True)
-    return embedding.tolist()
+    return encode_texts([text])[0]
 
-def encode_texts(texts: List[str]) -> List[List[float]]:
-    """编码多个文本"""
-    if embeddings_model is None:
-        raise RuntimeError("嵌入模型未初始化")
-    
-    embeddings = embeddings_model.encode(texts, normalize_embeddings=True)
+def encode_texts(texts: List[str], batch_size: int = 32) -> List[List[float]]:
+    """
+    编码多个文本：优先交给共享嵌入服务（由服务端合并并发请求），
+    服务不可用时在本进程中调用模型（batch_size 为模型内部每次前向计算的文档数）
+    """
+    client = get_embedding_client()
+    if client is not None and client.available() and (client.info or client.ping()):
+        try:
+            return client.encode(texts).tolist()
+        except ConnectionError as e:
+            logging.warning(f"{e}，改为在本进程中编码")
+
+    embeddings = ensure_local_model().encode(texts, batch_size=batch_size, normalize_embeddings=True)
     return embeddings.tolist()
 
-def add_documents(documents: List[str], metadatas: List[Dict], ids: List[str]):
-    """添加文档到向量数据库（分批处理）"""
+# --- 批量写入 ---
+EMBED_BATCH_SIZE = 32        # 每批送入模型的最大文档数（data.embedding_batch_size）
+EMBED_TOKEN_BUDGET = 16384   # 每批 最长文档token数 × 文档数 的上限，限制padding后的显存/内存占用（data.embedding_token_budget）
+CHROMA_WRITE_CHUNK = 1000    # 一次写入ChromaDB的文档数（不超过ChromaDB允许的最大批量）
+
+def get_embedding_setting(name: str, default: int) -> int:
+    try:
+        from gui_config import gui_config
+        return int(gui_config.get(f'data.{name}', default))
+    except ImportError:
+        return default
+
+def count_tokens(texts: List[str]) -> List[int]:
+    """每个文本编码时的token数（超过模型最大长度的部分会被截断）；没有分词器时（例如使用共享嵌入服务）按字符数估计"""
+    max_length = (getattr(embeddings_model, 'max_seq_length', None)
+                  or (embedding_client.info.get('max_seq_length') if embedding_client is not None else None) or 512)
+    tokenizer = getattr(embeddings_model, 'tokenizer', None)
+    if tokenizer is not None:
+        try:
+            input_ids = tokenizer(texts, add_special_tokens=True, truncation=True, max_length=max_length)['input_ids']
+            return [len(ids) for ids in input_ids]
+        except Exception as e:
+            logging.debug(f"分词统计失败，按字符数估计: {e}")
+    return [min(len(text) + 2, max_length) for text in texts]
+
+def plan_batches(lengths: List[int], batch_size: int, token_budget: int) -> List[List[int]]:
+    """按长度从长到短排序后分批（同批文档长度接近，padding浪费少），
+    每批不超过 batch_size 个文档且 最长token数 × 文档数 不超过 token_budget。返回每批的下标列表"""
+    batches = []
+    for index in sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True):
+        # 已按长度降序排列，批内第一个文档就是最长的
+        if batches and len(batches[-1]) < batch_size and lengths[batches[-1][0]] * (len(batches[-1]) + 1) <= token_budget:
+            batches[-1].append(index)
+        else:
+            batches.append([index])
+    return batches
+
+def encode_batch_with_split(texts: List[str]) -> List[Any]:
+    """编码一批文本；失败时对半拆分重试，只有单个文档仍失败时才放弃该文档（对应位置为None）"""
+    try:
+        return encode_texts(texts, batch_size=len(texts))
+    except Exception as e:
+        if len(texts) == 1:
+            logging.error(f"❌ 文档编码失败，已跳过: {e}")
+            return [None]
+        logging.warning(f"⚠️ {len(texts)} 个文档的批次编码失败，拆分后重试: {e}")
+        middle = len(texts) // 2
+        return encode_batch_with_split(texts[:middle]) + encode_batch_with_split(texts[middle:])
+
+def write_chunk_with_split(documents: List[str], metadatas: List[Dict], ids: List[str], embeddings: List[Any]) -> int:
+    """写入ChromaDB；失败时对半拆分重试（复用已计算的向量，不重新编码），返回成功写入的文档数"""
+    try:
+        collection.upsert(documents=documents, metadatas=metadatas, ids=ids, embeddings=embeddings)
+        return len(documents)
+    except Exception as e:
+        if len(documents) == 1:
+            logging.error(f"❌ 文档 {ids[0]} 写入ChromaDB失败: {e}")
+            return 0
+        middle = len(documents) // 2
+        return (write_chunk_with_split(documents[:middle], metadatas[:middle], ids[:middle], embeddings[:middle])
+                + write_chunk_with_split(documents[middle:], metadatas[middle:], ids[middle:], embeddings[middle:]))
+
+# --- 向量缓存 ---
+EMBED_CACHE_SIZE = 50000   # 缓存的最大向量数（data.embedding_cache_size，0表示不使用缓存）
+EMBED_CACHE_EVICT_RATIO = 0.1  # 超出上限时一次淘汰的比例（按最近使用时间）
+
+def normalize_document(text: str) -> str:
+    """计算缓存键前的规范化：合并连续空白（OCR文本的换行和空格差异不影响向量）"""
+    return ' '.join(text.split())
+
+class EmbeddingCache:
+    """
+    持久化的向量缓存：键为 (模型ID, 规范化后的文档文本) 的哈希，向量以 float16 存为 SQLite BLOB。
+    超过 max_entries 时按最近使用时间淘汰；hits/misses/evictions 为本进程内的统计。
+    """
+
+    def __init__(self, db_file: str, model_id: str, max_entries: int = EMBED_CACHE_SIZE):
+        self.model_id = model_id
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                key BLOB PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_used INTEGER NOT NULL
+            ) WITHOUT ROWID
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embedding_cache_last_used ON embedding_cache (last_used)")
+        self._conn.commit()
+
+    def key(self, text: str) -> bytes:
+        data = f"{self.model_id}\0{normalize_document(text)}".encode('utf-8')
+        return hashlib.blake2b(data, digest_size=16).digest()
+
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, List[float]]:
+        """查询缓存，返回命中的 键 -> 向量，并刷新这些条目的最近使用时间"""
+        unique = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            for offset in range(0, len(unique), 500):
+                chunk = unique[offset:offset + 500]
+                placeholders = ','.join('?' * len(chunk))
+                for key, blob in self._conn.execute(
+                        f"SELECT key, vector FROM embedding_cache WHERE key IN ({placeholders})", chunk):
+                    found[key] = np.frombuffer(blob, dtype=np.float16).astype(np.float32).tolist()
+            if found:
+                now = int(time.time())
+                self._conn.executemany("UPDATE embedding_cache SET last_used = ? WHERE key = ?",
+                                       [(now, key) for key in found])
+                self._conn.commit()
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, items: Dict[bytes, List[float]]):
+        if not items:
+            return
+        now = int(time.time())
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embedding_cache (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, np.asarray(vector, dtype=np.float16).tobytes(), now) for key, vector in items.items()],
+            )
+            self._conn.commit()
+            self._evict()
+
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        excess = count - self.max_entries + int(self.max_entries * EMBED_CACHE_EVICT_RATIO)
+        self._conn.execute(
+            "DELETE FROM embedding_cache WHERE key IN "
+            "(SELECT key FROM embedding_cache ORDER BY last_used LIMIT ?)", (excess,)
+        )
+        self._conn.commit()
+        self.evictions += excess
+        logging.info(f"向量缓存超过上限 {self.max_entries}，已淘汰 {excess} 条最久未使用的向量")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """按配置懒加载向量缓存（保存在ChromaDB目录下的 embedding_cache.db）；data.embedding_cache_size 为0时返回None"""
+    global embedding_cache
+    max_entries = get_embedding_setting('embedding_cache_size', EMBED_CACHE_SIZE)
+    if max_entries <= 0:
+        return None
+    if embedding_cache is None:
+        path = get_chroma_db_path()
+        os.makedirs(path, exist_ok=True)
+        embedding_cache = EmbeddingCache(os.path.join(path, "embedding_cache.db"), MODEL_NAME, max_entries)
+    return embedding_cache
+
+def get_embedding_cache_stats() -> Dict[str, Any]:
+    """向量缓存统计，用于诊断"""
+    cache = get_embedding_cache()
+    return cache.stats() if cache is not None else {}
+
+def add_documents(documents: List[str], metadatas: List[Dict], ids: List[str]) -> int:
+    """
+    添加文档到向量数据库（ID已存在时覆盖），返回成功写入的文档数。
+    先查向量缓存，只对未命中的文档（相同文本只编码一次）按长度排序分批调用模型，
+    新向量写回缓存；向量累积到 CHROMA_WRITE_CHUNK 个后一次性写入ChromaDB。
+    """
     if collection is None:
         raise RuntimeError("ChromaDB集合未初始化")
     
-    # 减小批次大小，提高稳定性
-    batch_size = 10  # 每批处理10个文档（从50减少到10）
     total_docs = len(documents)
-    
-    logging.info(f"开始分批处理 {total_docs} 个文档，每批 {batch_size} 个")
-    
+    if not total_docs:
+        return 0
+    batch_size = max(1, get_embedding_setting('embedding_batch_size', EMBED_BATCH_SIZE))
+    token_budget = max(1, get_embedding_setting('embedding_token_budget', EMBED_TOKEN_BUDGET))
+    write_chunk = CHROMA_WRITE_CHUNK
+    if hasattr(chroma_client, 'get_max_batch_size'):
+        write_chunk = min(write_chunk, chroma_client.get_max_batch_size())
+
+    start = time.perf_counter()
+    cache = get_embedding_cache()
+    keys = [cache.key(doc) for doc in documents] if cache is not None else list(range(total_docs))
+    vectors = cache.get_many(keys) if cache is not None else {}
+    docs_by_key = {}
+    for i, key in enumerate(keys):
+        docs_by_key.setdefault(key, []).append(i)
+    missing = [key for key in docs_by_key if key not in vectors]
+    batches = plan_batches(count_tokens([documents[docs_by_key[key][0]] for key in missing]), batch_size, token_budget)
+    logging.info(f"开始批量编码 {total_docs} 个文档：缓存命中 {total_docs - sum(len(docs_by_key[k]) for k in missing)} 个，"
+                 f"需编码 {len(missing)} 个，共 {len(batches)} 批（每批最多 {batch_size} 个）")
+
     success_count = 0
-    
-    for i in range(0, total_docs, batch_size):
-        end_idx = min(i + batch_size, total_docs)
-        batch_docs = documents[i:end_idx]
-        batch_metas = metadatas[i:end_idx]
-        batch_ids = ids[i:end_idx]
-        
-        batch_num = i//batch_size + 1
-        total_batches = (total_docs-1)//batch_size + 1
-        
-        try:
-            # 生成当前批次的嵌入
-            logging.info(f"🔄 正在处理第 {batch_num}/{total_batches} 批 ({len(batch_docs)} 个文档) - 进度: {i}/{total_docs}")
-            
-            # 逐个处理文档以避免内存问题
-            batch_embeddings = []
-            for j, doc in enumerate(batch_docs):
-                try:
-                    embedding = encode_text(doc)
-                    batch_embeddings.append(embedding)
-                    if j % 5 == 0:  # 每5个文档显示一次进度
-                        logging.info(f"   - 已处理 {j+1}/{len(batch_docs)} 个文档")
-                except Exception as e:
-                    logging.error(f"❌ 处理文档 {j+1} 失败: {e}")
-                    raise
-            
-            # 添加到集合
-            logging.info(f"📊 正在将第 {batch_num} 批数据添加到数据库...")
-            collection.add(
-                documents=batch_docs,
-                metadatas=batch_metas,
-                ids=batch_ids,
-                embeddings=batch_embeddings
+    pending = [i for key in docs_by_key if key in vectors for i in docs_by_key[key]]  # 向量已就绪、等待写入的文档下标
+
+    def flush():
+        nonlocal success_count, pending
+        for offset in range(0, len(pending), write_chunk):
+            indices = sorted(pending[offset:offset + write_chunk])
+            success_count += write_chunk_with_split(
+                [documents[i] for i in indices], [metadatas[i] for i in indices],
+                [ids[i] for i in indices], [vectors[keys[i]] for i in indices],
             )
-            
-            success_count += len(batch_docs)
-            logging.info(f"✅ 第 {batch_num}/{total_batches} 批处理完成 (累计: {success_count}/{total_docs})")
-            
-            # 添加短暂延迟，避免资源竞争
-            time.sleep(0.1)
-            
-        except Exception as e:
-            logging.error(f"❌ 第 {batch_num} 批处理失败: {e}")
-            logging.info(f"🔄 尝试重新处理第 {batch_num} 批...")
-            
-            # 尝试重新处理一次
-            try:
-                batch_embeddings = []
-                for doc in batch_docs:
-                    embedding = encode_text(doc)
-                    batch_embeddings.append(embedding)
-                
-                collection.add(
-                    documents=batch_docs,
-                    metadatas=batch_metas,
-                    ids=batch_ids,
-                    embeddings=batch_embeddings
-                )
-                
-                success_count += len(batch_docs)
-                logging.info(f"✅ 第 {batch_num} 批重试成功")
-                
-            except Exception as e2:
-                logging.error(f"❌ 第 {batch_num} 批重试仍然失败: {e2}")
-                # 继续处理下一批，不中断整个过程
-                continue
-    
-    logging.info(f"🎉 批处理完成！成功处理 {success_count}/{total_docs} 个文档")
+        pending = []
+
+    for batch_num, batch in enumerate(batches, 1):
+        batch_keys = [missing[j] for j in batch]
+        encoded = encode_batch_with_split([documents[docs_by_key[key][0]] for key in batch_keys])
+        new_vectors = {key: vector for key, vector in zip(batch_keys, encoded) if vector is not None}
+        if cache is not None:
+            cache.put_many(new_vectors)
+        vectors.update(new_vectors)
+        pending.extend(i for key in new_vectors for i in docs_by_key[key])
+        if len(pending) >= write_chunk:
+            flush()
+            logging.info(f"🔄 已编码 {batch_num}/{len(batches)} 批，累计写入 {success_count}/{total_docs}")
+    flush()
+
+    elapsed = time.perf_counter() - start
+    logging.info(f"🎉 批处理完成！成功处理 {success_count}/{total_docs} 个文档，"
+                 f"耗时 {elapsed:.1f}s（{total_docs / elapsed if elapsed else 0:.1f} 文档/秒）")
+    if cache is not None:
+        stats = cache.stats()
+        logging.info(f"向量缓存：{stats['entries']} 条，命中率 {stats['hit_rate']:.1%}，累计淘汰 {stats['evictions']} 条")
+    return success_count
 
 def search_similar(query: str, k: int = 25, where_filter: Dict = None) -> List[Dict]:
     """搜索相似文档"""
@@ -212,6 +505,12 @@ def get_collection_count() -> int:
     except:
         return 0
 
+def get_document_ids() -> List[str]:
+    """获取集合中所有文档的ID（不读取文档内容和元数据）"""
+    if collection is None:
+        return []
+    return collection.get(include=[])['ids']
+
 def get_all_documents() -> List[Dict]:
     """获取集合中的所有文档"""
     if collection is None:
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+共享嵌入服务
+在单独的进程中只加载一次嵌入模型，通过本机TCP端口为GUI、采集工具和脚本提供批量编码；
+多个客户端的并发请求在服务端动态合并成一批再送入模型。
+custom_embeddings.encode_text/encode_texts 会优先使用该服务，服务不可用时退回本进程内编码。
+
+用法:
+    python embedding_server.py [--host 127.0.0.1] [--port 8765] [--max-batch 64] [--max-wait-ms 5]
+
+协议：每条消息为 4 字节大端长度 + UTF-8 JSON。
+    {"op": "ping"}                    -> {"model", "max_seq_length", "pid", "stats"}
+    {"op": "encode", "texts": [...]}  -> {"vectors": {"shape": [n, d], "data": base64(float32)}}
+    出错时返回 {"error": "..."}
+"""
+
+import argparse
+import base64
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MAX_MESSAGE_SIZE = 256 * 1024 * 1024  # 单条消息上限，防止读到错误的长度前缀时申请过大内存
+
+# --- 消息格式（服务端和客户端共用） ---
+def send_message(sock: socket.socket, payload: Dict[str, Any]) -> None:
+    data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    sock.sendall(struct.pack('>I', len(data)) + data)
+
+def _recv_exact(sock: socket.socket, size: int) -> Optional[bytes]:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+def recv_message(sock: socket.socket) -> Optional[Dict[str, Any]]:
+    """读取一条消息；对方关闭连接时返回None"""
+    header = _recv_exact(sock, 4)
+    if header is None:
+        return None
+    (size,) = struct.unpack('>I', header)
+    if size > MAX_MESSAGE_SIZE:
+        raise ValueError(f"消息过大: {size} 字节")
+    data = _recv_exact(sock, size)
+    if data is None:
+        return None
+    return json.loads(data.decode('utf-8'))
+
+def encode_vectors(vectors: np.ndarray) -> Dict[str, Any]:
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    return {"shape": list(vectors.shape), "data": base64.b64encode(vectors.tobytes()).decode('ascii')}
+
+def decode_vectors(payload: Dict[str, Any]) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(payload["data"]), dtype=np.float32).reshape(payload["shape"])
+
+# --- 动态批处理 ---
+class EmbeddingBatcher:
+    """
+    单个编码线程：取出第一个请求后最多再等待 max_wait 秒，把期间到达的请求合并到 max_batch 个文本为止，
+    一次送入模型后再按请求拆分结果。合并的一批编码失败时逐个请求重试，避免一个坏请求拖累其它请求。
+    """
+
+    def __init__(self, model, max_batch: int = 64, max_wait: float = 0.005):
+        self.model = model
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait)
+        self.requests = queue.Queue()
+        self.stats = {"requests": 0, "batches": 0, "texts": 0}
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, texts: List[str]) -> Future:
+        future = Future()
+        self.requests.put((texts, future))
+        return future
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(texts, batch_size=self.max_batch, normalize_embeddings=True)
+
+    def _collect(self) -> list:
+        batch = [self.requests.get()]
+        count = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while count < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            count += len(request[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for request_texts, _ in batch for text in request_texts]
+            self.stats["requests"] += len(batch)
+            self.stats["batches"] += 1
+            self.stats["texts"] += len(texts)
+            try:
+                vectors = self._encode(texts) if texts else np.zeros((0, 0), dtype=np.float32)
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0][1].set_exception(e)
+                    continue
+                logging.warning(f"合并的 {len(batch)} 个请求编码失败，逐个重试: {e}")
+                for request_texts, future in batch:
+                    try:
+                        future.set_result(self._encode(request_texts))
+                    except Exception as single_error:
+                        future.set_exception(single_error)
+                continue
+            offset = 0
+            for request_texts, future in batch:
+                future.set_result(vectors[offset:offset + len(request_texts)])
+                offset += len(request_texts)
+
+# --- 服务端 ---
+class EmbeddingRequestHandler(socketserver.BaseRequestHandler):
+    """一个客户端连接：同一连接上可以连续发送多条请求"""
+
+    def handle(self):
+        server = self.server
+        while True:
+            try:
+                request = recv_message(self.request)
+            except (OSError, ValueError) as e:
+                logging.debug(f"读取请求失败: {e}")
+                return
+            if request is None:
+                return
+            try:
+                op = request.get("op")
+                if op == "ping":
+                    response = {
+                        "model": server.model_name,
+                        "max_seq_length": getattr(server.batcher.model, 'max_seq_length', None),
+                        "pid": os.getpid(),
+                        "stats": dict(server.batcher.stats),
+                    }
+                elif op == "encode":
+                    texts = request.get("texts") or []
+                    response = {"vectors": encode_vectors(server.batcher.submit(texts).result())}
+                else:
+                    response = {"error": f"未知操作: {op}"}
+            except Exception as e:
+                response = {"error": f"{type(e).__name__}: {e}"}
+            try:
+                send_message(self.request, response)
+            except OSError:
+                return
+
+class EmbeddingServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, model, model_name: str, max_batch: int = 64, max_wait: float = 0.005):
+        self.model_name = model_name
+        self.batcher = EmbeddingBatcher(model, max_batch=max_batch, max_wait=max_wait)
+        super().__init__(address, EmbeddingRequestHandler)
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="共享嵌入服务")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="监听地址（默认只接受本机连接）")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="监听端口")
+    parser.add_argument("--max-batch", type=int, default=64, help="合并后每批最多文本数")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0, help="合并请求时最多等待的毫秒数")
+    args = parser.parse_args()
+
+    from custom_embeddings import MODEL_NAME, load_model
+    start = time.perf_counter()
+    model = load_model()
+    logging.info(f"✅ 嵌入模型 {MODEL_NAME} 加载完成，耗时 {time.perf_counter() - start:.1f}s")
+
+    with EmbeddingServer((args.host, args.port), model, MODEL_NAME,
+                         max_batch=args.max_batch, max_wait=args.max_wait_ms / 1000) as server:
+        logging.info(f"🚀 嵌入服务已启动: {args.host}:{args.port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logging.info("嵌入服务已停止")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -49,13 +49,50 @@ class GUIConfig:
             "data": {
                 "max_records_display": 100,
                 "auto_load_on_startup": True,
-                "data_retention_days": 30
+                "data_retention_days": 30,
+                "embedding_batch_size": 32,
+                "embedding_token_budget": 16384,
+                "embedding_cache_size": 50000,
+                "embedding_server": "127.0.0.1:8765"
             },
             "capture": {
                 "auto_start": True,
                 "capture_interval": 60,
                 "enable_ocr": True,
-                "enable_url_detection": True
+                "enable_url_detection": True,
+                "enable_dedup": True,
+                "enable_tile_ocr": True,
+                "enable_scroll_detection": True,
+                "ocr_workers": 2,
+                "ocr_queue_depth": 8,
+                "save_screenshots": True,
+                "storage_format": "png",
+                "storage_quality": 80,
+                "storage_max_width": 0,
+                "capture_mode": "all",
+                "db_batch_size": 50,
+                "db_flush_interval": 1.0,
+                "adaptive_capture": True,
+                "min_capture_interval": 10,
+                "max_capture_interval": 600,
+                "idle_pause_timeout": 300,
+                "click_coalesce_window": 0.5,
+                "click_settle_timeout": 2.0,
+                "click_queue_depth": 32,
+                "enable_click_capture": True,
+                "click_ocr_width": 640,
+                "click_ocr_height": 160,
+                "click_full_frame_ocr": True,
+                "enable_window_events": True,
+                "window_poll_interval": 0.5,
+                "enable_load_throttle": True,
+                "ocr_reduce_cpu": 65,
+                "ocr_defer_cpu": 85,
+                "ocr_timing": "realtime",
+                "ocr_idle_after": 60,
+                "ocr_batch_size": 8,
+                "ocr_low_priority": True,
+                "auto_ocr_language": True
             },
             "notifications": {
                 "enable_notifications": True,
@@ -158,7 +195,11 @@ class GUIConfig:
         return {
             'max_records_display': self.get('data.max_records_display', 100),
             'auto_load_on_startup': self.get('data.auto_load_on_startup', True),
-            'data_retention_days': self.get('data.data_retention_days', 30)
+            'data_retention_days': self.get('data.data_retention_days', 30),
+            'embedding_batch_size': self.get('data.embedding_batch_size', 32),
+            'embedding_token_budget': self.get('data.embedding_token_budget', 16384),
+            'embedding_cache_size': self.get('data.embedding_cache_size', 50000),
+            'embedding_server': self.get('data.embedding_server', '127.0.0.1:8765')
         }
         
     def get_capture_settings(self) -> Dict[str, Any]:
@@ -167,7 +208,40 @@ class GUIConfig:
             'auto_start': self.get('capture.auto_start', True),
             'capture_interval': self.get('capture.capture_interval', 60),
             'enable_ocr': self.get('capture.enable_ocr', True),
-            'enable_url_detection': self.get('capture.enable_url_detection', True)
+            'enable_url_detection': self.get('capture.enable_url_detection', True),
+            'enable_dedup': self.get('capture.enable_dedup', True),
+            'enable_tile_ocr': self.get('capture.enable_tile_ocr', True),
+            'enable_scroll_detection': self.get('capture.enable_scroll_detection', True),
+            'ocr_workers': self.get('capture.ocr_workers', 2),
+            'ocr_queue_depth': self.get('capture.ocr_queue_depth', 8),
+            'save_screenshots': self.get('capture.save_screenshots', True),
+            'storage_format': self.get('capture.storage_format', 'png'),
+            'storage_quality': self.get('capture.storage_quality', 80),
+            'storage_max_width': self.get('capture.storage_max_width', 0),
+            'capture_mode': self.get('capture.capture_mode', 'all'),
+            'db_batch_size': self.get('capture.db_batch_size', 50),
+            'db_flush_interval': self.get('capture.db_flush_interval', 1.0),
+            'adaptive_capture': self.get('capture.adaptive_capture', True),
+            'min_capture_interval': self.get('capture.min_capture_interval', 10),
+            'max_capture_interval': self.get('capture.max_capture_interval', 600),
+            'idle_pause_timeout': self.get('capture.idle_pause_timeout', 300),
+            'click_coalesce_window': self.get('capture.click_coalesce_window', 0.5),
+            'click_settle_timeout': self.get('capture.click_settle_timeout', 2.0),
+            'click_queue_depth': self.get('capture.click_queue_depth', 32),
+            'enable_click_capture': self.get('capture.enable_click_capture', True),
+            'click_ocr_width': self.get('capture.click_ocr_width', 640),
+            'click_ocr_height': self.get('capture.click_ocr_height', 160),
+            'click_full_frame_ocr': self.get('capture.click_full_frame_ocr', True),
+            'enable_window_events': self.get('capture.enable_window_events', True),
+            'window_poll_interval': self.get('capture.window_poll_interval', 0.5),
+            'enable_load_throttle': self.get('capture.enable_load_throttle', True),
+            'ocr_reduce_cpu': self.get('capture.ocr_reduce_cpu', 65),
+            'ocr_defer_cpu': self.get('capture.ocr_defer_cpu', 85),
+            'ocr_timing': self.get('capture.ocr_timing', 'realtime'),
+            'ocr_idle_after': self.get('capture.ocr_idle_after', 60),
+            'ocr_batch_size': self.get('capture.ocr_batch_size', 8),
+            'ocr_low_priority': self.get('capture.ocr_low_priority', True),
+            'auto_ocr_language': self.get('capture.auto_ocr_language', True)
         }
         
     def get_notification_settings(self) -> Dict[str, Any]:
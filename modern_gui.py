@@ -25,7 +25,7 @@ from PySide6.QtGui import *
 import qtawesome as qta
 
 # 导入现有的核心模块
-from activity_retriever import ActivityRetriever, load_and_index_activity_data, get_all_activity_records, get_application_usage_summary
+from activity_retriever import ActivityRetriever, load_and_index_activity_data, rebuild_activity_index, get_all_activity_records, get_application_usage_summary, search_activity_keyword
 from llm_service import LLMService
 from screen_capture import init_db, record_screen_activity
 from gui_config import gui_config
@@ -33,6 +33,26 @@ from gui_config import gui_config
 # 导入现代化样式库
 from modern_ui_styles import *
 
+def load_screenshot_pixmap(path, max_width=740, max_height=260):
+    """加载截图为QPixmap，支持PNG/WebP/JPEG；Qt缺少对应图像插件时改用Pillow解码"""
+    if not path or not os.path.exists(path):
+        return None
+    pixmap = QPixmap(path)
+    if pixmap.isNull():
+        try:
+            from PIL import Image
+            with Image.open(path) as img:
+                img = img.convert('RGBA')
+                data = img.tobytes('raw', 'RGBA')
+                qimage = QImage(data, img.width, img.height, img.width * 4, QImage.Format_RGBA8888).copy()
+            pixmap = QPixmap.fromImage(qimage)
+        except Exception as e:
+            print(f"加载截图失败: {e}")
+            return None
+    if pixmap.width() > max_width or pixmap.height() > max_height:
+        pixmap = pixmap.scaled(max_width, max_height, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+    return pixmap
+
 class AsyncRunner(QObject):
     """异步任务运行器"""
     finished = Signal(object)
@@ -59,6 +79,57 @@ class AsyncRunner(QObject):
         thread.daemon = True
         thread.start()
 
+class IndexingWorker(QObject):
+    """
+    后台索引线程：在GUI线程之外调用 load_and_index_activity_data()（计算向量耗时较长）。
+    同一时间只运行一轮；运行期间收到的请求合并为结束后的一轮。进度和结果通过信号通知界面。
+    """
+    started = Signal()
+    progress = Signal(int, int)  # 本轮已处理记录数, 本轮待处理记录数
+    finished = Signal(int)       # 本轮新索引的记录数
+    error = Signal(str)
+
+    def __init__(self):
+        super().__init__()
+        self._requested = threading.Event()
+        self._stopping = threading.Event()
+        self._rebuild = False
+        self._busy = False
+        self._thread = threading.Thread(target=self._run, name="activity-indexer", daemon=True)
+        self._thread.start()
+
+    def request(self, rebuild: bool = False):
+        """请求一轮索引（rebuild=True 时全量重建）；正在运行时只登记，结束后再运行一轮"""
+        if rebuild:
+            self._rebuild = True
+        self._requested.set()
+
+    def is_busy(self) -> bool:
+        return self._busy
+
+    def stop(self, timeout: float = 5.0):
+        """停止后台线程，最多等待正在进行的一轮 timeout 秒（游标按页持久化，未完成的部分下次启动后继续）"""
+        self._stopping.set()
+        self._requested.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            self._requested.wait()
+            if self._stopping.is_set():
+                break
+            self._requested.clear()
+            rebuild, self._rebuild = self._rebuild, False
+            self._busy = True
+            self.started.emit()
+            try:
+                index = rebuild_activity_index if rebuild else load_and_index_activity_data
+                self.finished.emit(index(progress=self.progress.emit))
+            except Exception as e:
+                self.error.emit(str(e))
+            finally:
+                self._busy = False
+
 class ModernChatWidget(GlassCard):
     """现代化聊天界面组件"""
     def __init__(self, parent=None):
@@ -454,6 +525,7 @@ class ModernRecordsWidget(GlassCard):
     """现代化记录页面"""
     def __init__(self, parent=None):
         super().__init__(parent)
+        self.records = []  # 当前表格中显示的记录
         # 确保背景正确显示
         self.setStyleSheet(f"""
             ModernRecordsWidget {{
@@ -490,6 +562,29 @@ class ModernRecordsWidget(GlassCard):
         title_layout.addWidget(title)
         title_layout.addStretch()
         
+        # 关键词搜索框（SQLite全文索引，无需加载嵌入模型）
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("搜索OCR文本或窗口标题，回车搜索")
+        self.search_input.setClearButtonEnabled(True)
+        self.search_input.setMinimumWidth(280)
+        self.search_input.setStyleSheet(f"""
+            QLineEdit {{
+                background: rgba(248, 249, 250, 0.8);
+                border: 1px solid rgba(0, 0, 0, 0.1);
+                border-radius: 15px;
+                padding: 8px 14px;
+                font-size: 14px;
+                color: {ModernStyles.COLORS['text_primary']};
+            }}
+            QLineEdit:focus {{
+                border-color: {ModernStyles.COLORS['accent_blue']};
+                background: rgba(255, 255, 255, 0.9);
+            }}
+        """)
+        self.search_input.returnPressed.connect(self.load_records)
+        self.search_input.textChanged.connect(self.on_search_text_changed)
+        title_layout.addWidget(self.search_input)
+        
         # 刷新按钮 - 修复图标显示
         refresh_btn = ModernButton("刷新", qta.icon('fa5s.sync-alt', color='#007bff'), "glass")
         refresh_btn.clicked.connect(self.load_records)
@@ -541,6 +636,11 @@ class ModernRecordsWidget(GlassCard):
         table_layout.addWidget(self.table)
         layout.addWidget(table_container)
         
+    def on_search_text_changed(self, text):
+        """清空搜索框时恢复显示最新记录"""
+        if not text.strip():
+            self.load_records(silent=True)
+    
     def on_cell_double_clicked(self, row, column):
         """处理单元格双击事件"""
         if column == 4:  # OCR文本列
@@ -549,12 +649,11 @@ class ModernRecordsWidget(GlassCard):
     def show_full_ocr_content(self, row):
         """显示完整的OCR内容和相关信息"""
         try:
-            # 获取当前记录的完整信息
-            records = get_all_activity_records(limit=50)
-            if row >= len(records):
+            # 获取当前表格中显示的记录
+            if row >= len(self.records):
                 return
                 
-            record = records[row]
+            record = self.records[row]
             
             # 创建对话框
             dialog = QDialog(self)
@@ -640,6 +739,16 @@ class ModernRecordsWidget(GlassCard):
             info_layout.addWidget(info_label)
             layout.addWidget(info_card)
             
+            # 截图预览（如果截图文件存在）
+            pixmap = load_screenshot_pixmap(record.get('screenshot_path'))
+            if pixmap is not None:
+                screenshot_label = QLabel()
+                screenshot_label.setPixmap(pixmap)
+                screenshot_label.setAlignment(Qt.AlignCenter)
+                screenshot_label.setToolTip(record.get('screenshot_path', ''))
+                screenshot_label.setStyleSheet("background: transparent; border: none;")
+                layout.addWidget(screenshot_label)
+            
             # OCR文本内容
             ocr_label = QLabel("📝 OCR识别内容:")
             ocr_label.setStyleSheet(f"""
@@ -707,12 +816,20 @@ class ModernRecordsWidget(GlassCard):
             # 清空现有数据
             self.table.setRowCount(0)
             
-            # 重新加载数据
-            records = get_all_activity_records(limit=50)
+            # 重新加载数据：有搜索关键词时显示全文检索结果，否则显示最新记录
+            keyword = self.search_input.text().strip()
+            if keyword:
+                records = search_activity_keyword(keyword, limit=100)
+            else:
+                records = get_all_activity_records(limit=50)
+            self.records = records
             self.table.setRowCount(len(records))
             
             if not silent:
-                print(f"📋 加载了 {len(records)} 条记录")  # 调试信息
+                if keyword:
+                    print(f"🔍 关键词 '{keyword}' 找到 {len(records)} 条记录")
+                else:
+                    print(f"📋 加载了 {len(records)} 条记录")  # 调试信息
             
             # 应用图标映射
             app_icons = {
@@ -733,6 +850,7 @@ class ModernRecordsWidget(GlassCard):
             # 类型颜色映射
             type_colors = {
                 'screen_content': '#28a745',
+                'screen_unchanged': '#20c997',
                 'window_change': '#17a2b8',
                 'app_usage': '#fd7e14',
                 'default': '#6c757d'
@@ -783,14 +901,14 @@ class ModernRecordsWidget(GlassCard):
                 type_color = type_colors.get(record_type, type_colors['default'])
                 
                 # 添加圆点前缀表示类型
-                type_indicator = "🟢" if record_type == 'screen_content' else "🔵" if record_type == 'window_change' else "🟠" if record_type == 'app_usage' else "⚪"
+                type_indicator = "🟢" if record_type in ('screen_content', 'screen_unchanged') else "🔵" if record_type == 'window_change' else "🟠" if record_type == 'app_usage' else "⚪"
                 
                 type_item = QTableWidgetItem(f"{type_indicator} {record_type}")
                 type_item.setForeground(QColor(type_color))
                 self.table.setItem(row, 3, type_item)
                 
-                # OCR文本列
-                ocr_text = record.get('ocr_text', '')
+                # OCR文本列（搜索结果显示带高亮的匹配片段）
+                ocr_text = record.get('snippet') or record.get('ocr_text') or ''
                 if len(ocr_text) > 100:
                     ocr_text = ocr_text[:100] + "..."
                 
@@ -800,7 +918,7 @@ class ModernRecordsWidget(GlassCard):
                 tooltip_parts = []
                 
                 # 添加完整OCR文本
-                full_ocr = record.get('ocr_text', '')
+                full_ocr = record.get('ocr_text') or ''
                 if full_ocr:
                     tooltip_parts.append(f"OCR内容:\n{full_ocr}")
                 
@@ -1603,6 +1721,10 @@ class ModernSettingsWidget(GlassCard):
         load_btn.clicked.connect(self.load_data)
         buttons_layout.addWidget(load_btn)
         
+        rebuild_btn = ModernButton("重建索引", qta.icon('fa5s.sync-alt', color='white'), "glass")
+        rebuild_btn.clicked.connect(self.rebuild_index)
+        buttons_layout.addWidget(rebuild_btn)
+        
         clear_btn = ModernButton("清空数据", qta.icon('fa5s.trash', color='#ff3b30'), "glass")
         clear_btn.clicked.connect(self.clear_data)
         clear_btn.setStyleSheet(f"""
@@ -1764,17 +1886,32 @@ class ModernSettingsWidget(GlassCard):
             main_window = self.get_main_window()
             if main_window and hasattr(main_window, 'auto_refresh_data'):
                 main_window.auto_refresh_data()
-                QMessageBox.information(self, "成功", "数据已刷新！")
+                QMessageBox.information(self, "成功", "已开始在后台刷新，完成后界面会自动更新。")
         except Exception as e:
             QMessageBox.warning(self, "错误", f"刷新失败: {e}")
             
     def load_data(self):
-        """加载数据"""
-        try:
-            count = load_and_index_activity_data()
-            QMessageBox.information(self, "成功", f"已加载 {count} 条新记录到向量数据库")
-        except Exception as e:
-            QMessageBox.critical(self, "错误", f"加载数据失败: {e}")
+        """加载数据（在后台索引线程中进行，不阻塞界面）"""
+        main_window = self.get_main_window()
+        if main_window is None or not hasattr(main_window, 'indexing_worker'):
+            QMessageBox.critical(self, "错误", "加载数据失败: 未找到主窗口")
+            return
+        main_window.indexing_worker.request()
+        QMessageBox.information(self, "提示", "已开始在后台加载新记录到向量数据库，进度显示在左下角状态栏。")
+            
+    def rebuild_index(self):
+        """全量重建向量索引（清空向量集合后在后台重新索引全部记录）"""
+        reply = QMessageBox.question(
+            self, "确认",
+            "重建索引会清空向量数据库并重新计算全部记录的向量，耗时较长。确定继续吗？",
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.No
+        )
+        if reply != QMessageBox.Yes:
+            return
+        main_window = self.get_main_window()
+        if main_window is not None and hasattr(main_window, 'indexing_worker'):
+            main_window.indexing_worker.request(rebuild=True)
             
     def clear_data(self):
         """清空数据"""
@@ -2282,8 +2419,9 @@ class ModernMainWindow(QMainWindow):
             }}
         """)
         
-        # 状态文字
+        # 状态文字（后台索引时显示进度）
         status_text = QLabel("就绪")
+        self.status_text = status_text
         status_text.setStyleSheet(f"""
             QLabel {{
                 background: transparent;
@@ -2358,74 +2496,69 @@ class ModernMainWindow(QMainWindow):
             self.showNormal()
             
     def setup_auto_refresh(self):
-        """设置自动刷新"""
+        """设置自动刷新（定时器只发出索引请求，索引本身在后台线程中进行）"""
+        self.indexing_worker = IndexingWorker()
+        self.indexing_worker.progress.connect(self.on_indexing_progress)
+        self.indexing_worker.finished.connect(self.on_indexing_finished)
+        self.indexing_worker.error.connect(self.on_indexing_error)
+
         self.refresh_timer = QTimer()
         self.refresh_timer.timeout.connect(self.auto_refresh_data)
         
         if gui_config.get('ui.auto_refresh', True):
             interval = gui_config.get('ui.refresh_interval', 30) * 1000
             self.refresh_timer.start(interval)
+        if gui_config.get('data.auto_load_on_startup', True):
+            self.indexing_worker.request()
             
     def setup_screen_recording(self):
-        """设置屏幕录制"""
-        import threading
-        
-        self.recording_running = True  # 控制录制状态
-        
-        def run_screen_recording():
-            """在后台线程运行屏幕录制"""
-            try:
-                import time
-                from screen_capture import record_screen_activity
-                
-                print("🎬 屏幕录制服务已启动")
-                
-                # 主录制循环
-                while hasattr(self, 'recording_running') and self.recording_running:
-                    try:
-                        record_screen_activity(triggered_by="timer")
-                        time.sleep(30)  # 每30秒记录一次（更频繁）
-                    except Exception as e:
-                        print(f"屏幕录制错误: {e}")
-                        time.sleep(60)
-                        
-                print("🛑 屏幕录制服务已停止")
-                        
-            except Exception as e:
-                print(f"屏幕录制服务启动失败: {e}")
-        
-        # 在后台线程启动屏幕录制
-        self.recording_thread = threading.Thread(target=run_screen_recording, daemon=True)
-        self.recording_thread.start()
+        """设置屏幕录制（定时/点击采集、输入监听、OCR进程池都由 CaptureService 统一管理）"""
+        try:
+            from screen_capture import CaptureService
+            
+            if getattr(self, 'capture_service', None) is None:
+                self.capture_service = CaptureService()
+            self.capture_service.start()
+            print("🎬 屏幕录制服务已启动")
+        except Exception as e:
+            print(f"屏幕录制服务启动失败: {e}")
     
     def stop_screen_recording(self):
         """停止屏幕录制"""
-        if hasattr(self, 'recording_running'):
-            self.recording_running = False
+        if getattr(self, 'capture_service', None) is not None:
             print("🔄 正在停止屏幕录制服务...")
-            
+            self.capture_service.stop()
+            print("🛑 屏幕录制服务已停止")
+            
+    def shutdown_screen_recording(self):
+        """退出程序时停止屏幕录制：等待已提交的OCR回填完成（最多 EXIT_OCR_TIMEOUT 秒），
+        未完成的记录转为延后OCR任务，下次启动后补做；不能留给后台线程，进程退出时它会被直接终止"""
+        if getattr(self, 'capture_service', None) is not None:
+            from screen_capture import EXIT_OCR_TIMEOUT
+            print("🔄 正在停止屏幕录制服务并保存OCR结果...")
+            self.capture_service.stop(wait_for_ocr=True, ocr_timeout=EXIT_OCR_TIMEOUT)
+            print("🛑 屏幕录制服务已停止")
+
     def auto_refresh_data(self):
-        """自动刷新数据"""
-        try:
-            # 只有当有新数据时才刷新
-            count = load_and_index_activity_data()
-            
-            if count > 0:
-                print(f"🔄 自动刷新：发现 {count} 条新记录，正在更新界面...")
-                
-                # 只在有新数据时才刷新界面
-                self.stats_widget.load_today_stats()
-                self.records_widget.load_records(silent=True)  # 静默加载，避免重复日志
-                
-                # 强制刷新当前显示的界面
-                self.repaint()
-                QApplication.processEvents()
-            else:
-                # 静默检查，不输出日志
-                pass
-                
-        except Exception as e:
-            print(f"❌ 自动刷新失败: {e}")
+        """自动刷新数据：请求后台索引一轮，完成后在 on_indexing_finished 中刷新界面"""
+        self.indexing_worker.request()
+
+    def on_indexing_progress(self, done, total):
+        if total:
+            self.status_text.setText(f"索引中 {done}/{total}")
+
+    def on_indexing_finished(self, count):
+        self.status_text.setText("就绪")
+        if count > 0:
+            print(f"🔄 自动刷新：发现 {count} 条新记录，正在更新界面...")
+            
+            # 只在有新数据时才刷新界面
+            self.stats_widget.load_today_stats()
+            self.records_widget.load_records(silent=True)  # 静默加载，避免重复日志
+
+    def on_indexing_error(self, message):
+        self.status_text.setText("就绪")
+        print(f"❌ 自动刷新失败: {message}")
             
     def closeEvent(self, event):
         """关闭事件"""
@@ -2445,6 +2578,8 @@ def main():
     
     window = ModernMainWindow()
     window.show()
+    app.aboutToQuit.connect(window.shutdown_screen_recording)
+    app.aboutToQuit.connect(window.indexing_worker.stop)
     
     return app.exec()
 
@@ -1,4 +1,6 @@
 # screen_capture.py
+import atexit
+import hashlib
 import logging
 import os
 import re
@@ -8,7 +10,11 @@ import json
 import threading
 from datetime import datetime
 from threading import Thread, Lock
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import queue
+from collections import OrderedDict
+from urllib.parse import urlsplit
 import pytesseract
 from typing import Optional, List, Dict, Any
 
@@ -35,6 +41,13 @@ try:
 except ImportError:
     logging.warning("uiautomation 未安装或不可用。将无法从浏览器获取URL。")
 
+PSUTIL_AVAILABLE = False
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    logging.warning("psutil 未安装。OCR将无法根据系统负载限流。")
+
 try:
     from pynput import mouse, keyboard
 except ImportError:
@@ -43,6 +56,7 @@ except ImportError:
     keyboard = None
 
 import mss
+import numpy as np
 from PIL import Image
 
 # --- 全局变量和配置 ---
@@ -51,6 +65,7 @@ try:
     from gui_config import gui_config
     SCREENSHOT_DIR = gui_config.get('paths.screenshot_directory', 'screen_recordings')
 except ImportError:
+    gui_config = None
     SCREENSHOT_DIR = "screen_recordings"
 
 DATABASE_FILE = os.path.join(SCREENSHOT_DIR, "activity_log.db")
@@ -67,23 +82,114 @@ except:
 
 # --- 初始化锁 ---
 record_file_lock = threading.Lock()
-db_connection_lock = Lock()
-click_queue = queue.Queue()
 
 # 全局鼠标控制器
 mouse_controller = None
 
+def get_capture_setting(name: str, default: Any = None) -> Any:
+    """读取 capture.* 配置项（每次实时读取，GUI中修改后立即生效）"""
+    if gui_config is None:
+        return default
+    return gui_config.get(f'capture.{name}', default)
+
+# 点击采集任务队列（有界，满时丢弃新点击并计数）
+click_queue = queue.Queue(maxsize=max(1, int(get_capture_setting('click_queue_depth', 32))))
+
+# --- 重复帧去重 ---
+MAX_TRACKED_WINDOWS = 64 # 最多记住多少个窗口的上一帧
+
+# 每个窗口 (app_name, window_title) 最近一次完整记录的帧信息
+_last_frames = OrderedDict()
+_last_frames_lock = Lock()
+
+class Frame:
+    """一帧屏幕图像：持有 mss 的原始BGRA缓冲区，按需提供零拷贝的NumPy视图和PIL图像（不经过PNG编解码）"""
+
+    def __init__(self, shot=None, image: Optional[Image.Image] = None, left: int = 0, top: int = 0):
+        self._shot = shot
+        self._image = image
+        self._array = None
+        if shot is not None:
+            self.left, self.top = shot.left, shot.top
+            self.size = tuple(shot.size)
+        else:
+            self.left, self.top = left, top
+            self.size = image.size
+
+    @property
+    def geometry(self) -> tuple:
+        """(left, top, width, height)，坐标为虚拟桌面坐标"""
+        return (self.left, self.top) + tuple(self.size)
+
+    @classmethod
+    def from_image(cls, image: Image.Image, left: int = 0, top: int = 0) -> 'Frame':
+        """把已解码的PIL图像包装成Frame（用于回放和基准测试）"""
+        return cls(image=image.convert('RGB'), left=left, top=top)
+
+    @property
+    def array(self) -> np.ndarray:
+        """(height, width, 4) 的 uint8 视图；来自 mss 时直接引用其缓冲区，不复制"""
+        if self._array is None:
+            width, height = self.size
+            if self._shot is not None:
+                self._array = np.frombuffer(self._shot.raw, dtype=np.uint8).reshape(height, width, 4)
+            else:
+                self._array = np.asarray(self._image.convert('RGBA'))
+        return self._array
+
+    @property
+    def image(self) -> Image.Image:
+        """RGB 的PIL图像，首次访问时从原始缓冲区解码（仅一次内存拷贝）"""
+        if self._image is None:
+            self._image = Image.frombuffer('RGB', self.size, self._shot.raw, 'raw', 'BGRX', 0, 1)
+        return self._image
+
+def as_frame(frame_or_image) -> Frame:
+    return frame_or_image if isinstance(frame_or_image, Frame) else Frame.from_image(frame_or_image)
+
+def compute_frame_hash(frame_or_image) -> bytes:
+    """帧内容摘要（blake2b，覆盖尺寸和全部像素）。只有像素完全相同的帧摘要才相同：
+    整屏的感知哈希对新增一行文字、时钟变化这类小改动几乎不敏感，会把有新文本的帧误判为重复"""
+    frame = as_frame(frame_or_image)
+    digest = hashlib.blake2b(repr(frame.geometry).encode(), digest_size=16)
+    digest.update(np.ascontiguousarray(frame.array).data)
+    return digest.digest()
+
+def find_duplicate_frame(window_key, frame_hash: bytes) -> Optional[Dict[str, Any]]:
+    """如果该窗口上一帧与当前帧内容完全相同，返回上一帧的记录信息，否则返回None"""
+    if not get_capture_setting('enable_dedup', True):
+        return None
+    with _last_frames_lock:
+        previous = _last_frames.get(window_key)
+        if previous is None or previous['hash'] != frame_hash:
+            return None
+        _last_frames.move_to_end(window_key)
+        return dict(previous)
+
+def remember_frame(window_key, frame_hash: bytes, record_id: Optional[int], screenshot_path: str, url: str) -> None:
+    """记录该窗口最近一次完整处理（截图+OCR）的帧"""
+    with _last_frames_lock:
+        _last_frames[window_key] = {
+            "hash": frame_hash,
+            "record_id": record_id,
+            "screenshot_path": screenshot_path,
+            "url": url,
+        }
+        _last_frames.move_to_end(window_key)
+        while len(_last_frames) > MAX_TRACKED_WINDOWS:
+            _last_frames.popitem(last=False)
+
 # --- Tesseract OCR 函数 ---
-def extract_text_with_tesseract(image_path: str) -> str:
-    """使用Tesseract-OCR从截图中提取文本"""
+def extract_text_with_tesseract(image_path, lang: str = 'chi_sim+eng') -> str:
+    """使用Tesseract-OCR从截图中提取文本（接受文件路径或已解码的PIL图像）"""
     try:
         # 打开图像
-        image = Image.open(image_path)
+        image = image_path if isinstance(image_path, Image.Image) else Image.open(image_path)
         
         # 使用Tesseract进行OCR识别，支持中文和英文
         ocr_text = pytesseract.image_to_string(
             image, 
-            lang='chi_sim+eng',  # 中文简体+英文
+            lang=lang,           # 默认中文简体+英文，可按窗口选择更快的单语言模型
             config='--psm 6'     # 页面分割模式6：统一的文本块
         )
         
@@ -101,6 +207,377 @@ def extract_text_with_tesseract(image_path: str) -> str:
         logging.error(f"Tesseract OCR 处理失败: {e}")
         return f"OCR处理失败: {str(e)}"
 
+# --- 分块增量OCR ---
+TILE_SIZE = 256      # 分块边长（像素）
+TILE_PADDING = 12    # 对脏区域OCR时向外扩展的像素，避免切断边缘文字
+
+def ocr_words(image: Image.Image, lang: str = 'chi_sim+eng', offset=(0, 0)) -> List[tuple]:
+    """对图像（区域）做OCR，返回 (left, top, width, height, text) 单词列表，坐标已换算为整帧坐标"""
+    data = pytesseract.image_to_data(
+        image,
+        lang=lang,
+        config='--psm 6',
+        output_type=pytesseract.Output.DICT
+    )
+    offset_x, offset_y = offset
+    words = []
+    for i, text in enumerate(data['text']):
+        text = text.strip()
+        if not text:
+            continue
+        words.append((data['left'][i] + offset_x, data['top'][i] + offset_y,
+                      data['width'][i], data['height'][i], text))
+    return words
+
+def assemble_words(words: List[tuple]) -> str:
+    """按阅读顺序拼接单词：先按垂直中心聚成行，行内再按横坐标排序"""
+    lines = []
+    for word in sorted(words, key=lambda w: (w[1] + w[3] / 2, w[0])):
+        center = word[1] + word[3] / 2
+        if lines and abs(center - lines[-1]['center']) <= max(lines[-1]['height'], word[3]) / 2:
+            lines[-1]['words'].append(word)
+        else:
+            lines.append({'center': center, 'height': word[3], 'words': [word]})
+    return ' '.join(
+        ' '.join(w[4] for w in sorted(line['words'], key=lambda w: w[0]))
+        for line in lines
+    )
+
+class TileOCRCache:
+    """分块OCR缓存：把帧切成固定网格并对每块做哈希，只对变化的块重新OCR，未变化块复用缓存文本
+
+    plan() 在采集线程中按提交顺序调用，与上一次提交的帧比较；apply() 按相同顺序写回OCR结果，
+    因此OCR本身可以在其他进程中并行执行。
+    """
+
+    def __init__(self, tile_size: int = TILE_SIZE, padding: int = TILE_PADDING):
+        self.tile_size = tile_size
+        self.padding = padding
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        """清空缓存，下一帧将整帧OCR"""
+        self.frame_geometry = None  # 最近一次 plan() 的帧位置和尺寸
+        self.tile_hashes = {}    # 最近一次 plan() 的 (row, col) -> 分块内容摘要
+        self.words_geometry = None  # tile_words 对应的帧位置和尺寸
+        self.tile_words = {}     # (row, col) -> 中心落在该块内的单词列表
+
+    def tile_grid(self, size) -> tuple:
+        width, height = size
+        return (height + self.tile_size - 1) // self.tile_size, (width + self.tile_size - 1) // self.tile_size
+
+    def tile_box(self, row: int, col: int, size) -> tuple:
+        width, height = size
+        left, top = col * self.tile_size, row * self.tile_size
+        return left, top, min(left + self.tile_size, width), min(top + self.tile_size, height)
+
+    def compute_tile_hashes(self, frame: Frame) -> Dict[tuple, bytes]:
+        array = frame.array
+        rows, cols = self.tile_grid(frame.size)
+        hashes = {}
+        for row in range(rows):
+            for col in range(cols):
+                left, top, right, bottom = self.tile_box(row, col, frame.size)
+                tile = np.ascontiguousarray(array[top:bottom, left:right])
+                hashes[(row, col)] = hashlib.blake2b(tile.data, digest_size=16).digest()
+        return hashes
+
+    def plan(self, frame) -> tuple:
+        """与上一次提交的帧比较，返回 (变化的块集合, 需要OCR的矩形列表)。尺寸变化或首帧时所有块都视为变化"""
+        frame = as_frame(frame)
+        hashes = self.compute_tile_hashes(frame)
+        with self.lock:
+            if self.frame_geometry != frame.geometry:
+                dirty = set(hashes)
+            else:
+                dirty = {key for key, digest in hashes.items() if self.tile_hashes.get(key) != digest}
+            self.frame_geometry = frame.geometry
+            self.tile_hashes = hashes
+        return dirty, self.dirty_rects(dirty, frame.size) if dirty else []
+
+    def dirty_rects(self, dirty_tiles, size) -> List[tuple]:
+        """把变化的块合并成矩形：先合并每行中连续的块，再把列范围相同的相邻行合并"""
+        runs = []
+        for row in sorted({r for r, _ in dirty_tiles}):
+            cols = sorted(c for r, c in dirty_tiles if r == row)
+            start = prev = cols[0]
+            for col in cols[1:] + [None]:
+                if col is not None and col == prev + 1:
+                    prev = col
+                    continue
+                runs.append([row, row, start, prev])
+                if col is not None:
+                    start = prev = col
+
+        merged = []
+        for run in runs:
+            for rect in merged:
+                if rect[1] == run[0] - 1 and rect[2] == run[2] and rect[3] == run[3]:
+                    rect[1] = run[0]
+                    break
+            else:
+                merged.append(run)
+
+        width, height = size
+        rects = []
+        for row_start, row_end, col_start, col_end in merged:
+            left, top, _, _ = self.tile_box(row_start, col_start, size)
+            _, _, right, bottom = self.tile_box(row_end, col_end, size)
+            rects.append((max(0, left - self.padding), max(0, top - self.padding),
+                          min(width, right + self.padding), min(height, bottom + self.padding)))
+        return rects
+
+    def apply(self, geometry, dirty_tiles, words: List[tuple]) -> str:
+        """用脏区域的OCR结果更新缓存并拼出整帧文本"""
+        with self.lock:
+            if self.words_geometry != geometry:
+                self.tile_words = {}
+                self.words_geometry = geometry
+            for key in dirty_tiles:
+                self.tile_words[key] = []
+            for word in words:
+                key = (int((word[1] + word[3] / 2) // self.tile_size), int((word[0] + word[2] / 2) // self.tile_size))
+                if key in dirty_tiles:
+                    self.tile_words[key].append(word)
+            return assemble_words([w for tile in self.tile_words.values() for w in tile])
+
+    def invalidate(self, dirty_tiles):
+        """某帧OCR失败：丢弃这些块的缓存文本，并让下一帧重新整帧识别"""
+        with self.lock:
+            for key in dirty_tiles:
+                self.tile_words[key] = []
+            self.frame_geometry = None
+            self.tile_hashes = {}
+
+    def extract_text(self, frame, lang: str = 'chi_sim+eng') -> str:
+        """增量OCR：只识别变化区域，返回整帧文本"""
+        frame = as_frame(frame)
+        dirty, rects = self.plan(frame)
+        try:
+            words = []
+            if rects:
+                logging.info(f"分块OCR: {len(dirty)} 个分块发生变化，合并为 {len(rects)} 个区域")
+                for rect in rects:
+                    words.extend(ocr_words(frame.image.crop(rect), lang=lang, offset=rect[:2]))
+        except Exception:
+            self.invalidate(dirty)
+            raise
+        return self.apply(frame.geometry, dirty, words)
+
+tile_ocr_cache = TileOCRCache()
+
+def extract_text_incremental(frame, lang: str = 'chi_sim+eng') -> str:
+    """使用分块缓存进行增量OCR，输出格式与 extract_text_with_tesseract 保持一致"""
+    text = tile_ocr_cache.extract_text(frame, lang=lang)
+    if text.strip():
+        logging.info(f"分块OCR 完成，文本长度: {len(text)}")
+        return text
+    logging.info("分块OCR 未检测到任何文本")
+    return "未检测到文本内容"
+
+# --- OCR语言选择 ---
+DEFAULT_OCR_LANG = 'chi_sim+eng'
+CJK_PATTERN = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]')
+LATIN_PATTERN = re.compile(r'[A-Za-z]')
+LANG_REPROBE_FRAMES = 10  # 使用单语言模型识别多少帧后，重新用中英双语模型探测一次
+OCR_PLACEHOLDER_TEXTS = ("未检测到文本内容", "OCR处理失败", "OCR失败")
+
+def detect_ocr_language(text: str) -> str:
+    """根据一次中英双语OCR的结果判断该窗口需要的语言模型：无中文用 eng，无英文字母用 chi_sim，否则两者都用"""
+    cjk = len(CJK_PATTERN.findall(text))
+    latin = len(LATIN_PATTERN.findall(text))
+    if cjk == 0:
+        return 'eng'
+    if latin == 0:
+        return 'chi_sim'
+    return DEFAULT_OCR_LANG
+
+class OCRLanguageSelector:
+    """
+    按窗口缓存OCR语言选择：新窗口先用中英双语模型识别，再根据识别结果改用更快的单语言模型，
+    每隔 LANG_REPROBE_FRAMES 帧重新探测一次；窗口标题含中文时不使用纯英文模型。
+    窗口标题未见过时沿用同一应用的选择（浏览器等应用的标题变化频繁）。
+    """
+
+    def __init__(self, reprobe_frames: int = LANG_REPROBE_FRAMES, max_windows: int = MAX_TRACKED_WINDOWS):
+        self.reprobe_frames = reprobe_frames
+        self.max_windows = max_windows
+        self._choices = OrderedDict()  # (app_name, window_title) 或 (app_name, None) -> [lang, 自上次探测以来的帧数]
+        self._lock = Lock()
+
+    def choose(self, window_key) -> str:
+        if window_key is None or not get_capture_setting('auto_ocr_language', True):
+            return DEFAULT_OCR_LANG
+        app_name, window_title = window_key
+        with self._lock:
+            entry = self._choices.get(window_key) or self._choices.get((app_name, None))
+            if entry is None or entry[1] >= self.reprobe_frames:
+                return DEFAULT_OCR_LANG
+            if entry[0] == 'eng' and window_title and CJK_PATTERN.search(window_title):
+                return DEFAULT_OCR_LANG
+            return entry[0]
+
+    def observe(self, window_key, lang: str, text: str):
+        """记录一次OCR结果：双语识别的结果用于更新选择，单语言识别只计数"""
+        if window_key is None or not text or text.startswith(OCR_PLACEHOLDER_TEXTS):
+            return
+        with self._lock:
+            for key in (window_key, (window_key[0], None)):
+                if lang == DEFAULT_OCR_LANG:
+                    self._choices[key] = [detect_ocr_language(text), 0]
+                elif key in self._choices:
+                    self._choices[key][1] += 1
+                else:
+                    continue
+                self._choices.move_to_end(key)
+            while len(self._choices) > self.max_windows:
+                self._choices.popitem(last=False)
+
+ocr_language_selector = OCRLanguageSelector()
+
+# --- 滚动检测 ---
+SCROLL_MIN_SHIFT = 8        # 位移小于该值（像素）不按滚动处理
+SCROLL_MIN_ANCHORS = 12     # 至少需要多少个内容唯一的行支持同一位移
+SCROLL_MATCH_RATIO = 0.9    # 滚动区域内错位后相同的行、以及区域外保持不变的行所占比例下限
+SCROLL_EDGE_MARGIN = 24     # 计算行特征时忽略窗口右侧的宽度（滚动条滑块会随滚动移动）
+SCROLL_MAX_TEXT = 20000     # 滚动累积文本的最大长度，超过后从较早读过的一端截断
+_ROW_WEIGHTS = np.random.default_rng(20240601).integers(1, 2 ** 31, size=4096, dtype=np.int64)
+
+def scroll_columns(frame: Frame, window_rect: Optional[tuple] = None) -> tuple:
+    """参与滚动检测的列范围（帧内坐标）：前台窗口的横向范围，未知时为整帧宽度"""
+    width = frame.size[0]
+    if window_rect:
+        left = min(max(0, window_rect[0] - frame.left), width)
+        right = min(max(0, window_rect[2] - frame.left), width)
+        if right - left >= MIN_WINDOW_CAPTURE_SIZE:
+            return left, right
+    return 0, width
+
+def row_signatures(frame: Frame, columns: tuple) -> np.ndarray:
+    """每行一个整数特征（绿色通道与固定随机权重的点积）：同样内容的行在不同帧、不同高度得到相同的值"""
+    left, right = columns
+    right = max(left + 1, right - SCROLL_EDGE_MARGIN)
+    gray = frame.array[:, left:right, 1]
+    return gray.astype(np.int64) @ np.resize(_ROW_WEIGHTS, gray.shape[1])
+
+def detect_scroll_offset(previous: np.ndarray, current: np.ndarray) -> Optional[tuple]:
+    """
+    比较两帧的行特征，检测纵向滚动。只用上一帧中内容唯一的行作为锚点，出现最多的非零位移即为滚动量。
+    返回 (位移, (新露出区域的起始行, 结束行))，位移为正表示向下滚动（内容上移）；未检测到滚动时返回None。
+    """
+    height = len(current)
+    if len(previous) != height:
+        return None
+    values, first_rows, counts = np.unique(previous, return_index=True, return_counts=True)
+    anchor_values, anchor_rows = values[counts == 1], first_rows[counts == 1]
+    if len(anchor_values) < SCROLL_MIN_ANCHORS:
+        return None
+    positions = np.minimum(np.searchsorted(anchor_values, current), len(anchor_values) - 1)
+    found = anchor_values[positions] == current
+    rows = np.nonzero(found)[0]
+    shifts = anchor_rows[positions[found]] - rows
+    moving = shifts[shifts != 0]
+    if len(moving) < SCROLL_MIN_ANCHORS:
+        return None
+    candidates, votes = np.unique(moving, return_counts=True)
+    shift = int(candidates[np.argmax(votes)])
+    if abs(shift) < SCROLL_MIN_SHIFT or votes.max() < SCROLL_MIN_ANCHORS:
+        return None
+
+    # 滚动区域：支持该位移的锚点行范围，再向两端扩展到第一处不一致为止（纯色行不是锚点）
+    matches = np.zeros(height, dtype=bool)
+    lo, hi = max(0, -shift), min(height, height - shift)
+    matches[lo:hi] = previous[lo + shift:hi + shift] == current[lo:hi]
+    anchors = rows[shifts == shift]
+    first, last = int(anchors.min()), int(anchors.max())
+    if matches[first:last + 1].mean() < SCROLL_MATCH_RATIO:
+        return None
+    while first > lo and matches[first - 1]:
+        first -= 1
+    while last + 1 < hi and matches[last + 1]:
+        last += 1
+
+    strip = (last + 1, min(height, last + 1 + shift)) if shift > 0 else (max(0, first + shift), first)
+    if strip[1] <= strip[0]:
+        return None
+    # 滚动区域和新露出区域以外（工具栏、状态栏等）应保持不变，否则画面有其它变化，需要整帧识别
+    outside = np.ones(height, dtype=bool)
+    outside[min(first, strip[0]):max(last + 1, strip[1])] = False
+    if outside.any() and (previous[outside] == current[outside]).mean() < SCROLL_MATCH_RATIO:
+        return None
+    return shift, strip
+
+def merge_scroll_text(previous_text: str, strip_text: str, shift: int) -> str:
+    """把新露出区域的文本接到上一帧文本之后（向下滚动）或之前（向上滚动）"""
+    if strip_text.startswith(OCR_PLACEHOLDER_TEXTS):
+        strip_text = ""
+    if shift > 0:
+        text = f"{previous_text} {strip_text}".strip()[-SCROLL_MAX_TEXT:]
+    else:
+        text = f"{strip_text} {previous_text}".strip()[:SCROLL_MAX_TEXT]
+    return text or "未检测到文本内容"
+
+class ScrollTracker:
+    """
+    按窗口保存上一帧的行特征和该帧的识别文本。新帧只是上一帧纵向滚动的结果时，
+    只需识别新露出的条带，再接到上一帧文本上。上一帧文本尚未识别完成（异步OCR）时不做滚动优化。
+    """
+
+    def __init__(self, max_windows: int = MAX_TRACKED_WINDOWS):
+        self.max_windows = max_windows
+        self._windows = OrderedDict()  # window_key -> {"columns", "signatures", "record_id", "text"}
+        self._lock = Lock()
+
+    def detect(self, window_key, frame: Frame, window_rect: Optional[tuple] = None) -> Optional[Dict[str, Any]]:
+        """
+        与该窗口上一帧比较并记下当前帧的行特征。检测到滚动时返回
+        {"box": 需要识别的条带 (left, top, right, bottom), "shift": 位移, "text": 上一帧文本}
+        """
+        columns = scroll_columns(frame, window_rect)
+        signatures = row_signatures(frame, columns)
+        with self._lock:
+            previous = self._windows.get(window_key)
+            self._windows[window_key] = {"columns": columns, "signatures": signatures, "record_id": None, "text": None}
+            self._windows.move_to_end(window_key)
+            while len(self._windows) > self.max_windows:
+                self._windows.popitem(last=False)
+        if previous is None or previous["text"] is None or previous["columns"] != columns:
+            return None
+        result = detect_scroll_offset(previous["signatures"], signatures)
+        if result is None:
+            return None
+        shift, (top, bottom) = result
+        box = (columns[0], max(0, top - TILE_PADDING), columns[1], min(frame.size[1], bottom + TILE_PADDING))
+        logging.info(f"检测到滚动 {shift}px，只识别新露出的 {bottom - top} 行")
+        return {"box": box, "shift": shift, "text": previous["text"]}
+
+    def attach(self, window_key, record_id, text: Optional[str] = None):
+        """把刚保存的记录与该窗口最近一帧关联；text 为已知的识别结果（异步OCR时为None，完成后调用 set_text）"""
+        with self._lock:
+            entry = self._windows.get(window_key)
+            if entry is not None and entry["record_id"] is None:
+                entry["record_id"] = record_id
+        if text is not None:
+            self.set_text(window_key, record_id, text)
+
+    def set_text(self, window_key, record_id, text: str):
+        """该窗口最近一帧的OCR完成；识别失败时不保存，下一帧整帧识别"""
+        if text.startswith(("OCR处理失败", "OCR失败")):
+            return
+        if text.startswith(OCR_PLACEHOLDER_TEXTS):
+            text = ""
+        with self._lock:
+            entry = self._windows.get(window_key)
+            if entry is not None and entry["record_id"] is record_id:
+                entry["text"] = text
+
+    def forget(self, window_key):
+        with self._lock:
+            self._windows.pop(window_key, None)
+
+scroll_tracker = ScrollTracker()
+
 # --- 数据库函数 ---
 def create_connection(db_file):
     conn = None
@@ -110,10 +587,12 @@ def create_connection(db_file):
         logging.error(e)
     return conn
 
-def init_db():
-    conn = create_connection(DATABASE_FILE)
+def init_db(db_file=DATABASE_FILE):
+    conn = create_connection(db_file)
     if conn is not None:
         try:
+            # WAL 模式：GUI与独立的采集进程可以同时读写（该设置持久保存在数据库文件中）
+            conn.execute("PRAGMA journal_mode=WAL")
             cursor = conn.cursor()
             create_table_sql = """
             CREATE TABLE IF NOT EXISTS activity_log (
@@ -141,7 +620,8 @@ def init_db():
             """
             cursor.execute(create_table_sql)
             conn.commit()
-            logging.info(f"数据库表 'activity_log' 已在 {DATABASE_FILE} 中初始化/验证完毕。")
+            migrate_db(conn)
+            logging.info(f"数据库表 'activity_log' 已在 {db_file} 中初始化/验证完毕。")
         except sqlite3.Error as e:
             logging.error(f"创建/验证数据库表失败: {e}")
         finally:
@@ -149,29 +629,361 @@ def init_db():
     else:
         logging.error("未能创建数据库连接，无法初始化数据库。")
 
-def save_record(record_data):
-    """将单条活动记录保存到SQLite数据库。"""
-    with db_connection_lock:
-        conn = create_connection(DATABASE_FILE)
-        if not conn:
-            logging.error("保存记录时无法创建数据库连接。")
-            return
+# --- 数据库结构迁移 ---
+# 版本号保存在 PRAGMA user_version 中；每个迁移只执行一次，按版本顺序执行
+def epoch_millis(dt: datetime) -> int:
+    """本地时间 datetime -> 毫秒时间戳（与 ts 列一致）"""
+    return int(dt.timestamp() * 1000)
+
+# SQLite 中把本地时间的ISO文本转换为毫秒时间戳，与 epoch_millis() 结果一致
+ISO_TO_EPOCH_MILLIS_SQL = "CAST(ROUND((julianday({column}, 'utc') - 2440587.5) * 86400000) AS INTEGER)"
+
+def _migration_add_ref_id(cursor):
+    """ref_id: "画面未变化"心跳记录指向的原始记录ID"""
+    existing = {row[1] for row in cursor.execute("PRAGMA table_info(activity_log)")}
+    if 'ref_id' not in existing:
+        cursor.execute("ALTER TABLE activity_log ADD COLUMN ref_id INTEGER")
+
+def _migration_add_epoch_ts(cursor):
+    """ts: 毫秒时间戳，替代ISO文本做范围查询和排序；回填历史数据并建立索引"""
+    existing = {row[1] for row in cursor.execute("PRAGMA table_info(activity_log)")}
+    if 'ts' not in existing:
+        cursor.execute("ALTER TABLE activity_log ADD COLUMN ts INTEGER")
+    cursor.execute(f"UPDATE activity_log SET ts = {ISO_TO_EPOCH_MILLIS_SQL.format(column='timestamp')} WHERE ts IS NULL")
+    # 兜底：不写 ts 的旧版本写入方插入的记录也能自动补齐
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS activity_log_fill_ts AFTER INSERT ON activity_log
+        WHEN NEW.ts IS NULL
+        BEGIN
+            UPDATE activity_log SET ts = {ISO_TO_EPOCH_MILLIS_SQL.format(column='NEW.timestamp')} WHERE id = NEW.id;
+        END
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_activity_log_ts ON activity_log (ts)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_activity_log_app_ts ON activity_log (app_name, ts)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_activity_log_type_ts ON activity_log (record_type, ts)")
+
+def _migration_add_fulltext_index(cursor):
+    """activity_fts: 窗口标题和OCR文本的FTS5全文索引（外部内容表，由触发器与 activity_log 保持同步）。
+    优先使用 trigram 分词器以支持中文和错误码、文件名等任意子串；SQLite版本过旧时退回 unicode61。"""
+    columns = "window_title, ocr_text, content='activity_log', content_rowid='id'"
+    try:
+        cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS activity_fts USING fts5({columns}, tokenize='trigram')")
+    except sqlite3.OperationalError:
+        logging.warning("当前SQLite不支持 trigram 分词器，全文索引改用 unicode61（中文需按词检索）。")
+        cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS activity_fts USING fts5({columns})")
+    for statement in (
+        """CREATE TRIGGER IF NOT EXISTS activity_fts_insert AFTER INSERT ON activity_log BEGIN
+            INSERT INTO activity_fts(rowid, window_title, ocr_text) VALUES (NEW.id, NEW.window_title, NEW.ocr_text);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS activity_fts_delete AFTER DELETE ON activity_log BEGIN
+            INSERT INTO activity_fts(activity_fts, rowid, window_title, ocr_text) VALUES ('delete', OLD.id, OLD.window_title, OLD.ocr_text);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS activity_fts_update AFTER UPDATE OF window_title, ocr_text ON activity_log BEGIN
+            INSERT INTO activity_fts(activity_fts, rowid, window_title, ocr_text) VALUES ('delete', OLD.id, OLD.window_title, OLD.ocr_text);
+            INSERT INTO activity_fts(rowid, window_title, ocr_text) VALUES (NEW.id, NEW.window_title, NEW.ocr_text);
+        END""",
+    ):
+        cursor.execute(statement)
+    cursor.execute("INSERT INTO activity_fts(activity_fts) VALUES ('rebuild')")
+
+def _migration_add_url_tables(cursor):
+    """urls/domains: 每条记录中出现的URL及其域名（规范化存储），用于按网站/时间做索引查询；
+    历史数据从 activity_log.url 回填"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS domains (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            domain TEXT NOT NULL UNIQUE
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS urls (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            record_id INTEGER NOT NULL,
+            ts INTEGER,
+            url TEXT NOT NULL,
+            domain_id INTEGER NOT NULL,
+            source TEXT,
+            UNIQUE (record_id, url)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_urls_domain_ts ON urls (domain_id, ts)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_urls_ts ON urls (ts)")
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS urls_delete_with_record AFTER DELETE ON activity_log BEGIN
+            DELETE FROM urls WHERE record_id = OLD.id;
+        END
+    """)
+    rows = cursor.execute("SELECT id, ts, url FROM activity_log WHERE url IS NOT NULL AND url != ''").fetchall()
+    for record_id, ts, raw_url in rows:
+        normalized = normalize_url(raw_url)
+        if not normalized:
+            continue
+        url, domain = normalized
+        cursor.execute("INSERT OR IGNORE INTO domains (domain) VALUES (?)", (domain,))
+        cursor.execute(
+            "INSERT OR IGNORE INTO urls (record_id, ts, url, domain_id, source) "
+            "SELECT ?, ?, ?, id, 'legacy' FROM domains WHERE domain = ?",
+            (record_id, ts, url, domain),
+        )
+
+def _migration_add_ocr_jobs(cursor):
+    """ocr_jobs: 持久化的延后OCR任务（帧图像已落盘，由后台按批补做，进程重启后继续）；完成后删除"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ocr_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            record_id INTEGER NOT NULL UNIQUE,
+            image_path TEXT NOT NULL,
+            temporary INTEGER NOT NULL DEFAULT 0,
+            url TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_ts INTEGER NOT NULL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ocr_jobs_attempts ON ocr_jobs (attempts, id)")
 
+def _migration_add_click_text(cursor):
+    """click_text: 点击触发的记录中点击位置附近（及标题栏）的OCR文本，整帧OCR回填 ocr_text 后仍然保留"""
+    existing = {row[1] for row in cursor.execute("PRAGMA table_info(activity_log)")}
+    if 'click_text' not in existing:
+        cursor.execute("ALTER TABLE activity_log ADD COLUMN click_text TEXT")
+
+def _migration_add_index_state(cursor):
+    """index_state: 向量索引的增量游标（已索引到的最大 activity_log.id 及索引格式/模型版本）；
+    index_pending: 游标之前OCR尚未完成、暂未索引的记录，完成后补做"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS index_state (
+            name TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL DEFAULT 0,
+            version TEXT,
+            updated_ts INTEGER
+        )
+    """)
+    cursor.execute("CREATE TABLE IF NOT EXISTS index_pending (record_id INTEGER PRIMARY KEY)")
+
+def _migration_add_short_term_index(cursor):
+    """activity_short_fts: 供1~2个字的关键词（多数中文词）检索的FTS5索引（unicode61），内容为中日韩文字展开后的单字和相邻二字词；
+    展开在Python中完成（activity_retriever.sync_short_term_index），触发器只把新增/修改/删除的记录ID登记到 activity_short_pending"""
+    cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS activity_short_fts USING fts5(terms, tokenize='unicode61')")
+    cursor.execute("CREATE TABLE IF NOT EXISTS activity_short_pending (id INTEGER PRIMARY KEY)")
+    for statement in (
+        """CREATE TRIGGER IF NOT EXISTS activity_short_insert AFTER INSERT ON activity_log BEGIN
+            INSERT OR IGNORE INTO activity_short_pending(id) VALUES (NEW.id);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS activity_short_update AFTER UPDATE OF window_title, ocr_text ON activity_log BEGIN
+            INSERT OR IGNORE INTO activity_short_pending(id) VALUES (NEW.id);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS activity_short_delete AFTER DELETE ON activity_log BEGIN
+            INSERT OR IGNORE INTO activity_short_pending(id) VALUES (OLD.id);
+        END""",
+    ):
+        cursor.execute(statement)
+    cursor.execute(
+        "INSERT OR IGNORE INTO activity_short_pending(id) SELECT id FROM activity_log "
+        "WHERE ocr_text IS NOT NULL OR window_title IS NOT NULL"
+    )
+
+def _migration_add_index_attempts(cursor):
+    """index_pending.attempts/last_error: 写入向量索引失败的记录登记在 index_pending 中重试，超过次数后不再重试，游标不因其停滞"""
+    existing = {row[1] for row in cursor.execute("PRAGMA table_info(index_pending)")}
+    if 'attempts' not in existing:
+        cursor.execute("ALTER TABLE index_pending ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+    if 'last_error' not in existing:
+        cursor.execute("ALTER TABLE index_pending ADD COLUMN last_error TEXT")
+
+MIGRATIONS = [
+    (1, _migration_add_ref_id),
+    (2, _migration_add_epoch_ts),
+    (3, _migration_add_fulltext_index),
+    (4, _migration_add_url_tables),
+    (5, _migration_add_ocr_jobs),
+    (6, _migration_add_click_text),
+    (7, _migration_add_index_state),
+    (8, _migration_add_short_term_index),
+    (9, _migration_add_index_attempts),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def migrate_db(conn):
+    """把数据库结构升级到 SCHEMA_VERSION；每个迁移在单独的事务中执行"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for target, migration in MIGRATIONS:
+        if version >= target:
+            continue
+        logging.info(f"正在迁移数据库结构: v{version} -> v{target} ({migration.__name__})")
         try:
-            # 动态构建INSERT语句
-            columns = ', '.join(record_data.keys())
-            placeholders = ', '.join('?' * len(record_data))
-            sql = f"INSERT INTO activity_log ({columns}) VALUES ({placeholders})"
-            
             cursor = conn.cursor()
-            cursor.execute(sql, list(record_data.values()))
+            cursor.execute("BEGIN IMMEDIATE")
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {int(target)}")
             conn.commit()
-            logging.info(f"成功保存记录到数据库 (类型: {record_data.get('record_type')})")
-        except sqlite3.Error as e:
-            logging.error(f"保存记录到SQLite时出错: {e}", exc_info=True)
-        finally:
-            if conn:
-                conn.close()
+            version = target
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+
+class DatabaseWriter:
+    """单连接的SQLite写入线程：WAL模式，写操作经队列进入，按条数或时间窗口批量提交，停止时刷新剩余写入。
+
+    insert() 返回的 Future 在语句执行后即得到新记录ID（随后所在批次提交）；
+    写入参数中可以直接使用这样的 Future，写入线程执行时会把它解析为ID。
+    """
+
+    def __init__(self, db_file: str, batch_size: int = 50, flush_interval: float = 1.0):
+        self.db_file = db_file
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = max(0.0, float(flush_interval))
+        self.queue = queue.Queue()
+        self.thread = None
+
+    def start(self):
+        self.thread = Thread(target=self._run, name="db-writer", daemon=True)
+        self.thread.start()
+        logging.info(f"数据库写入线程已启动（每批最多 {self.batch_size} 条，最长 {self.flush_interval}s 提交一次）")
+
+    def execute(self, sql: str, params=()) -> Future:
+        """提交任意写语句，返回 Future（结果为 lastrowid）"""
+        future = Future()
+        self.queue.put((sql, params, future))
+        return future
+
+    def insert(self, record_data: Dict[str, Any], table: str = "activity_log") -> Future:
+        columns = ', '.join(record_data.keys())
+        placeholders = ', '.join('?' * len(record_data))
+        return self.execute(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", list(record_data.values()))
+
+    def update(self, record_id, fields: Dict[str, Any], table: str = "activity_log") -> Future:
+        assignments = ', '.join(f"{column} = ?" for column in fields)
+        return self.execute(f"UPDATE {table} SET {assignments} WHERE id = ?", list(fields.values()) + [record_id])
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待此前提交的所有写操作提交到数据库"""
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+
+    def when_committed(self, callback):
+        """此前提交的写操作全部提交到数据库后，在写入线程中调用 callback（调用方不等待）"""
+        self.queue.put(callback)
+
+    def stop(self, timeout: Optional[float] = 10):
+        """刷新剩余写操作并关闭连接"""
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join(timeout)
+        self.thread = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # WAL下只在检查点时fsync，断电最多丢失最近提交的批次
+        conn.execute("PRAGMA busy_timeout=5000")   # 另一个进程正在写入时等待而不是立即失败
+        return conn
+
+    def _run(self):
+        conn = self._connect()
+        pending = []      # 当前批次中已执行、等待提交的 Future
+        waiters = []      # 等待本批次提交完成的 flush 事件
+        batch_started = None
+        running = True
+        while running:
+            timeout = None
+            if batch_started is not None:
+                timeout = max(0.0, batch_started + self.flush_interval - time.monotonic())
+            try:
+                op = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                op = threading.Event()  # 时间窗口到期，按 flush 处理（无人等待）
+
+            if op is None:
+                running = False
+            elif isinstance(op, threading.Event) or callable(op):
+                waiters.append(op)
+            else:
+                if batch_started is None:
+                    batch_started = time.monotonic()
+                self._execute(conn, op, pending)
+
+            if not running or waiters or len(pending) >= self.batch_size:
+                self._commit(conn, pending)
+                for waiter in waiters:
+                    self._notify(waiter)
+                pending, waiters, batch_started = [], [], None
+        conn.close()
+        logging.info("数据库写入线程已停止。")
+
+    def _execute(self, conn, op, pending):
+        sql, params, future = op
+        try:
+            params = [value.result() if isinstance(value, Future) else value for value in params]
+            cursor = conn.execute(sql, params)
+            future.set_result(cursor.lastrowid)
+            pending.append(future)
+        except Exception as e:
+            logging.error(f"执行数据库写入失败: {e}")
+            future.set_exception(e)
+
+    def _notify(self, waiter):
+        if isinstance(waiter, threading.Event):
+            waiter.set()
+            return
+        try:
+            waiter()
+        except Exception as e:
+            logging.error(f"提交后回调失败: {e}", exc_info=True)
+
+    def _commit(self, conn, pending):
+        if not pending or not conn.in_transaction:
+            return
+        for attempt in range(2):
+            try:
+                conn.commit()
+                return
+            except sqlite3.Error as e:
+                logging.error(f"批量提交失败（第{attempt + 1}次）: {e}")
+                time.sleep(0.5)
+        conn.rollback()
+        logging.error(f"放弃本批次 {len(pending)} 条写入。")
+
+db_writer = None
+db_writer_lock = Lock()
+
+def get_db_writer() -> DatabaseWriter:
+    """懒加载全局写入线程（批大小和提交间隔来自 capture.db_batch_size / capture.db_flush_interval）"""
+    global db_writer
+    with db_writer_lock:
+        if db_writer is None:
+            db_writer = DatabaseWriter(
+                DATABASE_FILE,
+                batch_size=get_capture_setting('db_batch_size', 50),
+                flush_interval=get_capture_setting('db_flush_interval', 1.0),
+            )
+            db_writer.start()
+        return db_writer
+
+def shutdown_db_writer():
+    global db_writer
+    with db_writer_lock:
+        if db_writer is not None:
+            db_writer.stop()
+            db_writer = None
+
+atexit.register(shutdown_db_writer)
+
+def save_record(record_data) -> Future:
+    """将单条活动记录交给写入线程保存，返回结果为新记录ID的 Future。"""
+    if 'ts' not in record_data and record_data.get('timestamp'):
+        record_data['ts'] = epoch_millis(datetime.fromisoformat(record_data['timestamp']))
+    future = get_db_writer().insert(record_data)
+    logging.info(f"记录已加入写入队列 (类型: {record_data.get('record_type')})")
+    return future
+
+def update_record(record_id, fields) -> Optional[Future]:
+    """更新已保存记录的部分字段（例如异步OCR完成后回填 ocr_text 和 url）；record_id 可以是 save_record 返回的 Future"""
+    if record_id is None or not fields:
+        return None
+    return get_db_writer().update(record_id, fields)
 
 # --- 核心功能函数 ---
 def get_app_info_from_hwnd(hwnd):
@@ -195,7 +1007,7 @@ def get_app_info_from_hwnd(hwnd):
     except Exception:
         return "Unknown", 0, "Unknown"
         
-def get_active_window_info():
+def win32_get_active_window_info():
     if not PYWIN32_AVAILABLE:
         return "Unknown", 0, "Unknown", "Unknown"
     try:
@@ -206,20 +1018,365 @@ def get_active_window_info():
     except Exception:
         return "Unknown", 0, "Unknown", "Unknown"
 
-def capture_screenshot(filename_prefix="screenshot"):
-    try:
-        with mss.mss() as sct:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"{filename_prefix}_{timestamp}.png"
-            filepath = os.path.join(SCREENSHOT_DIR, filename)
-            sct.shot(output=filepath, mon=-1) # -1 for all monitors
-            return filepath
-    except Exception as e:
-        logging.error(f"截屏失败: {e}")
+# 每个线程复用一个 mss 实例（mss 实例不能跨线程使用）
+_mss_local = threading.local()
+
+def get_mss():
+    sct = getattr(_mss_local, 'sct', None)
+    if sct is None:
+        sct = mss.mss()
+        _mss_local.sct = sct
+    return sct
+
+# --- 捕获区域 ---
+CAPTURE_MODES = ('all', 'monitor', 'window')
+MIN_WINDOW_CAPTURE_SIZE = 32  # 小于该尺寸的窗口（如最小化窗口）退回到整屏捕获
+
+class WindowGeometryProvider:
+    """前台窗口几何信息的提供者。坐标均为虚拟桌面坐标，显示器列表与 mss.monitors 格式一致（下标0为全部显示器）"""
+
+    def get_monitors(self) -> List[Dict[str, int]]:
+        raise NotImplementedError
+
+    def get_foreground_window_rect(self) -> Optional[tuple]:
+        """返回前台窗口的 (left, top, right, bottom)，无法获取时返回None"""
+        raise NotImplementedError
+
+class PlatformProvider(WindowGeometryProvider):
+    """
+    平台相关能力的统一接口：窗口几何、前台窗口信息、浏览器URL、抓帧和输入事件监听。
+    采集流程只通过当前 platform_provider 访问这些能力，替换实现即可在其它平台或无显示器环境中运行。
+    """
+
+    def get_active_window_info(self) -> tuple:
+        """返回 (window_title, pid, process_name, app_name)"""
+        return "Unknown", 0, "Unknown", "Unknown"
+
+    def get_browser_url(self, app_name: str, window_title: str) -> str:
+        return ""
+
+    def grab_frame(self, region: Optional[Dict[str, int]] = None) -> Optional[Frame]:
+        raise NotImplementedError
+
+    def start_input_listeners(self, on_click, on_activity) -> list:
+        """
+        开始监听输入事件：on_click(x, y, button, pressed) 在鼠标按键时调用（为None表示不关心点击），
+        on_activity(*args) 在任何输入时调用。返回带 stop() 方法的监听器列表。
+        """
+        return []
+
+class DesktopPlatformProvider(PlatformProvider):
+    """通用桌面实现：mss 抓屏、pynput 监听输入；不提供前台窗口信息"""
+
+    def get_monitors(self) -> List[Dict[str, int]]:
+        return get_mss().monitors
+
+    def get_foreground_window_rect(self) -> Optional[tuple]:
         return None
 
+    def grab_frame(self, region: Optional[Dict[str, int]] = None) -> Optional[Frame]:
+        try:
+            sct = get_mss()
+            return Frame(sct.grab(region or sct.monitors[0]))
+        except Exception as e:
+            logging.error(f"截屏失败: {e}")
+            _mss_local.sct = None  # 下次重新创建实例
+            return None
+
+    def start_input_listeners(self, on_click, on_activity) -> list:
+        listeners = []
+        if mouse:
+            listener = mouse.Listener(on_click=on_click or on_activity, on_move=on_activity, on_scroll=on_activity)
+            listener.start()
+            listeners.append(listener)
+            logging.info("鼠标监听器已启动。")
+        if keyboard:
+            listener = keyboard.Listener(on_press=on_activity)
+            listener.start()
+            listeners.append(listener)
+            logging.info("键盘活动监听器已启动。")
+        return listeners
+
+class Win32PlatformProvider(DesktopPlatformProvider):
+    """Windows 实现：在通用桌面实现基础上，前台窗口信息来自 win32gui，浏览器URL来自 uiautomation"""
+
+    def get_foreground_window_rect(self) -> Optional[tuple]:
+        if not PYWIN32_AVAILABLE:
+            return None
+        try:
+            hwnd = win32gui.GetForegroundWindow()
+            if not hwnd or win32gui.IsIconic(hwnd):
+                return None
+            return tuple(win32gui.GetWindowRect(hwnd))
+        except Exception:
+            return None
+
+    def get_active_window_info(self) -> tuple:
+        return win32_get_active_window_info()
+
+    def get_browser_url(self, app_name: str, window_title: str) -> str:
+        return uia_get_browser_url(app_name, window_title)
+
+REPLAY_MANIFEST_NAMES = ('manifest.jsonl', 'manifest.json')
+
+class ReplayPlatformProvider(PlatformProvider):
+    """
+    回放实现：从录制好的目录或清单文件中按顺序读取帧和窗口元数据，用于在无显示器的机器上
+    确定性地运行完整的 采集→OCR→入库 流程并测量吞吐。
+
+    清单为 JSON Lines（或JSON数组），每条记录形如
+        {"frame": "frame_00001.png", "window_title": "...", "app_name": "...", "process_name": "...",
+         "pid": 0, "url": "...", "window_rect": [left, top, right, bottom], "click": {"x": 0, "y": 0, "button": "left"}}
+    frame 为相对清单所在目录的路径，其余字段可省略。目录中没有清单时按文件名顺序回放所有图像。
+    rate 为每秒回放的帧数，0 表示不限速。调用 advance() 切换到下一帧，在此之前所有查询都返回当前帧的数据。
+    """
+
+    def __init__(self, source: str, rate: float = 0.0, loop: bool = False):
+        self.entries = self._load_entries(source)
+        if not self.entries:
+            raise ValueError(f"回放源中没有帧: {source}")
+        self.rate = rate
+        self.loop = loop
+        self.index = -1
+        self._next_time = None
+        self._frame_cache = None
+        self._listeners = []
+
+    @staticmethod
+    def _load_entries(source: str) -> List[Dict[str, Any]]:
+        manifest = source
+        if os.path.isdir(source):
+            manifest = next((os.path.join(source, name) for name in REPLAY_MANIFEST_NAMES
+                             if os.path.exists(os.path.join(source, name))), None)
+            if manifest is None:
+                names = sorted(name for name in os.listdir(source)
+                               if name.lower().endswith(('.png', '.jpg', '.jpeg', '.webp', '.bmp')))
+                return [{"frame": os.path.join(source, name)} for name in names]
+        base_dir = os.path.dirname(os.path.abspath(manifest))
+        with open(manifest, 'r', encoding='utf-8') as f:
+            if manifest.endswith('.jsonl'):
+                entries = [json.loads(line) for line in f if line.strip()]
+            else:
+                entries = json.load(f)
+        for entry in entries:
+            entry["frame"] = os.path.join(base_dir, entry["frame"])
+        return entries
+
+    @property
+    def current(self) -> Dict[str, Any]:
+        return self.entries[max(self.index, 0)]
+
+    def advance(self) -> bool:
+        """切换到下一帧（按 rate 限速）；回放结束时返回False"""
+        if self.index + 1 >= len(self.entries):
+            if not self.loop:
+                return False
+            self.index = -1
+        if self.rate and self.rate > 0:
+            now = time.monotonic()
+            if self._next_time is not None and now < self._next_time:
+                time.sleep(self._next_time - now)
+            self._next_time = max(now, self._next_time or now) + 1.0 / self.rate
+        self.index += 1
+        self._frame_cache = None
+        entry = self.current
+        for on_click, on_activity in self._listeners:
+            on_activity()
+            click = entry.get("click")
+            if click and on_click:
+                on_click(click.get("x", 0), click.get("y", 0), click.get("button", "left"), True)
+        return True
+
+    def _image(self) -> Image.Image:
+        if self._frame_cache is None:
+            with Image.open(self.current["frame"]) as image:
+                self._frame_cache = image.convert('RGB')
+        return self._frame_cache
+
+    def get_monitors(self) -> List[Dict[str, int]]:
+        width, height = self._image().size
+        screen = {'left': 0, 'top': 0, 'width': width, 'height': height}
+        return [screen, dict(screen)]
+
+    def get_foreground_window_rect(self) -> Optional[tuple]:
+        rect = self.current.get("window_rect")
+        return tuple(rect) if rect else None
+
+    def get_active_window_info(self) -> tuple:
+        entry = self.current
+        return (entry.get("window_title", "Replay"), entry.get("pid", 0),
+                entry.get("process_name", "replay"), entry.get("app_name", "Replay"))
+
+    def get_browser_url(self, app_name: str, window_title: str) -> str:
+        return self.current.get("url", "")
+
+    def grab_frame(self, region: Optional[Dict[str, int]] = None) -> Optional[Frame]:
+        image = self._image()
+        if region:
+            box = (region['left'], region['top'], region['left'] + region['width'], region['top'] + region['height'])
+            if box != (0, 0) + image.size:
+                return Frame.from_image(image.crop(box), left=region['left'], top=region['top'])
+        return Frame.from_image(image)
+
+    def start_input_listeners(self, on_click, on_activity) -> list:
+        provider = self
+        callbacks = (on_click, on_activity)
+        self._listeners.append(callbacks)
+
+        class _ReplayListener:
+            def stop(self):
+                if callbacks in provider._listeners:
+                    provider._listeners.remove(callbacks)
+        return [_ReplayListener()]
+
+platform_provider: PlatformProvider = Win32PlatformProvider() if PYWIN32_AVAILABLE else DesktopPlatformProvider()
+
+def set_platform_provider(provider: PlatformProvider) -> None:
+    global platform_provider
+    platform_provider = provider
+
+def get_active_window_info():
+    """当前前台窗口信息 (window_title, pid, process_name, app_name)"""
+    return platform_provider.get_active_window_info()
+
 def get_browser_url(app_name, window_title):
     """尝试从浏览器获取当前页面URL"""
+    return platform_provider.get_browser_url(app_name, window_title)
+
+def _intersect(rect: tuple, monitor: Dict[str, int]) -> tuple:
+    left = max(rect[0], monitor['left'])
+    top = max(rect[1], monitor['top'])
+    right = min(rect[2], monitor['left'] + monitor['width'])
+    bottom = min(rect[3], monitor['top'] + monitor['height'])
+    return left, top, right, bottom
+
+def resolve_capture_region(mode: str = 'all', provider: Optional[WindowGeometryProvider] = None) -> Optional[Dict[str, int]]:
+    """根据捕获模式计算要抓取的区域：all=所有显示器，monitor=前台窗口所在显示器，window=仅前台窗口矩形"""
+    provider = provider or platform_provider
+    monitors = provider.get_monitors()
+    if not monitors:
+        return None
+    everything = monitors[0]
+    if mode not in ('monitor', 'window'):
+        return everything
+
+    rect = provider.get_foreground_window_rect()
+    if rect is None:
+        return everything
+
+    if mode == 'monitor':
+        best, best_area = everything, 0
+        for monitor in monitors[1:]:
+            left, top, right, bottom = _intersect(rect, monitor)
+            area = max(0, right - left) * max(0, bottom - top)
+            if area > best_area:
+                best, best_area = monitor, area
+        return best
+
+    left, top, right, bottom = _intersect(rect, everything)
+    if right - left < MIN_WINDOW_CAPTURE_SIZE or bottom - top < MIN_WINDOW_CAPTURE_SIZE:
+        return everything
+    return {'left': left, 'top': top, 'width': right - left, 'height': bottom - top}
+
+def get_capture_region() -> Optional[Dict[str, int]]:
+    """按 capture.capture_mode 计算本次抓取区域"""
+    mode = get_capture_setting('capture_mode', 'all')
+    if mode not in CAPTURE_MODES:
+        logging.warning(f"未知的捕获模式 '{mode}'，使用 all。")
+        mode = 'all'
+    try:
+        return resolve_capture_region(mode)
+    except Exception as e:
+        logging.debug(f"计算捕获区域失败: {e}")
+        return None
+
+def grab_frame(region: Optional[Dict[str, int]] = None) -> Optional[Frame]:
+    """抓取一帧到内存（默认所有显示器拼接），返回 Frame；不写磁盘、不做PNG编码"""
+    return platform_provider.grab_frame(region)
+
+# 截图存储格式：配置名 -> (扩展名, Pillow格式名)
+STORAGE_FORMATS = {
+    'png': ('.png', 'PNG'),
+    'webp_lossless': ('.webp', 'WEBP'),
+    'webp': ('.webp', 'WEBP'),
+    'jpeg': ('.jpg', 'JPEG'),
+}
+WEBP_MAX_DIMENSION = 16383  # WebP 单边最大像素数
+
+def get_storage_settings() -> Dict[str, Any]:
+    """读取截图存储设置：格式、有损压缩质量、最大宽度（0表示不缩放）"""
+    storage_format = str(get_capture_setting('storage_format', 'png')).lower()
+    if storage_format not in STORAGE_FORMATS:
+        logging.warning(f"未知的截图存储格式 '{storage_format}'，使用PNG。")
+        storage_format = 'png'
+    return {
+        'format': storage_format,
+        'quality': int(get_capture_setting('storage_quality', 80)),
+        'max_width': int(get_capture_setting('storage_max_width', 0) or 0),
+    }
+
+def screenshot_filepath(filename_prefix="screenshot", extension=".png") -> str:
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    return os.path.join(SCREENSHOT_DIR, f"{filename_prefix}_{timestamp}{extension}")
+
+def encode_frame_image(frame: Frame, storage: Dict[str, Any]) -> tuple:
+    """按存储设置准备要写入的图像，返回 (图像, Pillow保存参数)"""
+    image = frame.image
+    storage_format = storage['format']
+    max_width = storage['max_width']
+    if storage_format in ('webp', 'webp_lossless'):
+        max_width = min(max_width or WEBP_MAX_DIMENSION, WEBP_MAX_DIMENSION)
+        if image.height > WEBP_MAX_DIMENSION:
+            max_width = min(max_width, image.width * WEBP_MAX_DIMENSION // image.height)
+    if max_width and image.width > max_width:
+        height = max(1, round(image.height * max_width / image.width))
+        image = image.resize((max_width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+    if storage_format == 'webp_lossless':
+        options = {'lossless': True, 'quality': 80, 'method': 4}
+    elif storage_format == 'webp':
+        options = {'quality': storage['quality'], 'method': 4}
+    elif storage_format == 'jpeg':
+        options = {'quality': storage['quality'], 'optimize': True}
+    else:
+        options = {'compress_level': 6}
+    return image, options
+
+def write_frame(frame: Frame, filepath: str, storage: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """把帧按存储格式编码写入磁盘（先写临时文件再改名，读者不会读到半个文件）"""
+    storage = storage or {'format': 'png', 'quality': 80, 'max_width': 0}
+    try:
+        image, options = encode_frame_image(frame, storage)
+        temp_path = filepath + ".tmp"
+        image.save(temp_path, format=STORAGE_FORMATS[storage['format']][1], **options)
+        os.replace(temp_path, filepath)
+        return filepath
+    except Exception as e:
+        logging.error(f"保存截图失败: {e}")
+        return None
+
+# 截图编码和落盘在单独的线程中进行，不阻塞采集
+_frame_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="frame-writer")
+
+def save_frame_async(frame: Frame, filename_prefix="screenshot") -> Optional[str]:
+    """异步保存截图，立即返回将要写入的路径（扩展名与实际格式一致）；capture.save_screenshots 为 false 时不保存"""
+    if not get_capture_setting('save_screenshots', True):
+        return None
+    storage = get_storage_settings()
+    filepath = screenshot_filepath(filename_prefix, STORAGE_FORMATS[storage['format']][0])
+    _frame_writer.submit(write_frame, frame, filepath, storage)
+    return filepath
+
+def capture_screenshot(filename_prefix="screenshot"):
+    """截取所有显示器并按存储设置同步保存，返回文件路径"""
+    frame = grab_frame()
+    if frame is None:
+        return None
+    storage = get_storage_settings()
+    return write_frame(frame, screenshot_filepath(filename_prefix, STORAGE_FORMATS[storage['format']][0]), storage)
+
+def uia_get_browser_url(app_name, window_title):
+    """尝试通过 UI Automation 从浏览器地址栏获取当前页面URL"""
     if not UIAUTOMATION_AVAILABLE:
         return ""
     
@@ -261,55 +1418,781 @@ def get_browser_url(app_name, window_title):
     
     return ""
 
+# --- URL 提取 ---
+_URL_CHARS = r'[^\s<>"{}|\\^`\[\]]'
+# 单次扫描同时匹配三种形式：带协议的URL、www开头的地址、裸域名（按顺序优先匹配更完整的形式）
+URL_PATTERN = re.compile(
+    rf'(?P<scheme>https?://{_URL_CHARS}+)'
+    rf'|(?P<www>\bwww\.{_URL_CHARS}+)'
+    rf'|(?P<domain>\b[a-zA-Z0-9][a-zA-Z0-9-]*(?:\.[a-zA-Z0-9-]+)*\.(?P<tld>[a-zA-Z]{{2,24}})\b(?:[/:?#]{_URL_CHARS}*)?)',
+    re.IGNORECASE,
+)
+URL_TRAILING_PUNCTUATION = '.,;:!?)\'"，。；：！？）」』】'
+# 裸域名（无协议、无www）容易把文件名、代码标识符（os.path.join、np.array）识别为域名，只接受常见的真实顶级域
+BARE_DOMAIN_TLDS = frozenset({
+    'com', 'net', 'org', 'edu', 'gov', 'mil', 'int', 'biz', 'info', 'io', 'co', 'ai', 'app', 'dev', 'me',
+    'tv', 'cc', 'xyz', 'top', 'site', 'online', 'tech', 'cloud', 'wiki',
+    'cn', 'hk', 'tw', 'mo', 'jp', 'kr', 'sg', 'uk', 'de', 'fr', 'ru', 'us', 'ca', 'au', 'eu', 'nl', 'se', 'ch',
+})
+# 这些顶级域同时是常见的属性/方法名（logging.info、self.app、np.dev...），裸域名形式下还要求带路径
+AMBIGUOUS_BARE_TLDS = frozenset({
+    'info', 'io', 'co', 'ai', 'app', 'dev', 'me', 'tv', 'cc', 'top', 'site', 'online', 'tech', 'cloud', 'wiki', 'us',
+})
+
+def is_bare_domain_match(match, text: str) -> bool:
+    """裸域名匹配是否可信：顶级域在白名单中，且不是邮箱地址的一部分（user.name@example.com 的两侧都不算）"""
+    tld = match.group('tld').lower()
+    if tld not in BARE_DOMAIN_TLDS:
+        return False
+    before = text[match.start() - 1] if match.start() > 0 else ''
+    after = text[match.end()] if match.end() < len(text) else ''
+    if '@' in (before, after):
+        return False
+    has_path = bool(text[match.end('tld'):match.end()].rstrip(URL_TRAILING_PUNCTUATION))
+    return has_path or tld not in AMBIGUOUS_BARE_TLDS
+
+def normalize_url(raw: str) -> Optional[tuple]:
+    """清理OCR匹配到的URL（去掉末尾标点、协议和主机名转小写），返回 (url, domain)；无效时返回None"""
+    url = raw.rstrip(URL_TRAILING_PUNCTUATION)
+    if not url:
+        return None
+    has_scheme = re.match(r'https?://', url, re.IGNORECASE) is not None
+    try:
+        parts = urlsplit(url if has_scheme else f"http://{url}")
+        host = (parts.hostname or '').rstrip('.')
+    except ValueError:
+        return None
+    if '.' not in host:
+        return None
+    netloc = parts.netloc.lower()
+    rest = url[len(parts.scheme) + 3 + len(parts.netloc):] if has_scheme else url[len(parts.netloc):]
+    url = (f"{parts.scheme.lower()}://{netloc}" if has_scheme else netloc) + rest
+    domain = host[4:] if host.startswith('www.') else host
+    return url, domain
+
+def extract_urls(text: str) -> List[tuple]:
+    """一次扫描提取文本中的所有URL和域名，返回去重后的 [(url, domain), ...]（按出现顺序）"""
+    if not text:
+        return []
+    results = {}
+    for match in URL_PATTERN.finditer(text):
+        if match.group('domain') and not is_bare_domain_match(match, text):
+            continue
+        normalized = normalize_url(match.group(0))
+        if normalized and normalized[0] not in results:
+            results[normalized[0]] = normalized
+    return list(results.values())
+
 def extract_url_from_ocr(ocr_text):
-    """从OCR文本中提取URL作为备用方案"""
-    import re
-    
-    # URL正则表达式模式
-    url_patterns = [
-        r'https?://[^\s<>"{}|\\^`\[\]]+',  # 标准HTTP/HTTPS URL
-        r'www\.[^\s<>"{}|\\^`\[\]]+',      # www开头的URL
-        r'[a-zA-Z0-9][a-zA-Z0-9-]*\.[a-zA-Z]{2,}[^\s<>"{}|\\^`\[\]]*'  # 域名格式
-    ]
-    
-    for pattern in url_patterns:
-        matches = re.findall(pattern, ocr_text)
-        if matches:
-            # 返回最长的匹配项，通常是最完整的URL
-            return max(matches, key=len)
-    
-    return ""
+    """从OCR文本中提取URL作为备用方案（返回最长的一个，通常是最完整的URL）"""
+    urls = extract_urls(ocr_text)
+    return max((url for url, _ in urls), key=len) if urls else ""
+
+def save_record_urls(record_id, urls: List[tuple], source: str, ts: Optional[int] = None) -> None:
+    """把记录中出现的URL写入 urls/domains 表（record_id 可以是 save_record 返回的 Future）"""
+    if record_id is None or not urls:
+        return
+    writer = get_db_writer()
+    for url, domain in urls:
+        writer.execute("INSERT OR IGNORE INTO domains (domain) VALUES (?)", (domain,))
+        writer.execute(
+            "INSERT OR IGNORE INTO urls (record_id, ts, url, domain_id, source) "
+            "SELECT ?, COALESCE(?, (SELECT ts FROM activity_log WHERE id = ?)), ?, id, ? FROM domains WHERE domain = ?",
+            (record_id, ts, record_id, url, source, domain),
+        )
+
+# --- OCR 进程池 ---
+def ocr_worker_task(mode: str, regions: List[tuple], lang: str = 'chi_sim+eng'):
+    """在OCR工作进程中执行：mode='text' 时整帧识别返回文本，mode='file' 时识别磁盘上的图像文件，
+    mode='words' 时逐区域识别返回单词列表"""
+    try:
+        if mode == 'text':
+            return extract_text_with_tesseract(regions[0][1], lang)
+        if mode == 'file':
+            # 延后任务：在工作进程中读取已落盘的帧，失败时抛出异常以便重试
+            text = extract_text_with_tesseract(regions[0][1])
+            if text.startswith("OCR处理失败"):
+                raise RuntimeError(text)
+            return text
+        words = []
+        for offset, crop in regions:
+            words.extend(ocr_words(crop, lang=lang, offset=offset))
+        return words
+    except Exception as e:
+        # pytesseract 的部分异常无法在主进程中反序列化，会让整个进程池被判定为崩溃，这里统一转换
+        raise RuntimeError(f"{type(e).__name__}: {e}") from None
+
+def lower_process_priority():
+    """OCR工作进程初始化：降低进程优先级，避免与前台的编译、视频会议等争抢CPU"""
+    try:
+        if PSUTIL_AVAILABLE:
+            process = psutil.Process()
+            if os.name == 'nt':
+                process.nice(psutil.BELOW_NORMAL_PRIORITY_CLASS)
+            else:
+                process.nice(10)
+        elif hasattr(os, 'nice'):
+            os.nice(10)
+    except Exception as e:
+        logging.debug(f"降低OCR进程优先级失败: {e}")
+
+# --- 系统负载限流 ---
+LOAD_SAMPLE_INTERVAL = 2.0  # CPU占用采样间隔（秒），期间复用上一次的采样结果
+THROTTLE_NORMAL, THROTTLE_REDUCED, THROTTLE_DEFERRED = 'normal', 'reduced', 'deferred'
+
+class LoadMonitor:
+    """
+    通过 psutil 采样其它程序的CPU占用（系统总占用减去本进程子进程，即OCR工作进程和它们调用的tesseract），
+    给出OCR限流级别；OCR自身的负载不计入，否则OCR一忙起来就会把自己限流：
+    - normal：正常提交
+    - reduced：CPU超过 capture.ocr_reduce_cpu，同一时间只允许一个OCR任务在进行
+    - deferred：CPU超过 capture.ocr_defer_cpu，只记录帧，OCR推迟到负载下降后补做
+    级别变化时写日志，当前数值可通过 state() 查看。
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._cpu = 0.0
+        self._ocr_cpu = 0.0
+        self._sampled_at = 0.0
+        self._ocr_seconds = 0.0
+        self._level = THROTTLE_NORMAL
+        if PSUTIL_AVAILABLE:
+            psutil.cpu_percent(interval=None)  # 第一次调用只建立基准
+            self._ocr_seconds = self._child_cpu_seconds()
+            self._sampled_at = time.monotonic()
+
+    @staticmethod
+    def _child_cpu_seconds() -> float:
+        """本进程所有子孙进程累计占用的CPU秒数。已退出的tesseract进程的时间计入其父进程的
+        children_user/children_system（Windows 上psutil不提供这两项，采样间隔内退出的tesseract进程会漏计）"""
+        total = 0.0
+        for child in psutil.Process().children(recursive=True):
+            try:
+                times = child.cpu_times()
+            except psutil.Error:
+                continue
+            total += (times.user + times.system
+                      + getattr(times, 'children_user', 0.0) + getattr(times, 'children_system', 0.0))
+        return total
+
+    def _sample(self):
+        now = time.monotonic()
+        if now - self._sampled_at < LOAD_SAMPLE_INTERVAL:
+            return
+        system = psutil.cpu_percent(interval=None)
+        try:
+            ocr_seconds = self._child_cpu_seconds()
+        except psutil.Error:
+            ocr_seconds = self._ocr_seconds
+        elapsed = now - self._sampled_at
+        # 进程池重建后旧工作进程的累计时间消失，差值可能为负
+        ocr = max(0.0, ocr_seconds - self._ocr_seconds) / (elapsed * (psutil.cpu_count() or 1)) * 100
+        self._ocr_cpu = min(ocr, system)
+        self._cpu = system - self._ocr_cpu
+        self._ocr_seconds = ocr_seconds
+        self._sampled_at = now
+
+    def cpu_percent(self) -> float:
+        """除OCR进程外的系统CPU占用"""
+        if not PSUTIL_AVAILABLE:
+            return 0.0
+        with self._lock:
+            self._sample()
+            return self._cpu
+
+    def ocr_cpu_percent(self) -> float:
+        """OCR工作进程（含tesseract）占用的CPU（按全部核心折算）"""
+        with self._lock:
+            return self._ocr_cpu
+
+    def level(self) -> str:
+        if not get_capture_setting('enable_load_throttle', True):
+            return THROTTLE_NORMAL
+        cpu = self.cpu_percent()
+        if cpu >= float(get_capture_setting('ocr_defer_cpu', 85)):
+            level = THROTTLE_DEFERRED
+        elif cpu >= float(get_capture_setting('ocr_reduce_cpu', 65)):
+            level = THROTTLE_REDUCED
+        else:
+            level = THROTTLE_NORMAL
+        if level != self._level:
+            logging.info(f"OCR限流级别: {self._level} -> {level}（其它程序CPU {cpu:.0f}%，OCR进程 {self._ocr_cpu:.0f}%）")
+            self._level = level
+        return level
+
+load_monitor = LoadMonitor()
+
+# --- 持久化的延后OCR任务 ---
+OCR_PENDING_DIR = os.path.join(SCREENSHOT_DIR, "ocr_pending")  # 截图不可用于OCR时，帧临时保存在这里
+MAX_OCR_ATTEMPTS = 3
+MISSING_FRAME_GRACE_MS = 60_000  # 帧文件可能仍在异步写入，超过该时间仍不存在才判定丢失
+
+def ocr_source_path(frame: Frame, screenshot_path: Optional[str]) -> tuple:
+    """延后OCR使用的图像文件：截图为无损且未缩放时直接复用，否则另存一份PNG。返回 (路径, 是否为临时文件)"""
+    storage = get_storage_settings()
+    if screenshot_path and storage['format'] in ('png', 'webp_lossless') and not storage['max_width']:
+        return screenshot_path, False
+    os.makedirs(OCR_PENDING_DIR, exist_ok=True)
+    path = os.path.join(OCR_PENDING_DIR, os.path.basename(screenshot_filepath("frame", ".png")))
+    _frame_writer.submit(write_frame, frame, path)
+    return path, True
+
+def enqueue_ocr_job(record_id, frame: Frame, screenshot_path: Optional[str] = None, url: str = "") -> Future:
+    """只保存帧并登记一条延后OCR任务（record_id 可以是 save_record 返回的 Future）"""
+    image_path, temporary = ocr_source_path(frame, screenshot_path)
+    return get_db_writer().execute(
+        "INSERT OR IGNORE INTO ocr_jobs (record_id, image_path, temporary, url, created_ts) VALUES (?, ?, ?, ?, ?)",
+        (record_id, image_path, int(temporary), url or "", epoch_millis(datetime.now())),
+    )
+
+EXIT_OCR_TIMEOUT = 5.0  # 程序退出时等待OCR回填的最长秒数，超时未完成的记录转为延后任务
+OCR_RECOVER_MIN_AGE_MS = 10 * 60_000  # 只恢复早于该时间的未完成记录；更新的记录可能仍由其它进程的流水线回填
+_ocr_jobs_recovered = False
+
+def recover_ocr_jobs() -> Optional[Future]:
+    """
+    每个进程只在首次启动OCR流水线时调用一次：上次退出前已保存、但OCR未完成的截图记录重新登记为延后任务。
+    同一进程内 stop() 后再 start() 时，上一个流水线可能还在后台回填，不再恢复；
+    GUI 和命令行同时采集时，另一进程正在回填的记录也不会被恢复（只取超过 OCR_RECOVER_MIN_AGE_MS 的记录）。
+    """
+    global _ocr_jobs_recovered
+    if _ocr_jobs_recovered:
+        return None
+    _ocr_jobs_recovered = True
+    cutoff = epoch_millis(datetime.now()) - OCR_RECOVER_MIN_AGE_MS
+    return get_db_writer().execute(
+        "INSERT OR IGNORE INTO ocr_jobs (record_id, image_path, temporary, url, created_ts) "
+        "SELECT id, screenshot_path, 0, url, COALESCE(ts, 0) FROM activity_log "
+        "WHERE record_type = 'screen_content' AND ocr_text IS NULL AND screenshot_path IS NOT NULL "
+        "AND ts IS NOT NULL AND ts < ?",
+        (cutoff,),
+    )
+
+class OCRJob:
+    """一帧的OCR任务（提交后由回收线程按顺序处理）"""
+
+    def __init__(self, record_id, future, geometry, dirty_tiles=None, url="", window_key=None, lang=DEFAULT_OCR_LANG):
+        self.record_id = record_id
+        self.future = future
+        self.geometry = geometry
+        self.dirty_tiles = dirty_tiles  # None 表示整帧OCR模式
+        self.url = url
+        self.window_key = window_key
+        self.lang = lang
+        self.executor = None
+        self.queued = None  # 来自 ocr_jobs 表的任务: {"id", "image_path", "temporary", "attempts"}
+        self.scroll = None  # 滚动帧只识别新露出的条带: ScrollTracker.detect() 的结果
+
+class OCRPipeline:
+    """OCR流水线：长驻进程池负责识别，采集线程只提交任务后立即返回；
+    回收线程按提交顺序取结果，回填 ocr_text 和 url 到已保存的记录。
+    工作进程数和队列深度来自 capture.ocr_workers / capture.ocr_queue_depth。
+    """
+
+    def __init__(self, workers: int = 2, queue_depth: int = 8, monitor: Optional[LoadMonitor] = None,
+                 db_file: Optional[str] = None):
+        self.workers = max(1, int(workers))
+        self.queue_depth = max(1, int(queue_depth))
+        self.slots = threading.BoundedSemaphore(self.queue_depth)
+        self.jobs = queue.Queue()
+        self.executor = None
+        self.collector_thread = None
+        self.catchup_thread = None
+        self.executor_lock = Lock()
+        self.monitor = monitor or load_monitor
+        self.in_flight = 0  # 已提交、尚未回填完成的任务数
+        self.db_file = db_file or DATABASE_FILE
+        self.deferred = 0  # ocr_jobs 表中等待补做的任务数（由补做线程定期刷新）
+        self.queued_job_ids = set()  # 已从 ocr_jobs 取出、正在识别的任务
+        self.active_jobs = set()     # 已提交、尚未回填完成的任务（关闭超时时转存到 ocr_jobs）
+        self._stopping = threading.Event()
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        initializer = lower_process_priority if get_capture_setting('ocr_low_priority', True) else None
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=initializer)
+
+    def start(self):
+        self.executor = self._new_executor()
+        self.collector_thread = Thread(target=self._collect_results, name="ocr-collector", daemon=True)
+        self.collector_thread.start()
+        recover_ocr_jobs()
+        self.catchup_thread = Thread(target=self._drain_jobs, name="ocr-catchup", daemon=True)
+        self.catchup_thread.start()
+        logging.info(f"OCR进程池已启动：{self.workers} 个工作进程，队列深度 {self.queue_depth}")
+
+    def pending_count(self) -> int:
+        return self.in_flight
+
+    def deferred_count(self) -> int:
+        return self.deferred
+
+    def _allowed_in_flight(self, level: str) -> int:
+        if level == THROTTLE_DEFERRED:
+            return 0
+        if level == THROTTLE_REDUCED:
+            return 1
+        return self.queue_depth
+
+    def state(self) -> Dict[str, Any]:
+        """限流状态，用于诊断"""
+        return {
+            "throttle": self.monitor.level(),
+            "cpu_percent": self.monitor.cpu_percent(),
+            "ocr_cpu_percent": self.monitor.ocr_cpu_percent(),
+            "pending": self.pending_count(),
+            "deferred": self.deferred_count(),
+        }
+
+    def submit(self, frame: Frame, record_id, url: str = "", screenshot_path: Optional[str] = None,
+               window_key=None, lang: str = DEFAULT_OCR_LANG, scroll: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        提交一帧OCR任务，不等待结果；scroll 不为None时只识别新露出的条带。
+        capture.ocr_timing 为 idle、系统繁忙或队列已满时，只把帧登记到 ocr_jobs 表，由补做线程在合适的时机整帧识别。
+        """
+        level = self.monitor.level()
+        if (get_capture_setting('ocr_timing', 'realtime') == 'idle'
+                or self.pending_count() >= self._allowed_in_flight(level)):
+            try:
+                enqueue_ocr_job(record_id, frame, screenshot_path, url)
+            except Exception as e:
+                logging.error(f"登记延后OCR任务失败: {e}", exc_info=True)
+                return False
+            self.deferred += 1
+            logging.info(f"OCR延后执行（{level}），等待补做 {self.deferred} 帧。")
+            return True
+        return self._submit(frame, record_id, url, window_key=window_key, lang=lang, scroll=scroll)
+
+    def _can_drain(self) -> bool:
+        """是否可以补做延后任务：负载不高；ocr_timing 为 idle 时还要求用户已空闲一段时间"""
+        if self.monitor.level() == THROTTLE_DEFERRED:
+            return False
+        if get_capture_setting('ocr_timing', 'realtime') == 'idle':
+            idle_after = float(get_capture_setting('ocr_idle_after', 60))
+            return capture_scheduler.is_paused() or capture_scheduler.idle_seconds() >= idle_after
+        return True
+
+    def _drain_jobs(self):
+        """补做线程：定期从 ocr_jobs 表按登记顺序取出一批任务提交识别，进程重启后自动继续"""
+        conn = None
+        while not self._stopping.wait(LOAD_SAMPLE_INTERVAL):
+            try:
+                if conn is None:
+                    conn = sqlite3.connect(self.db_file, timeout=5)
+                self._drain_once(conn)
+            except sqlite3.Error as e:
+                logging.warning(f"读取延后OCR任务失败: {e}")
+                if conn is not None:
+                    conn.close()
+                conn = None
+        if conn is not None:
+            conn.close()
+
+    def _drain_once(self, conn):
+        self.deferred = conn.execute(
+            "SELECT COUNT(*) FROM ocr_jobs WHERE attempts < ?", (MAX_OCR_ATTEMPTS,)
+        ).fetchone()[0]
+        if not self.deferred or not self._can_drain():
+            return
+        free = self._allowed_in_flight(self.monitor.level()) - self.pending_count()
+        batch = min(free, max(1, int(get_capture_setting('ocr_batch_size', 8))))
+        if batch <= 0:
+            return
+        rows = conn.execute(
+            "SELECT id, record_id, image_path, temporary, url, attempts, created_ts FROM ocr_jobs "
+            "WHERE attempts < ? ORDER BY id LIMIT ?",
+            (MAX_OCR_ATTEMPTS, batch + len(self.queued_job_ids)),
+        ).fetchall()
+        now = epoch_millis(datetime.now())
+        for job_id, record_id, image_path, temporary, url, attempts, created_ts in rows:
+            if batch <= 0:
+                break
+            if job_id in self.queued_job_ids:
+                continue
+            if not os.path.exists(image_path):
+                if now - created_ts > MISSING_FRAME_GRACE_MS:
+                    self._fail_queued_job(job_id, record_id, "帧文件不存在")
+                continue
+            queued = {"id": job_id, "image_path": image_path, "temporary": bool(temporary), "attempts": attempts}
+            if not self._submit_file(record_id, url or "", queued):
+                break
+            batch -= 1
+
+    def _fail_queued_job(self, job_id, record_id, error: str):
+        writer = get_db_writer()
+        writer.execute(
+            "UPDATE ocr_jobs SET attempts = ?, last_error = ? WHERE id = ?", (MAX_OCR_ATTEMPTS, error, job_id)
+        )
+        # 只覆盖尚未回填的记录，迟到的失败不能覆盖已识别出的文本
+        writer.execute(
+            "UPDATE activity_log SET ocr_text = ? WHERE id = ? AND ocr_text IS NULL", (f"OCR处理失败: {error}", record_id)
+        )
+
+    def _submit_file(self, record_id, url: str, queued: Dict[str, Any]) -> bool:
+        if not self.slots.acquire(blocking=False):
+            return False
+        try:
+            job = OCRJob(record_id, None, None, url=url)
+            job.queued = queued
+            with self.executor_lock:
+                job.executor = self.executor
+                job.future = self.executor.submit(ocr_worker_task, 'file', [((0, 0), queued["image_path"])])
+                self.in_flight += 1
+                self.active_jobs.add(job)
+            self.queued_job_ids.add(queued["id"])
+            self.jobs.put(job)
+            return True
+        except Exception as e:
+            self.slots.release()
+            logging.error(f"提交延后OCR任务失败: {e}", exc_info=True)
+            return False
+
+    def _submit(self, frame: Frame, record_id, url: str = "", window_key=None, lang: str = DEFAULT_OCR_LANG,
+                scroll: Optional[Dict[str, Any]] = None) -> bool:
+        if not self.slots.acquire(blocking=False):
+            logging.warning("OCR任务队列已满，本帧不做OCR。")
+            return False
+        try:
+            if scroll is not None:
+                regions = [((0, 0), frame.image.crop(scroll["box"]))]
+                job = OCRJob(record_id, None, frame.geometry, url=url, window_key=window_key, lang=lang)
+                job.scroll = scroll
+                mode = 'text'
+            elif get_capture_setting('enable_tile_ocr', True):
+                dirty, rects = tile_ocr_cache.plan(frame)
+                regions = [(rect[:2], frame.image.crop(rect)) for rect in rects]
+                job = OCRJob(record_id, None, frame.geometry, dirty_tiles=dirty, url=url, window_key=window_key, lang=lang)
+                mode = 'words'
+            else:
+                regions = [((0, 0), frame.image)]
+                job = OCRJob(record_id, None, frame.geometry, url=url, window_key=window_key, lang=lang)
+                mode = 'text'
+            with self.executor_lock:
+                job.executor = self.executor
+                job.future = self.executor.submit(ocr_worker_task, mode, regions, lang)
+                self.in_flight += 1
+                self.active_jobs.add(job)
+            self.jobs.put(job)
+            return True
+        except Exception as e:
+            self.slots.release()
+            logging.error(f"提交OCR任务失败: {e}", exc_info=True)
+            return False
+
+    def _collect_results(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                self.jobs.task_done()
+                break
+            try:
+                self._finish_job(job)
+            finally:
+                with self.executor_lock:
+                    self.in_flight -= 1
+                    self.active_jobs.discard(job)
+                self.slots.release()
+                self.jobs.task_done()
+
+    def _finish_job(self, job: OCRJob):
+        failed = False
+        try:
+            result = job.future.result()
+            if job.scroll is not None:
+                ocr_text = merge_scroll_text(job.scroll["text"], result, job.scroll["shift"])
+            elif job.dirty_tiles is None:
+                ocr_text = result
+            else:
+                ocr_text = tile_ocr_cache.apply(job.geometry, job.dirty_tiles, result) or "未检测到文本内容"
+            logging.info(f"异步OCR完成 (记录 {job.record_id}, {job.lang})，文本长度: {len(ocr_text)}")
+            ocr_language_selector.observe(job.window_key, job.lang, ocr_text)
+            scroll_tracker.set_text(job.window_key, job.record_id, ocr_text)
+        except Exception as e:
+            logging.error(f"异步OCR失败 (记录 {job.record_id}): {e}", exc_info=True)
+            if job.dirty_tiles is not None:
+                tile_ocr_cache.invalidate(job.dirty_tiles)
+            if isinstance(e, BrokenProcessPool):
+                self._restart_executor(job.executor)
+            ocr_text = f"OCR处理失败: {str(e)}"
+            failed = True
+
+        if job.queued is not None and not self._finish_queued_job(job, failed, ocr_text):
+            self._release_queued_job(job.queued, finished=False)
+            return  # 还会重试，暂不回填
+        fields = {"ocr_text": ocr_text}
+        urls = [] if failed else extract_urls(ocr_text)
+        if not job.url and urls:
+            url = max((url for url, _ in urls), key=len)
+            logging.info(f"从OCR文本中获取到URL: {url}")
+            fields["url"] = url
+        update_record(job.record_id, fields)
+        save_record_urls(job.record_id, urls, "ocr")
+        if job.queued is not None:
+            self._release_queued_job(job.queued, finished=True)
+
+    def _finish_queued_job(self, job: OCRJob, failed: bool, ocr_text: str) -> bool:
+        """更新 ocr_jobs 中的任务状态；返回是否应回填识别结果（失败且还有重试次数时返回False）"""
+        queued = job.queued
+        writer = get_db_writer()
+        if failed:
+            writer.execute(
+                "UPDATE ocr_jobs SET attempts = attempts + 1, last_error = ? WHERE id = ?", (ocr_text, queued["id"])
+            )
+            if queued["attempts"] + 1 < MAX_OCR_ATTEMPTS:
+                return False
+        else:
+            writer.execute("DELETE FROM ocr_jobs WHERE id = ?", (queued["id"],))
+        return True
+
+    def _release_queued_job(self, queued: Dict[str, Any], finished: bool):
+        """
+        任务状态和回填结果提交到数据库后，才删除临时帧文件并允许补做线程再次取出该任务；
+        否则补做线程可能在提交前再次取到任务、发现帧文件已删除，把已回填的文本覆盖为失败。
+        """
+        def release():
+            if finished and queued["temporary"]:
+                try:
+                    os.remove(queued["image_path"])
+                except OSError:
+                    pass
+            self.queued_job_ids.discard(queued["id"])
+        get_db_writer().when_committed(release)
+
+    def _restart_executor(self, broken_executor):
+        with self.executor_lock:
+            if broken_executor is not self.executor:
+                return  # 已经重建过
+            logging.warning("OCR进程池异常退出，正在重建...")
+            try:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+            except Exception:
+                pass
+            self.executor = self._new_executor()
+
+    def shutdown(self, wait: bool = True, timeout: Optional[float] = None):
+        """
+        停止接收任务；wait=True 时等待已提交的任务全部回填完成（ocr_jobs 中未补做的任务下次启动后继续）。
+        timeout 到期仍未完成时，把尚未回填的记录转存为 ocr_jobs 任务（从已保存的截图识别），下次启动后立即补做。
+        """
+        self._stopping.set()
+        self.jobs.put(None)
+        if wait and self.collector_thread:
+            self.collector_thread.join(timeout)
+            if self.collector_thread.is_alive():
+                self._hand_over_active_jobs()
+                wait = False
+        if self.executor:
+            self.executor.shutdown(wait=wait, cancel_futures=not wait)
+        logging.info("OCR进程池已关闭。")
+
+    def _hand_over_active_jobs(self):
+        with self.executor_lock:
+            jobs = [job for job in self.active_jobs if job.queued is None]
+        record_ids = []
+        for job in jobs:
+            try:
+                record_ids.append(job.record_id.result(timeout=1) if isinstance(job.record_id, Future) else job.record_id)
+            except Exception:
+                continue
+        if not record_ids:
+            return
+        placeholders = ','.join('?' * len(record_ids))
+        get_db_writer().execute(
+            "INSERT OR IGNORE INTO ocr_jobs (record_id, image_path, temporary, url, created_ts) "
+            "SELECT id, screenshot_path, 0, url, COALESCE(ts, 0) FROM activity_log "
+            f"WHERE id IN ({placeholders}) AND ocr_text IS NULL AND screenshot_path IS NOT NULL",
+            record_ids,
+        )
+        logging.warning(f"关闭OCR进程池超时，{len(record_ids)} 条记录转为延后OCR任务，下次启动后补做")
+
+ocr_pipeline = None
+ocr_pipeline_lock = Lock()
+
+def get_ocr_pipeline() -> Optional[OCRPipeline]:
+    """按配置懒加载OCR进程池；capture.ocr_workers 为0时返回None（在采集线程中同步OCR）"""
+    global ocr_pipeline
+    workers = get_capture_setting('ocr_workers', 2)
+    if not workers:
+        return None
+    with ocr_pipeline_lock:
+        if ocr_pipeline is None:
+            ocr_pipeline = OCRPipeline(workers, get_capture_setting('ocr_queue_depth', 8))
+            ocr_pipeline.start()
+        return ocr_pipeline
+
+def shutdown_ocr_pipeline(wait: bool = True, background: bool = False, timeout: Optional[float] = None):
+    """关闭OCR进程池；background=True 时在后台线程中等待已提交任务回填完成，调用方立即返回；
+    timeout 见 OCRPipeline.shutdown()"""
+    global ocr_pipeline
+    with ocr_pipeline_lock:
+        pipeline, ocr_pipeline = ocr_pipeline, None
+    if pipeline is None:
+        return
+    if background:
+        Thread(target=pipeline.shutdown, kwargs={"wait": wait}, name="ocr-drain", daemon=True).start()
+    else:
+        pipeline.shutdown(wait=wait, timeout=timeout)
+
+def run_ocr(frame: Frame, lang: str = DEFAULT_OCR_LANG) -> str:
+    """在当前线程中同步OCR"""
+    if get_capture_setting('enable_tile_ocr', True):
+        return extract_text_incremental(frame, lang)
+    return extract_text_with_tesseract(frame.image, lang)
+
+# --- 点击区域优先OCR ---
+TITLE_BAR_HEIGHT = 40       # 前台窗口顶部按标题栏识别的高度（像素）
+MIN_FOCUS_REGION_SIZE = 8   # 裁剪到帧内后宽或高小于该值的区域不识别
+
+def click_focus_rects(frame: Frame, x: int, y: int, window_rect: Optional[tuple] = None) -> List[tuple]:
+    """点击位置周围的矩形（大小来自 capture.click_ocr_width/click_ocr_height）和前台窗口标题栏，
+    换算为帧内坐标 (left, top, right, bottom) 并裁剪到帧内；两者重叠时合并为一个区域"""
+    half_width = int(get_capture_setting('click_ocr_width', 640)) // 2
+    half_height = int(get_capture_setting('click_ocr_height', 160)) // 2
+    rects = [(x - half_width, y - half_height, x + half_width, y + half_height)]
+    if window_rect:
+        left, top, right, _ = window_rect
+        title_bar = (left, top, right, top + TITLE_BAR_HEIGHT)
+        click_rect = rects[0]
+        if click_rect[1] < title_bar[3] and title_bar[1] < click_rect[3]:
+            rects = [(min(left, click_rect[0]), min(top, click_rect[1]),
+                      max(right, click_rect[2]), max(title_bar[3], click_rect[3]))]
+        else:
+            rects.insert(0, title_bar)
+    frame_width, frame_height = frame.size
+    boxes = []
+    for left, top, right, bottom in rects:
+        box = (max(0, left - frame.left), max(0, top - frame.top),
+               min(frame_width, right - frame.left), min(frame_height, bottom - frame.top))
+        if box[2] - box[0] >= MIN_FOCUS_REGION_SIZE and box[3] - box[1] >= MIN_FOCUS_REGION_SIZE:
+            boxes.append(box)
+    return boxes
 
-def record_screen_activity(triggered_by="timer"):
+def ocr_click_region(frame: Frame, click: Dict[str, Any], lang: str = DEFAULT_OCR_LANG) -> str:
+    """只识别点击位置附近和标题栏：在点击线程中同步执行，不在OCR进程池中排队，也不受负载限流影响"""
+    start = time.monotonic()
+    parts = []
+    for box in click_focus_rects(frame, click["x"], click["y"], platform_provider.get_foreground_window_rect()):
+        text = extract_text_with_tesseract(frame.image.crop(box), lang)
+        if not text.startswith(OCR_PLACEHOLDER_TEXTS):
+            parts.append(text)
+    latency = time.monotonic() - start
+    click_metrics.record_focus(latency)
+    logging.info(f"点击区域OCR完成，耗时 {latency * 1000:.0f}ms，文本长度: {sum(len(part) for part in parts)}")
+    return " | ".join(parts)
+
+def click_record_fields(click: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """点击触发的记录中保存的鼠标信息"""
+    if not click:
+        return {}
+    return {"mouse_x": click["x"], "mouse_y": click["y"], "button": click.get("button"), "pressed": 1}
+
+def record_screen_activity(triggered_by="timer", frame: Optional[Frame] = None,
+                           click: Optional[Dict[str, Any]] = None):
+    """
+    采集一帧并记录，返回画面是否有新内容（供调度器判断屏幕变化率）；可传入已抓取好的帧。
+    click 为触发采集的点击 {"x", "y", "button"}：先同步识别点击附近区域，
+    整帧OCR只在 capture.click_full_frame_ocr 开启时登记为低优先级的延后任务。
+    """
     timestamp = datetime.now().isoformat()
     window_title, pid, process_name, app_name = get_active_window_info()
+    window_key = (app_name, window_title)
     
-    screenshot_path = capture_screenshot()
-    ocr_text = ""
-    url = ""
+    if frame is None:
+        frame = grab_frame(get_capture_region())
+    screenshot_path = None
+    frame_hash = None
+    ocr_lang = ocr_language_selector.choose(window_key)
+    click_text = None
+    if click and frame is not None:
+        try:
+            click_text = ocr_click_region(frame, click, ocr_lang)
+        except Exception as e:
+            logging.error(f"点击区域OCR失败: {e}", exc_info=True)
     
-    if screenshot_path:
-        logging.info(f"截图已保存: {screenshot_path}")
+    if frame is not None:
+        # 去重：与同一窗口的上一帧内容完全相同时只写一条轻量心跳记录（不保存新图、不做OCR）；
+        # 有细微变化的帧照常处理，由分块OCR只识别变化的块
         try:
-            ocr_text = extract_text_with_tesseract(screenshot_path)
-            logging.info("Tesseract OCR 解析完成。")
+            frame_hash = compute_frame_hash(frame)
+            previous = find_duplicate_frame(window_key, frame_hash)
         except Exception as e:
-            logging.error(f"使用 Tesseract OCR 解析图像时出错: {e}", exc_info=True)
-            ocr_text = f"OCR失败: {e}"
+            logging.debug(f"计算帧摘要失败: {e}")
+            previous = None
+
+        if previous is not None:
+            logging.info("画面与上一帧相同，跳过OCR，仅记录心跳。")
+            save_record({
+                "timestamp": timestamp,
+                "record_type": "screen_unchanged",
+                "triggered_by": triggered_by,
+                "window_title": window_title,
+                "app_name": app_name,
+                "pid": pid,
+                "process_name": process_name,
+                "screenshot_path": previous["screenshot_path"],
+                "url": previous["url"],
+                "ref_id": previous["record_id"],
+                "click_text": click_text,
+                **click_record_fields(click),
+            })
+            return False
+
+        screenshot_path = save_frame_async(frame)
+        if screenshot_path:
+            logging.info(f"截图将保存到: {screenshot_path}")
     else:
         logging.warning("未捕获截图，OCR步骤已跳过。")
     
-    # 尝试获取浏览器URL
+    # 尝试获取浏览器URL（依赖当前前台窗口，必须在采集时获取）
+    url = ""
     try:
         url = get_browser_url(app_name, window_title)
-        if not url and ocr_text:
-            # 如果直接获取失败，尝试从OCR文本中提取
-            url = extract_url_from_ocr(ocr_text)
-        
-        if url:
-            logging.info(f"获取到URL: {url}")
     except Exception as e:
         logging.debug(f"URL获取过程出错: {e}")
+    browser_url = normalize_url(url) if url else None
+
+    # 滚动检测：画面只是同一窗口上一帧的纵向滚动时，只识别新露出的条带
+    scroll = None
+    if frame is not None and click is None and get_capture_setting('enable_scroll_detection', True):
+        try:
+            scroll = scroll_tracker.detect(window_key, frame, platform_provider.get_foreground_window_rect())
+        except Exception as e:
+            logging.debug(f"滚动检测失败: {e}")
+            scroll_tracker.forget(window_key)
+
+    # 有进程池时OCR异步进行，记录先以 ocr_text=NULL 保存，完成后回填
+    pipeline = get_ocr_pipeline() if frame is not None else None
+    ocr_text = None if pipeline else ""
+    ocr_urls = []
+    full_frame_job = False
+    if click and frame is not None:
+        # 点击附近的文本立即可查；整帧OCR只作为可选的后台任务（没有进程池时不做）
+        ocr_text = click_text or "未检测到文本内容"
+        ocr_urls = extract_urls(click_text or "")
+        full_frame_job = pipeline is not None and get_capture_setting('click_full_frame_ocr', True)
+        if full_frame_job and not click_text:
+            ocr_text = None
+        if not url and ocr_urls:
+            url = max((found for found, _ in ocr_urls), key=len)
+    elif frame is not None and pipeline is None:
+        try:
+            if scroll is not None:
+                strip_text = extract_text_with_tesseract(frame.image.crop(scroll["box"]), ocr_lang)
+                ocr_text = merge_scroll_text(scroll["text"], strip_text, scroll["shift"])
+            else:
+                ocr_text = run_ocr(frame, ocr_lang)
+            ocr_language_selector.observe(window_key, ocr_lang, ocr_text)
+            ocr_urls = extract_urls(ocr_text)
+            logging.info("Tesseract OCR 解析完成。")
+        except Exception as e:
+            logging.error(f"使用 Tesseract OCR 解析图像时出错: {e}", exc_info=True)
+            ocr_text = f"OCR失败: {e}"
+        if not url and ocr_urls:
+            # 如果直接获取失败，使用OCR文本中最完整的URL
+            url = max((found for found, _ in ocr_urls), key=len)
+    
+    if url:
+        logging.info(f"获取到URL: {url}")
     
     record_data = {
         "timestamp": timestamp,
@@ -322,58 +2205,516 @@ def record_screen_activity(triggered_by="timer"):
         "screenshot_path": screenshot_path,
         "ocr_text": ocr_text,
         "url": url,  # 添加URL字段
+        "click_text": click_text,
+        **click_record_fields(click),
     }
-    save_record(record_data)
+    record_id = save_record(record_data)
+    if browser_url:
+        save_record_urls(record_id, [browser_url], "browser", record_data["ts"])
+    save_record_urls(record_id, ocr_urls, "ocr", record_data["ts"])
+    if frame_hash is not None:
+        remember_frame(window_key, frame_hash, record_id, screenshot_path, url)
+    if frame is not None and click is None:
+        scroll_tracker.attach(window_key, record_id, ocr_text)
+    if full_frame_job:
+        try:
+            enqueue_ocr_job(record_id, frame, screenshot_path, url)
+        except Exception as e:
+            logging.error(f"登记整帧OCR后台任务失败: {e}", exc_info=True)
+    elif click is None and pipeline is not None and not pipeline.submit(frame, record_id, url, screenshot_path,
+                                                                         window_key, ocr_lang, scroll):
+        update_record(record_id, {"ocr_text": "OCR任务队列已满，本帧未识别"})
+    return frame is not None
+
+# --- 自适应采集调度 ---
+SCHEDULER_WAIT_SLICE = 1.0  # 单次等待上限（秒），保证停止信号和 Ctrl+C 能及时响应
+MAX_BACKOFF_STEPS = 10
+
+class CaptureScheduler:
+    """
+    根据用户输入和屏幕变化率决定下一次定时截图的时间：
+    - 有输入且画面在变化：按 min_capture_interval 加速采集
+    - 画面连续未变化：从 capture_interval 开始指数退避，最长 max_capture_interval
+    - 超过 idle_pause_timeout 没有任何输入：暂停采集，直到再次检测到输入
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._wakeup = threading.Event()
+        now = time.monotonic()
+        self._last_input = now
+        self._last_capture = None
+        self._last_changed = True
+        self._unchanged_streak = 0
+        self._interval = 0.0
+        self._reason = "启动"
+        self._paused = False
+        self._manual_pause = False
+
+    def _settings(self):
+        base = max(1.0, float(get_capture_setting('capture_interval', 60)))
+        min_interval = min(base, max(1.0, float(get_capture_setting('min_capture_interval', 10))))
+        max_interval = max(base, float(get_capture_setting('max_capture_interval', 600)))
+        idle_timeout = float(get_capture_setting('idle_pause_timeout', 300))
+        adaptive = bool(get_capture_setting('adaptive_capture', True))
+        return base, min_interval, max_interval, idle_timeout, adaptive
+
+    def notify_input(self):
+        """pynput 监听到鼠标/键盘输入时调用，只记录时间，开销极低"""
+        now = time.monotonic()
+        with self._lock:
+            idle_for = now - self._last_input
+            self._last_input = now
+            # 只在从空闲/退避状态恢复时唤醒等待线程，避免鼠标移动事件频繁唤醒
+            if self._paused or idle_for >= self._interval:
+                self._wakeup.set()
+
+    def wake(self):
+        """立即唤醒等待中的采集线程（停止/恢复时使用）"""
+        self._wakeup.set()
+
+    def pause(self):
+        with self._lock:
+            self._manual_pause = True
+        self.wake()
+
+    def resume(self):
+        with self._lock:
+            self._manual_pause = False
+            self._last_input = time.monotonic()
+        self.wake()
+
+    def record_capture(self, changed: bool):
+        """一次定时采集完成后调用，changed 表示画面是否有新内容"""
+        with self._lock:
+            self._last_capture = time.monotonic()
+            self._last_changed = changed
+            self._unchanged_streak = 0 if changed else self._unchanged_streak + 1
+
+    def _evaluate(self, now):
+        """计算当前应使用的采集间隔和原因，需持有锁"""
+        base, min_interval, max_interval, idle_timeout, adaptive = self._settings()
+        if self._manual_pause:
+            return None, "已手动暂停", True
+        if not adaptive:
+            return base, "固定间隔", False
+        idle_for = now - self._last_input
+        if idle_timeout > 0 and idle_for >= idle_timeout:
+            return None, f"空闲超过 {idle_timeout:.0f}s，暂停采集", True
+        input_active = idle_for < base
+        if self._last_changed:
+            if input_active:
+                return min_interval, "有输入且画面变化，加速采集", False
+            return base, "画面变化", False
+        steps = min(self._unchanged_streak, MAX_BACKOFF_STEPS)
+        interval = min(base * (2 ** steps), max_interval)
+        if input_active:
+            # 有输入时画面随时可能变化，退避不超过基础间隔
+            return base, "有输入但画面未变化", False
+        return interval, f"画面连续 {self._unchanged_streak} 次未变化，退避", False
+
+    def _update_state(self, interval, reason, paused):
+        if (interval or 0.0) != self._interval or paused != self._paused:
+            logging.info(f"采集调度: {reason}" + (f"，间隔 {interval:.0f}s" if interval else ""))
+        self._interval = interval or 0.0
+        self._reason = reason
+        self._paused = paused
+
+    def wait(self, stop_event: threading.Event) -> bool:
+        """阻塞到下一次应当采集的时刻；stop_event 被设置时返回 False"""
+        while not stop_event.is_set():
+            now = time.monotonic()
+            with self._lock:
+                interval, reason, paused = self._evaluate(now)
+                self._update_state(interval, reason, paused)
+                self._wakeup.clear()
+                if not paused:
+                    if self._last_capture is None:
+                        return True
+                    remaining = self._last_capture + interval - now
+                    if remaining <= 0:
+                        return True
+            timeout = SCHEDULER_WAIT_SLICE if paused else min(remaining, SCHEDULER_WAIT_SLICE)
+            self._wakeup.wait(timeout)
+        return False
+
+    def idle_seconds(self) -> float:
+        """距离最近一次输入的秒数"""
+        with self._lock:
+            return time.monotonic() - self._last_input
+
+    def is_paused(self) -> bool:
+        """是否处于暂停状态（空闲超时或手动暂停）"""
+        with self._lock:
+            return self._paused
+
+    def state(self) -> Dict[str, Any]:
+        """当前调度状态，用于诊断"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "interval": self._interval,
+                "reason": self._reason,
+                "paused": self._paused,
+                "idle_seconds": round(now - self._last_input, 1),
+                "unchanged_streak": self._unchanged_streak,
+                "seconds_since_capture": None if self._last_capture is None else round(now - self._last_capture, 1),
+            }
+
+capture_scheduler = CaptureScheduler()
+
+def run_capture_loop(stop_event: threading.Event, scheduler: Optional[CaptureScheduler] = None):
+    """定时采集主循环，由调度器决定采集时机，直到 stop_event 被设置"""
+    scheduler = scheduler or capture_scheduler
+    while scheduler.wait(stop_event):
+        changed = False
+        try:
+            changed = record_screen_activity(triggered_by="timer")
+        except Exception as e:
+            logging.error(f"定时采集发生错误: {e}", exc_info=True)
+        scheduler.record_capture(changed)
 
 # --- 鼠标点击处理 ---
+# --- 点击触发采集：连击合并 + 画面稳定检测 ---
+SETTLE_POLL_INTERVAL = 0.1    # 稳定检测的抓帧间隔（秒）
+SETTLE_SAMPLE_STEP = 8        # 稳定检测时每隔多少像素取样一次（低分辨率比较）
+SETTLE_CHANGE_RATIO = 0.002   # 取样像素变化比例低于该值视为画面未变化
+
+class ClickMetrics:
+    """点击采集的统计数据：队列深度、合并/丢弃次数、等待画面稳定和点击区域OCR的耗时"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.clicks = 0
+            self.captures = 0
+            self.merged = 0
+            self.dropped = 0
+            self.settle_timeouts = 0
+            self.settle_total = 0.0
+            self.settle_max = 0.0
+            self.last_settle = 0.0
+            self.focus_ocrs = 0
+            self.focus_total = 0.0
+            self.focus_max = 0.0
+
+    def add(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def record_settle(self, latency: float, settled: bool):
+        with self._lock:
+            self.captures += 1
+            self.last_settle = latency
+            self.settle_total += latency
+            self.settle_max = max(self.settle_max, latency)
+            if not settled:
+                self.settle_timeouts += 1
+
+    def record_focus(self, latency: float):
+        with self._lock:
+            self.focus_ocrs += 1
+            self.focus_total += latency
+            self.focus_max = max(self.focus_max, latency)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "queue_depth": click_queue.qsize(),
+                "clicks": self.clicks,
+                "captures": self.captures,
+                "merged": self.merged,
+                "dropped": self.dropped,
+                "settle_timeouts": self.settle_timeouts,
+                "settle_last_ms": round(self.last_settle * 1000, 1),
+                "settle_avg_ms": round(self.settle_total / self.captures * 1000, 1) if self.captures else 0.0,
+                "settle_max_ms": round(self.settle_max * 1000, 1),
+                "focus_ocr_avg_ms": round(self.focus_total / self.focus_ocrs * 1000, 1) if self.focus_ocrs else 0.0,
+                "focus_ocr_max_ms": round(self.focus_max * 1000, 1),
+            }
+
+click_metrics = ClickMetrics()
+
+def get_click_metrics() -> Dict[str, Any]:
+    """点击采集统计，用于诊断"""
+    return click_metrics.snapshot()
+
+def settle_sample(frame: Frame) -> np.ndarray:
+    """按固定步长取样得到低分辨率画面（只复制取样像素）"""
+    return frame.array[::SETTLE_SAMPLE_STEP, ::SETTLE_SAMPLE_STEP, :3].copy()
+
+def wait_for_screen_settle(timeout: float, region: Optional[Dict[str, int]] = None):
+    """
+    连续抓取低分辨率画面，直到相邻两帧基本不变或超时。
+    返回 (最后一帧, 是否已稳定, 耗时秒数)，最后一帧可直接用于记录，避免再抓一次。
+    """
+    start = time.monotonic()
+    deadline = start + timeout
+    frame = grab_frame(region)
+    previous = settle_sample(frame) if frame is not None else None
+    while previous is not None and time.monotonic() < deadline:
+        time.sleep(SETTLE_POLL_INTERVAL)
+        current_frame = grab_frame(region)
+        if current_frame is None:
+            break
+        current = settle_sample(current_frame)
+        frame = current_frame
+        if current.shape == previous.shape:
+            changed = np.count_nonzero(np.any(current != previous, axis=2))
+            if changed <= SETTLE_CHANGE_RATIO * current.shape[0] * current.shape[1]:
+                return frame, True, time.monotonic() - start
+        previous = current
+    return frame, False, time.monotonic() - start
+
+def collect_click_burst(first_task: dict, window: float) -> Optional[dict]:
+    """合并连击：持续取出队列中的点击，直到 window 秒内没有新的点击；返回最后一次点击，收到停止信号时返回None"""
+    last_task = first_task
+    while True:
+        try:
+            task = click_queue.get(timeout=window)
+        except queue.Empty:
+            return last_task
+        click_queue.task_done()
+        if task is None:
+            return None
+        last_task = task
+        click_metrics.add(merged=1)
+
 def process_click_task(task_data):
-    time.sleep(1) # 等待1秒，确保点击后的UI变化已经渲染完成
-    record_screen_activity(triggered_by="mouse_click")
+    # 不再固定等待1秒：等画面稳定（相邻低分辨率帧不再变化）后再采集，最长等待 click_settle_timeout
+    timeout = float(get_capture_setting('click_settle_timeout', 2.0))
+    frame, settled, latency = wait_for_screen_settle(timeout, get_capture_region())
+    click_metrics.record_settle(latency, settled)
+    if not settled:
+        logging.info(f"点击后画面在 {latency:.2f}s 内未稳定，直接采集。")
+    record_screen_activity(triggered_by="mouse_click", frame=frame, click=task_data)
 
-def click_processing_worker():
+def click_processing_worker(stop_event: Optional[threading.Event] = None,
+                            pause_event: Optional[threading.Event] = None):
+    """点击采集线程；队列中的 None 或 stop_event 表示停止，pause_event 被设置时丢弃点击"""
     while True:
         task_data = click_queue.get()
-        process_click_task(task_data)
-        click_queue.task_done()
+        try:
+            if task_data is None or (stop_event is not None and stop_event.is_set()):
+                break
+            if pause_event is not None and pause_event.is_set():
+                click_metrics.add(dropped=1)
+                continue
+            window = float(get_capture_setting('click_coalesce_window', 0.5))
+            if window > 0:
+                task_data = collect_click_burst(task_data, window)
+                if task_data is None:
+                    break
+            process_click_task(task_data)
+        except Exception as e:
+            logging.error(f"处理点击采集任务出错: {e}", exc_info=True)
+        finally:
+            click_queue.task_done()
 
 def handle_mouse_click_activity(x, y, button, pressed):
+    capture_scheduler.notify_input()
     if pressed:
         logging.info(f"鼠标点击事件: {button} at ({x}, {y})")
-        click_queue.put({"x": x, "y": y, "button": str(button)})
+        click_metrics.add(clicks=1)
+        try:
+            click_queue.put_nowait({"x": x, "y": y, "button": str(button), "time": time.monotonic()})
+        except queue.Full:
+            click_metrics.add(dropped=1)
+
+def handle_input_activity(*args):
+    """鼠标移动/滚轮/键盘事件只用于判断用户是否活跃，不记录具体内容"""
+    capture_scheduler.notify_input()
 
 # --- 监听器 ---
-def start_mouse_listener():
-    if mouse:
-        listener = mouse.Listener(on_click=handle_mouse_click_activity)
-        listener.start()
-        logging.info("鼠标监听器已启动。")
-        return listener
-    return None
+def drain_click_queue():
+    """清空点击队列中上次运行遗留的任务和结束标记（启动点击线程前调用）"""
+    while True:
+        try:
+            click_queue.get_nowait()
+        except queue.Empty:
+            return
+        click_queue.task_done()
 
-def main():
-    init_db()
-    
-    # 启动点击处理工作线程
-    click_worker_thread = Thread(target=click_processing_worker, daemon=True)
-    click_worker_thread.start()
+def start_input_listeners(capture_clicks=True) -> list:
+    """通过当前平台实现启动输入监听；capture_clicks=False 时点击只用于判断活跃度"""
+    on_click = handle_mouse_click_activity if capture_clicks else None
+    return platform_provider.start_input_listeners(on_click, handle_input_activity)
 
-    # 启动鼠标监听器
-    mouse_listener = start_mouse_listener()
+# --- 窗口切换事件 ---
+class WindowWatcher:
+    """
+    轻量的前台窗口轮询：只读取窗口信息（不截图、不OCR），前台应用或窗口标题变化时写入 window_change 记录。
+    用户空闲（调度器暂停）或监视停止时写入 to_app 为空的记录，表示这段时间不计入任何应用的使用时长。
+    轮询间隔来自 capture.window_poll_interval。
+    """
 
-    # 主循环，用于定时截图
-    logging.info("屏幕活动记录已开始。定时截图周期为60秒。")
-    while True:
+    def __init__(self, scheduler: Optional[CaptureScheduler] = None):
+        self.scheduler = scheduler or capture_scheduler
+        self.current = None  # (app_name, window_title)，None 表示空闲/未知
+
+    def _switch(self, window_info: Optional[tuple]):
+        previous_app = self.current[0] if self.current else None
+        if window_info is None:
+            self.current = None
+            record = {"event_type": "idle", "from_app": previous_app}
+        else:
+            window_title, pid, process_name, app_name = window_info
+            self.current = (app_name, window_title)
+            record = {
+                "event_type": "switch",
+                "window_title": window_title,
+                "app_name": app_name,
+                "pid": pid,
+                "process_name": process_name,
+                "from_app": previous_app,
+                "to_app": app_name,
+                "to_app_title": window_title,
+            }
+        record.update({
+            "timestamp": datetime.now().isoformat(),
+            "record_type": "window_change",
+            "triggered_by": "window_poll",
+        })
+        save_record(record)
+
+    def poll(self):
+        if self.scheduler.is_paused():
+            if self.current is not None:
+                self._switch(None)
+            return
+        window_info = get_active_window_info()
+        if (window_info[3], window_info[0]) != self.current:
+            self._switch(window_info)
+
+    def run(self, stop_event: threading.Event):
+        while not stop_event.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                logging.debug(f"轮询前台窗口失败: {e}")
+            stop_event.wait(max(0.1, float(get_capture_setting('window_poll_interval', 0.5))))
+        if self.current is not None:
+            self._switch(None)
+
+# --- 采集服务 ---
+class CaptureService:
+    """
+    统一的采集服务：负责定时采集线程、点击采集线程、窗口切换监视、输入监听器、写入线程和OCR进程池。
+    GUI 和命令行都通过它启动/停止/暂停采集；停止和暂停通过事件通知，不依赖sleep，能立即生效。
+    capture.* 配置每次使用时实时读取。
+    """
+
+    def __init__(self, scheduler: Optional[CaptureScheduler] = None):
+        self.scheduler = scheduler or capture_scheduler
+        self._lock = Lock()
+        self._stop_event = threading.Event()
+        self._pause_event = threading.Event()
+        self._threads: List[Thread] = []
+        self._listeners = []
+
+    def is_running(self) -> bool:
+        with self._lock:
+            return any(thread.is_alive() for thread in self._threads)
+
+    def is_paused(self) -> bool:
+        return self._pause_event.is_set()
+
+    def start(self):
+        """启动采集；已在运行时不重复启动"""
+        with self._lock:
+            if any(thread.is_alive() for thread in self._threads):
+                return
+            init_db()
+            get_db_writer()
+            get_ocr_pipeline()
+            self._stop_event = threading.Event()
+            self._pause_event.clear()
+            self.scheduler.resume()
+            capture_clicks = bool(get_capture_setting('enable_click_capture', True))
+            self._threads = [Thread(target=run_capture_loop, args=(self._stop_event, self.scheduler),
+                                    name="capture-timer", daemon=True)]
+            if capture_clicks:
+                drain_click_queue()
+                self._threads.append(Thread(target=click_processing_worker, args=(self._stop_event, self._pause_event),
+                                            name="capture-click", daemon=True))
+            if get_capture_setting('enable_window_events', True):
+                self._threads.append(Thread(target=WindowWatcher(self.scheduler).run, args=(self._stop_event,),
+                                            name="capture-window", daemon=True))
+            for thread in self._threads:
+                thread.start()
+            self._listeners = start_input_listeners(capture_clicks)
+        logging.info(f"采集服务已启动。基础截图间隔为{get_capture_setting('capture_interval', 60)}秒。")
+
+    def pause(self):
+        """暂停采集（线程保留，定时和点击采集都不再进行）"""
+        self._pause_event.set()
+        self.scheduler.pause()
+        logging.info("采集服务已暂停。")
+
+    def resume(self):
+        self._pause_event.clear()
+        self.scheduler.resume()
+        logging.info("采集服务已恢复。")
+
+    def stop(self, timeout: float = 5.0, wait_for_ocr: bool = False, ocr_timeout: Optional[float] = None):
+        """
+        停止采集线程和监听器。正在进行中的一次采集会完成后退出。
+        wait_for_ocr=False 时已提交的OCR任务在后台继续回填，调用方立即返回（后台线程随进程退出而终止，进程退出前不要使用）；
+        True 时同步等待OCR回填并关闭写入线程（进程退出前使用）；ocr_timeout 秒内未回填完的记录转为延后任务，下次启动后补做。
+        """
+        with self._lock:
+            threads, self._threads = self._threads, []
+            listeners, self._listeners = self._listeners, []
+            self._stop_event.set()
+            self.scheduler.wake()
+            # 只有点击线程在运行时才发送结束标记，否则标记会留在队列里，下次启动的点击线程一取到就退出
+            if any(thread.name == "capture-click" and thread.is_alive() for thread in threads):
+                try:
+                    click_queue.put_nowait(None)
+                except queue.Full:
+                    pass  # 队列已满时点击线程取到下一个任务就会看到停止事件
+        for listener in listeners:
+            listener.stop()
+        deadline = time.monotonic() + timeout
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+            if thread.is_alive():
+                logging.warning(f"采集线程 {thread.name} 未在 {timeout}s 内退出。")
+        if wait_for_ocr:
+            shutdown_ocr_pipeline(wait=True, timeout=ocr_timeout)
+            shutdown_db_writer()
+        else:
+            shutdown_ocr_pipeline(wait=True, background=True)
+        logging.info("采集服务已停止。")
+
+    def run_forever(self):
+        """命令行使用：启动后阻塞当前线程，直到 Ctrl+C 或 stop()"""
+        self.start()
         try:
-            record_screen_activity(triggered_by="timer")
-            time.sleep(60) # 每60秒记录一次
+            while not self._stop_event.wait(SCHEDULER_WAIT_SLICE):
+                pass
         except KeyboardInterrupt:
             logging.info("接收到中断信号，正在停止...")
-            if mouse_listener:
-                mouse_listener.stop()
-            break
-        except Exception as e:
-            logging.error(f"主循环发生错误: {e}", exc_info=True)
-            time.sleep(60)
+        finally:
+            self.stop(wait_for_ocr=True)
+
+    def state(self) -> Dict[str, Any]:
+        """运行状态，用于诊断"""
+        pipeline = ocr_pipeline
+        return {
+            "running": self.is_running(),
+            "paused": self.is_paused(),
+            "scheduler": self.scheduler.state(),
+            "clicks": get_click_metrics(),
+            "ocr": pipeline.state() if pipeline is not None else None,
+        }
+
+def main():
+    CaptureService().run_forever()
 
 if __name__ == '__main__':
     main()
@@ -14,7 +14,7 @@ def setup_environment():
     # 启用嵌入功能
     os.environ['LOAD_EMBEDDINGS'] = 'true'
     
-    # 数据库已清空，不需要强制重新索引
+    # 平时只增量索引新记录；需要全量重建向量索引（清空集合、游标归零）时取消注释：
     # os.environ['FORCE_REINDEX'] = 'true'
     
     # 如果想跳过索引快速启动，可以设置：